@@ -53,6 +53,8 @@ services:
       - SPARK_MASTER_URL=spark://10.0.0.2:7077
       - SPARK_WORKER_CORES=2
       - SPARK_WORKER_MEMORY=2G
+      - TRANSFORMERS_CACHE=/opt/bitnami/spark/cache
+      - HF_HOME=/opt/bitnami/spark/cache
     deploy:
       resources:
         limits:
@@ -61,6 +63,7 @@ services:
     volumes:
       - /opt/spark/jobs:/opt/bitnami/spark/jobs
       - /opt/spark/data:/opt/bitnami/spark/data
+      - /opt/spark/cache:/opt/bitnami/spark/cache
       - /opt/spark/jars/gcs-connector-hadoop3-2.2.11.jar:/opt/bitnami/spark/jars/gcs-connector-hadoop3-2.2.11.jar
     logging:
       driver: "json-file"
@@ -74,7 +77,7 @@ services:
       retries: 3
     command: >
       bash -c "
-        pip install transformers torch google-cloud-bigquery google-cloud-storage pandas pyarrow &&
+        pip install transformers torch onnx onnxruntime google-cloud-bigquery google-cloud-storage pandas pyarrow &&
         /opt/bitnami/spark/bin/spark-class org.apache.spark.deploy.worker.Worker spark://10.0.0.2:7077
       "
 
@@ -84,9 +87,9 @@ networks:
 EOL
 
 # Create directories for jobs and data
-sudo mkdir -p /opt/spark/jobs /opt/spark/data /opt/spark/jars
-sudo chown -R $USER:$USER /opt/spark/jobs /opt/spark/data /opt/spark/jars
-sudo chmod -R 777 /opt/spark/jobs /opt/spark/data /opt/spark/jars
+sudo mkdir -p /opt/spark/jobs /opt/spark/data /opt/spark/cache /opt/spark/jars
+sudo chown -R $USER:$USER /opt/spark/jobs /opt/spark/data /opt/spark/cache /opt/spark/jars
+sudo chmod -R 777 /opt/spark/jobs /opt/spark/data /opt/spark/cache /opt/spark/jars
 
 wget https://storage.googleapis.com/hadoop-lib/gcs/gcs-connector-hadoop3-2.2.11.jar
 mv gcs-connector-hadoop3-2.2.11.jar /opt/spark/jars/gcs-connector-hadoop3-2.2.11.jar
@@ -59,7 +59,7 @@ services:
       - /opt/spark/jars/gcs-connector-hadoop3-2.2.11.jar:/opt/bitnami/spark/jars/gcs-connector-hadoop3-2.2.11.jar
     command: >
       bash -c "
-        pip install transformers torch google-cloud-bigquery google-cloud-storage pandas pyarrow &&
+        pip install transformers torch onnx onnxruntime google-cloud-bigquery google-cloud-storage pandas pyarrow &&
         /opt/bitnami/spark/bin/spark-class org.apache.spark.deploy.master.Master
       "
 EOL
@@ -54,6 +54,16 @@ resource "google_bigquery_table" "posts" {
     "type": "TIMESTAMP",
     "mode": "NULLABLE"
   },
+  {
+    "name": "query_id",
+    "type": "STRING",
+    "mode": "NULLABLE"
+  },
+  {
+    "name": "batch_id",
+    "type": "INTEGER",
+    "mode": "NULLABLE"
+  },
   {
     "name": "processing_time",
     "type": "TIMESTAMP",
@@ -100,6 +110,16 @@ resource "google_bigquery_table" "comments" {
     "type": "TIMESTAMP",
     "mode": "NULLABLE"
   },
+  {
+    "name": "query_id",
+    "type": "STRING",
+    "mode": "NULLABLE"
+  },
+  {
+    "name": "batch_id",
+    "type": "INTEGER",
+    "mode": "NULLABLE"
+  },
   {
     "name": "processing_time",
     "type": "TIMESTAMP",
@@ -109,7 +129,165 @@ resource "google_bigquery_table" "comments" {
     "name": "sentiment",
     "type": "STRING",
     "mode": "NULLABLE"
+  },
+  {
+    "name": "sentiment_score",
+    "type": "FLOAT",
+    "mode": "NULLABLE"
+  }
+]
+EOF
+}
+
+resource "google_bigquery_table" "post_updates" {
+  dataset_id = google_bigquery_dataset.dataset.dataset_id
+  table_id   = "post_updates"
+  deletion_protection=false
+  schema = <<EOF
+[
+  {
+    "name": "id",
+    "type": "STRING",
+    "mode": "REQUIRED"
+  },
+  {
+    "name": "subreddit",
+    "type": "STRING",
+    "mode": "NULLABLE"
+  },
+  {
+    "name": "score",
+    "type": "INTEGER",
+    "mode": "NULLABLE"
+  },
+  {
+    "name": "num_comments",
+    "type": "INTEGER",
+    "mode": "NULLABLE"
+  },
+  {
+    "name": "query_id",
+    "type": "STRING",
+    "mode": "NULLABLE"
+  },
+  {
+    "name": "batch_id",
+    "type": "INTEGER",
+    "mode": "NULLABLE"
+  },
+  {
+    "name": "processing_time",
+    "type": "TIMESTAMP",
+    "mode": "NULLABLE"
+  }
+]
+EOF
+}
+
+# Agrégats de sentiment par fenêtre, écrits une seule fois, quand la fenêtre est close
+resource "google_bigquery_table" "comment_sentiment_windows" {
+  dataset_id = google_bigquery_dataset.dataset.dataset_id
+  table_id   = "comment_sentiment_windows"
+  deletion_protection=false
+
+  time_partitioning {
+    type  = "DAY"
+    field = "window_start"
+  }
+  clustering = ["subreddit", "post_id"]
+
+  schema = <<EOF
+[
+  {
+    "name": "window_start",
+    "type": "TIMESTAMP",
+    "mode": "REQUIRED"
+  },
+  {
+    "name": "window_end",
+    "type": "TIMESTAMP",
+    "mode": "REQUIRED"
+  },
+  {
+    "name": "window_duration",
+    "type": "STRING",
+    "mode": "REQUIRED"
+  },
+  {
+    "name": "window_slide",
+    "type": "STRING",
+    "mode": "REQUIRED"
+  },
+  {
+    "name": "subreddit",
+    "type": "STRING",
+    "mode": "NULLABLE"
+  },
+  {
+    "name": "post_id",
+    "type": "STRING",
+    "mode": "NULLABLE"
+  },
+  {
+    "name": "sentiment",
+    "type": "STRING",
+    "mode": "NULLABLE"
+  },
+  {
+    "name": "comment_count",
+    "type": "INTEGER",
+    "mode": "NULLABLE"
+  },
+  {
+    "name": "scored_count",
+    "type": "INTEGER",
+    "mode": "NULLABLE"
+  },
+  {
+    "name": "confidence_sum",
+    "type": "FLOAT",
+    "mode": "NULLABLE"
+  },
+  {
+    "name": "query_id",
+    "type": "STRING",
+    "mode": "NULLABLE"
+  },
+  {
+    "name": "batch_id",
+    "type": "INTEGER",
+    "mode": "NULLABLE"
+  },
+  {
+    "name": "processing_time",
+    "type": "TIMESTAMP",
+    "mode": "NULLABLE"
   }
 ]
 EOF
-}
\ No newline at end of file
+}
+
+# Totaux par fenêtre, à interroger par les tableaux de bord. Un commentaire
+# n'y compte qu'une fois, avec son premier libellé.
+resource "google_bigquery_table" "comment_sentiment_trends" {
+  dataset_id = google_bigquery_dataset.dataset.dataset_id
+  table_id   = "comment_sentiment_trends"
+  deletion_protection=false
+
+  view {
+    use_legacy_sql = false
+    query          = <<EOF
+SELECT
+  window_start,
+  window_end,
+  window_duration,
+  window_slide,
+  subreddit,
+  post_id,
+  sentiment,
+  comment_count,
+  SAFE_DIVIDE(confidence_sum, scored_count) AS mean_confidence
+FROM `${google_bigquery_table.comment_sentiment_windows.project}.${google_bigquery_dataset.dataset.dataset_id}.${google_bigquery_table.comment_sentiment_windows.table_id}`
+EOF
+  }
+}
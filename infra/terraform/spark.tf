@@ -106,9 +106,10 @@ resource "google_compute_instance" "spark_worker1" {
 resource "null_resource" "processing" {
   depends_on = [google_compute_instance.spark_master_vm]
 
+  # The job and the modules it imports or ships to the executors
   provisioner "file" {
-    source      = "../../src/processing/spark.py"
-    destination = "/home/${var.ssh_user}/spark.py" 
+    source      = "../../src/processing"
+    destination = "/home/${var.ssh_user}"
 
     connection {
       type        = "ssh"
@@ -120,7 +121,8 @@ resource "null_resource" "processing" {
 
   provisioner "remote-exec" {
     inline = [
-      "sudo mv ~/spark.py /opt/spark/jobs/"
+      "sudo mv ~/processing/*.py /opt/spark/jobs/",
+      "rm -rf ~/processing"
     ]
 
     connection {
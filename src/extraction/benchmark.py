@@ -0,0 +1,160 @@
+"""
+Extraction benchmark script
+
+Runs the extraction offline, against responses recorded with
+`REDDIT_REPLAY_MODE=record` and a local storage sink, then reports its
+throughput. Example:
+
+    python benchmark.py --fixtures fixtures --subreddits python learnpython --json
+"""
+
+import argparse
+import functools
+import json
+import tempfile
+import time
+from typing import List, Optional
+
+import praw
+from main import (
+    ExtractionContext,
+    build_writer,
+    get_subject,
+    run_extraction,
+)
+from metrics import METRICS
+from rate_limiter import RedditRateLimiter
+from replay import REPLAY_CREDENTIAL, ReplayRequestor
+from sharding import ClientPool, RedditClient, RedditSessions
+from sinks import LocalSink
+from uploader import BucketUploader
+
+
+def build_replay_clients(
+    fixtures_dir: str, num_clients: int, max_requests_per_minute: int
+) -> ClientPool:
+    """
+    Builds Reddit clients answering from recorded fixtures.
+
+    Args:
+        fixtures_dir (str): Directory holding the recorded responses.
+        num_clients (int): Number of Reddit apps to simulate.
+        max_requests_per_minute (int): Rate limit of each simulated app.
+
+    Returns:
+        ClientPool: The pool subreddits are sharded across.
+    """
+    clients = []
+    for index in range(num_clients):
+        sessions = RedditSessions(
+            functools.partial(
+                praw.Reddit,
+                client_id=REPLAY_CREDENTIAL,
+                client_secret=REPLAY_CREDENTIAL,
+                username=REPLAY_CREDENTIAL,
+                password=REPLAY_CREDENTIAL,
+                user_agent="reddit-feelings-pipeline benchmark",
+                check_for_updates=False,
+                requestor_class=ReplayRequestor,
+                requestor_kwargs={"fixtures_dir": fixtures_dir},
+            )
+        )
+        rate_limiter = RedditRateLimiter(
+            max_requests_per_minute, limits=sessions.limits
+        )
+        clients.append(RedditClient(f"app-{index}", sessions, rate_limiter))
+    return ClientPool(clients)
+
+
+def run_benchmark(  # pylint: disable=too-many-arguments
+    subreddits: List[str],
+    fixtures_dir: str,
+    *,
+    concurrency: int = 1,
+    num_clients: int = 1,
+    max_requests_per_minute: int = 100,
+    output_dir: Optional[str] = None,
+) -> dict:
+    """
+    Extracts the given subreddits from fixtures and measures the run.
+
+    The output format follows `OUTPUT_FORMAT` like a regular run.
+
+    Args:
+        subreddits (List[str]): The subreddits to extract.
+        fixtures_dir (str): Directory holding the recorded responses.
+        concurrency (int): Maximum number of subreddits and of posts in flight.
+        num_clients (int): Number of Reddit apps to simulate.
+        max_requests_per_minute (int): Rate limit of each simulated app.
+        output_dir (Optional[str]): Where objects are written, a temporary
+            directory by default.
+
+    Returns:
+        dict: posts/s, comments/s, bytes written, rate-limit sleep time and
+        the time spent in each stage.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        sink = LocalSink(output_dir or temp_dir)
+        uploader = BucketUploader(sink, num_workers=4)
+        clients = build_replay_clients(
+            fixtures_dir, num_clients, max_requests_per_minute
+        )
+        context = ExtractionContext(uploader, build_writer(uploader), clients)
+
+        start = time.perf_counter()
+        try:
+            run_extraction(subreddits, context, concurrency)
+        finally:
+            context.close()
+        elapsed = time.perf_counter() - start
+
+    return {
+        "subreddits": len(subreddits),
+        "posts": context.posts_written,
+        "comments": context.comments_written,
+        "elapsed_seconds": round(elapsed, 3),
+        "posts_per_second": round(context.posts_written / elapsed, 2),
+        "comments_per_second": round(context.comments_written / elapsed, 2),
+        "bytes_written": sink.bytes_written,
+        "rate_limit_wait_seconds": round(
+            sum(client.rate_limiter.total_wait for client in clients.clients.values()),
+            3,
+        ),
+        "failed_uploads": uploader.failed,
+        "stages": METRICS.summary()["stages"],
+    }
+
+
+def main() -> None:
+    """
+    Parses the command line, runs the benchmark and prints its report.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--fixtures", default="fixtures", help="Recorded responses")
+    parser.add_argument(
+        "--subreddits", nargs="*", help="Subreddits to extract (default: output.json)"
+    )
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--clients", type=int, default=1)
+    parser.add_argument("--rate-limit-per-minute", type=int, default=100)
+    parser.add_argument("--output-dir", help="Keep the written objects there")
+    parser.add_argument("--json", action="store_true", help="Print a JSON report")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        args.subreddits or get_subject(),
+        args.fixtures,
+        concurrency=args.concurrency,
+        num_clients=args.clients,
+        max_requests_per_minute=args.rate_limit_per_minute,
+        output_dir=args.output_dir,
+    )
+    if args.json:
+        print(json.dumps(report))
+    else:
+        for key, value in report.items():
+            print(f"{key:>24}: {value}")
+
+
+if __name__ == "__main__":
+    main()
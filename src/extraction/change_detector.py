@@ -0,0 +1,148 @@
+"""
+ChangeDetector file
+"""
+
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, List, Optional
+
+from google.cloud import storage
+from state import JSONStateFile, drop_expired
+
+POST_FIELDS = ("title", "url", "author", "created_utc", "selftext", "subreddit")
+COMMENT_FIELDS = ("id", "author", "body", "created_utc", "parent_id", "is_submitter")
+
+
+def content_hash(post_data: dict) -> str:
+    """
+    Hashes the stable content of a post and its comments.
+
+    Scores and comment counts are left out, and comments are sorted by id
+    because the default sort order moves with the votes.
+
+    Args:
+        post_data (dict): The post data built by the extractor.
+
+    Returns:
+        str: The hex digest of the content.
+    """
+    content = {
+        "post": [post_data.get(field) for field in POST_FIELDS],
+        "comments": sorted(
+            [comment.get(field) for field in COMMENT_FIELDS]
+            for comment in post_data["comments"]
+        ),
+    }
+    canonical = json.dumps(content, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def build_delta(post_id: str, subreddit: str, score: int, num_comments: int) -> dict:
+    """
+    Builds the record written in place of a post whose content did not change.
+
+    Args:
+        post_id (str): The post id.
+        subreddit (str): The subreddit name.
+        score (int): The current score of the post.
+        num_comments (int): The current comment count of the post.
+
+    Returns:
+        dict: The delta record.
+    """
+    return {
+        "id": post_id,
+        "record_type": "delta",
+        "subreddit": subreddit,
+        "score": score,
+        "num_comments": num_comments,
+    }
+
+
+class ChangeDetector:
+    """
+    A class remembering the last version written of each post.
+
+    Each post id maps to `[content_hash, score, num_comments, last_seen]`.
+    A post seen again is written in full only when its content changed; when
+    only its score or comment count moved a small delta record is written
+    instead, and nothing at all when it is unchanged.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        client: Optional[storage.Client] = None,
+        max_age_seconds: float = 7 * 86400,
+    ):
+        """
+        Initializes the detector and loads the stored versions.
+
+        Args:
+            path (str): Local file path, or `gs://<bucket>/<object>` for the bucket.
+            client (Optional[storage.Client]): Storage client used for `gs://` paths.
+            max_age_seconds (float): Age after which a post is forgotten.
+        """
+        self.state = JSONStateFile(path, client)
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List] = self.state.load()
+
+    def diff(self, post_data: dict) -> Optional[dict]:
+        """
+        Compares a freshly built post with its last written version.
+
+        Args:
+            post_data (dict): The post data built by the extractor.
+
+        Returns:
+            Optional[dict]: The full post data if it is new or its content
+            changed, a delta record if only its score or comment count moved,
+            or None if nothing changed.
+        """
+        digest = content_hash(post_data)
+        score, num_comments = post_data["score"], post_data["num_comments"]
+        with self._lock:
+            entry = self._entries.get(post_data["id"])
+            self._entries[post_data["id"]] = [digest, score, num_comments, time.time()]
+        if entry is None or entry[0] != digest:
+            return post_data
+        if entry[1:3] == [score, num_comments]:
+            return None
+        return build_delta(post_data["id"], post_data["subreddit"], score, num_comments)
+
+    def diff_counts(
+        self, post_id: str, subreddit: str, score: int, num_comments: int
+    ) -> Optional[dict]:
+        """
+        Compares the counts of a post that was not fetched again, as reported
+        by the listing, with its last written version.
+
+        Args:
+            post_id (str): The post id.
+            subreddit (str): The subreddit name.
+            score (int): The score reported by the listing.
+            num_comments (int): The comment count reported by the listing.
+
+        Returns:
+            Optional[dict]: A delta record if the counts moved, None otherwise
+            or when the post was never written.
+        """
+        with self._lock:
+            entry = self._entries.get(post_id)
+            if entry is None or entry[1:3] == [score, num_comments]:
+                return None
+            self._entries[post_id] = [entry[0], score, num_comments, time.time()]
+        return build_delta(post_id, subreddit, score, num_comments)
+
+    def save(self) -> None:
+        """
+        Drops expired entries and writes the versions to the local file or the bucket.
+        """
+        with self._lock:
+            self._entries = drop_expired(self._entries, 3, self.max_age_seconds)
+            entries = dict(self._entries)
+        self.state.save(entries)
+        print(f"Content hashes saved to '{self.state.path}'.")
@@ -0,0 +1,70 @@
+"""
+CheckpointStore file
+"""
+
+import threading
+from typing import Dict, Optional
+
+from google.cloud import storage
+from state import JSONStateFile
+
+
+class CheckpointStore:
+    """
+    A class persisting the newest post ingested for each subreddit.
+
+    Each subreddit maps to a high-watermark `{"created_utc": ..., "fullname": ...}`.
+    The store is kept either in a local JSON file or, when the path starts with
+    `gs://`, in a JSON object of that bucket.
+    """
+
+    def __init__(self, path: str, client: Optional[storage.Client] = None):
+        """
+        Initializes the store and loads the existing checkpoints.
+
+        Args:
+            path (str): Local file path, or `gs://<bucket>/<object>` for the bucket.
+            client (Optional[storage.Client]): Storage client used for `gs://` paths.
+        """
+        self.state = JSONStateFile(path, client)
+        self._lock = threading.Lock()
+        self._watermarks: Dict[str, dict] = self.state.load()
+
+    def get(self, subreddit: str) -> Optional[dict]:
+        """
+        Returns the high-watermark of a subreddit.
+
+        Args:
+            subreddit (str): The subreddit name.
+
+        Returns:
+            Optional[dict]: The newest ingested post, or None for a new subreddit.
+        """
+        with self._lock:
+            return self._watermarks.get(subreddit)
+
+    def update(self, subreddit: str, created_utc: float, fullname: str) -> None:
+        """
+        Moves the high-watermark of a subreddit forward.
+
+        Args:
+            subreddit (str): The subreddit name.
+            created_utc (float): Creation time of the newest ingested post.
+            fullname (str): Fullname (`t3_...`) of the newest ingested post.
+        """
+        with self._lock:
+            current = self._watermarks.get(subreddit)
+            if current is None or created_utc >= current["created_utc"]:
+                self._watermarks[subreddit] = {
+                    "created_utc": created_utc,
+                    "fullname": fullname,
+                }
+
+    def save(self) -> None:
+        """
+        Writes the checkpoints to the local file or the bucket.
+        """
+        with self._lock:
+            watermarks = dict(self._watermarks)
+        self.state.save(watermarks)
+        print(f"Checkpoints saved to '{self.state.path}'.")
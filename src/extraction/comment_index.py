@@ -0,0 +1,75 @@
+"""
+CommentIndex file
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional
+
+from google.cloud import storage
+from state import JSONStateFile, drop_expired
+
+
+class CommentIndex:
+    """
+    A class remembering how many comments each post had when it was last fetched.
+
+    Each post id maps to `[num_comments, last_fetched]`. Entries that were not
+    refreshed for `max_age_seconds` are dropped when the index is saved, which
+    keeps it limited to the posts still showing up in the listings.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        client: Optional[storage.Client] = None,
+        max_age_seconds: float = 7 * 86400,
+    ):
+        """
+        Initializes the index and loads the existing entries.
+
+        Args:
+            path (str): Local file path, or `gs://<bucket>/<object>` for the bucket.
+            client (Optional[storage.Client]): Storage client used for `gs://` paths.
+            max_age_seconds (float): Age after which an entry is forgotten.
+        """
+        self.state = JSONStateFile(path, client)
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[float]] = self.state.load()
+
+    def has_changed(self, post_id: str, num_comments: int) -> bool:
+        """
+        Tells whether a post's comment count differs from the last fetch.
+
+        Args:
+            post_id (str): The post id.
+            num_comments (int): The comment count reported by the listing.
+
+        Returns:
+            bool: True if the post was never fetched or its comment count moved.
+        """
+        with self._lock:
+            entry = self._entries.get(post_id)
+        return entry is None or entry[0] != num_comments
+
+    def record(self, post_id: str, num_comments: int) -> None:
+        """
+        Records that a post's comments were just fetched.
+
+        Args:
+            post_id (str): The post id.
+            num_comments (int): The comment count the fetch was based on.
+        """
+        with self._lock:
+            self._entries[post_id] = [num_comments, time.time()]
+
+    def save(self) -> None:
+        """
+        Drops expired entries and writes the index to the local file or the bucket.
+        """
+        with self._lock:
+            self._entries = drop_expired(self._entries, 1, self.max_age_seconds)
+            entries = dict(self._entries)
+        self.state.save(entries)
+        print(f"Comment index saved to '{self.state.path}'.")
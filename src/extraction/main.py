@@ -2,15 +2,38 @@
 Main script for fetching Reddit posts and saving them as JSON files to a GCS bucket.
 """
 
+import functools
 import json
 import os
+import threading
 import time
-from typing import List
-from google.cloud import storage
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from typing import Callable, Dict, List, Optional, Set, Union
 import praw
+import prawcore
 from praw.exceptions import APIException, ClientException, PRAWException
 from requests.exceptions import RequestException
-from rate_limiter import RedditRateLimiter
+from change_detector import ChangeDetector
+from checkpoint import CheckpointStore
+from comment_index import CommentIndex
+from metrics import METRICS
+from pipeline import BoundedExecutor
+from rate_limiter import FileTokenBucket, RedditRateLimiter
+from replay import get_requestor_options
+from scheduler import PollScheduler
+from seen_index import SeenIndex
+from sharding import ClientPool, RedditClient, RedditSessions
+from sinks import GCSSink, LocalSink, StorageSink
+from uploader import BucketUploader
+from writer import RollingNDJSONWriter
+
+PostWriter = Union[BucketUploader, RollingNDJSONWriter]
 
 
 def get_subject() -> List[str]:
@@ -38,12 +61,18 @@ def get_subject() -> List[str]:
         raise
 
 
-def get_credentials() -> praw.Reddit:
+def get_credentials() -> List[Callable[[], praw.Reddit]]:
     """
-    Reads Reddit API credentials from a JSON file and initializes a `praw.Reddit` instance.
+    Reads Reddit API credentials from a JSON file and prepares `praw.Reddit` instances.
+
+    The file holds either a single credential set or a list of them, one per
+    registered Reddit app. `REDDIT_REPLAY_MODE` makes the clients record their
+    responses or replay recorded ones (see `replay.py`). PRAW is not
+    thread-safe, so every worker thread builds its own client of each app.
 
     Returns:
-        praw.Reddit: An authenticated Reddit client.
+        List[Callable[[], praw.Reddit]]: One factory of authenticated Reddit
+        clients per credential set.
 
     Raises:
         FileNotFoundError: If the credentials file is not found.
@@ -56,13 +85,21 @@ def get_credentials() -> praw.Reddit:
         with open(creds_path, "r", encoding="utf-8") as file:
             credentials = json.load(file)
 
-        return praw.Reddit(
-            client_id=credentials["client_id"],
-            client_secret=credentials["client_secret"],
-            username=credentials["username"],
-            password=credentials["password"],
-            user_agent=credentials["user_agent"],
-        )
+        if isinstance(credentials, dict):
+            credentials = [credentials]
+        requestor_options = get_requestor_options()
+        return [
+            functools.partial(
+                praw.Reddit,
+                client_id=credential_set["client_id"],
+                client_secret=credential_set["client_secret"],
+                username=credential_set["username"],
+                password=credential_set["password"],
+                user_agent=credential_set["user_agent"],
+                **requestor_options,
+            )
+            for credential_set in credentials
+        ]
     except (FileNotFoundError, KeyError, json.JSONDecodeError) as error:
         print(f"Error reading credentials file '{creds_path}': {error}")
         raise
@@ -71,114 +108,779 @@ def get_credentials() -> praw.Reddit:
         raise
 
 
-def save_post_to_bucket(bucket_name: str, post_data: dict) -> None:
+def fetch_comments(
+    post: praw.models.Submission,
+    rate_limiter: RedditRateLimiter,
+    expansion_limit: Optional[int] = None,
+    reddit: Optional[praw.Reddit] = None,
+) -> List[dict]:
     """
-    Uploads a post's data as a JSON file to a Google Cloud Storage bucket.
+    Fetches all comments for a given Reddit post, respecting API rate limits.
 
     Args:
-        bucket_name (str): The target GCS bucket name.
-        post_data (dict): The post data to be saved.
+        post (praw.models.Submission): The Reddit post object.
+        rate_limiter (RedditRateLimiter): The rate limiter instance.
+        expansion_limit (Optional[int]): Maximum number of "load more comments"
+            requests issued for the post, None to expand the whole thread.
+        reddit (Optional[praw.Reddit]): When given, the comments are expanded on
+            a detached copy of the post fetched with this client, so that the
+            comment tree is freed once flattened instead of staying attached to
+            the listing page the post came from.
 
-    Raises:
-        Exception: If the upload fails.
+    Returns:
+        List[dict]: A list of dictionaries containing comment details.
     """
+    comments = []
+    thread = reddit.submission(id=post.id) if reddit is not None else post
     try:
-        client = storage.Client()
-        bucket = client.bucket(bucket_name)
-        file_name = f"{post_data['id']}.json"
-        json_data = json.dumps(post_data, ensure_ascii=False, indent=4)
-
-        blob = bucket.blob(file_name)
-        blob.upload_from_string(json_data, content_type="application/json")
+        rate_limiter.acquire()
+        with METRICS.time_stage("comment_fetch"):
+            forest = thread.comments  # Lazily fetches the first page of comments
+        with METRICS.time_stage("replace_more"):
+            forest.replace_more(limit=expansion_limit)  # Load all comments
 
-        print(
-            f"Post {post_data['id']} saved to bucket '{bucket_name}' as '{file_name}'."
-        )
-    except Exception as error:
-        print(f"Error saving post {post_data['id']} to bucket: {error}")
-        raise
+        with METRICS.time_stage("comment_flatten"):
+            for comment in forest.list():
+                comments.append(
+                    {
+                        "id": comment.id,
+                        "author": (
+                            str(comment.author) if comment.author else "[deleted]"
+                        ),
+                        "body": comment.body,
+                        "score": comment.score,
+                        "created_utc": comment.created_utc,
+                        "parent_id": comment.parent_id,
+                        "is_submitter": comment.is_submitter,
+                    }
+                )
+    except (APIException, ClientException, RequestException) as error:
+        print(f"Error fetching comments for post {post.id}: {error}")
+        METRICS.increment("errors", str(post.subreddit))
+    return comments
 
 
-def fetch_comments(
-    post: praw.models.Submission, rate_limiter: RedditRateLimiter
-) -> List[dict]:
+def build_post_data(
+    post: praw.models.Submission,
+    rate_limiter: RedditRateLimiter,
+    expansion_limit: Optional[int] = None,
+    reddit: Optional[praw.Reddit] = None,
+) -> dict:
     """
-    Fetches all comments for a given Reddit post, respecting API rate limits.
+    Builds the dictionary stored in the bucket for a single Reddit post.
 
     Args:
         post (praw.models.Submission): The Reddit post object.
         rate_limiter (RedditRateLimiter): The rate limiter instance.
+        expansion_limit (Optional[int]): Request budget for expanding comments.
+        reddit (Optional[praw.Reddit]): Client used to expand the comments on a
+            detached copy of the post (see `fetch_comments`).
 
     Returns:
-        List[dict]: A list of dictionaries containing comment details.
+        dict: The post details along with all of its comments.
     """
-    comments = []
+    comments = fetch_comments(post, rate_limiter, expansion_limit, reddit)
+    return {
+        "title": post.title,
+        "id": post.id,
+        "url": post.url,
+        "score": post.score,
+        "author": str(post.author),
+        "created_utc": post.created_utc,
+        "num_comments": post.num_comments,
+        "selftext": post.selftext,
+        "subreddit": str(post.subreddit),
+        "comments": comments,
+    }
+
+
+class ExtractionContext:  # pylint: disable=too-many-instance-attributes
+    """
+    A class bundling the shared state every extraction worker needs.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        uploader: BucketUploader,
+        writer: PostWriter,
+        clients: ClientPool,
+        *,
+        checkpoints: Optional[CheckpointStore] = None,
+        comment_index: Optional[CommentIndex] = None,
+        seen_index: Optional[SeenIndex] = None,
+        change_detector: Optional[ChangeDetector] = None,
+        expansion_limit: Optional[int] = None,
+    ):
+        """
+        Initializes the context.
+
+        Args:
+            uploader (BucketUploader): The uploader shared by all writers.
+            writer (PostWriter): The writer the post documents are handed to.
+            clients (ClientPool): The Reddit clients subreddits are sharded across.
+            checkpoints (Optional[CheckpointStore]): Per-subreddit high-watermarks.
+            comment_index (Optional[CommentIndex]): Comment counts of fetched posts,
+                enables the comment refresh mode.
+            seen_index (Optional[SeenIndex]): Ids of the posts already uploaded.
+            change_detector (Optional[ChangeDetector]): Last written version of
+                each post, turns unchanged posts into delta records.
+            expansion_limit (Optional[int]): Request budget for expanding comments.
+        """
+        self.uploader = uploader
+        self.writer = writer
+        self.clients = clients
+        self.checkpoints = checkpoints
+        self.comment_index = comment_index
+        self.seen_index = seen_index
+        self.change_detector = change_detector
+        self.expansion_limit = expansion_limit
+        self.posts_written = 0
+        self.comments_written = 0
+        self._lock = threading.Lock()
+
+    def count_post(self, post_data: dict) -> None:
+        """
+        Counts a post and its comments as written.
+
+        Args:
+            post_data (dict): The post data handed to the writer.
+        """
+        with self._lock:
+            self.posts_written += 1
+            self.comments_written += len(post_data["comments"])
+
+    def flush(self) -> None:
+        """
+        Uploads every post written so far, then saves the state files unless
+        an upload failed. Used by the daemon mode between polls.
+        """
+        if isinstance(self.writer, RollingNDJSONWriter):
+            self.writer.close()
+        self.uploader.flush()
+        self._save_state()
+
+    def close(self) -> None:
+        """
+        Flushes pending writes and uploads, then saves the checkpoints, the
+        comment index, the seen-ID index and the content hashes unless an
+        upload failed.
+        """
+        if isinstance(self.writer, RollingNDJSONWriter):
+            self.writer.close()
+        print("Flushing pending uploads...")
+        self.uploader.close()
+        self._save_state()
+        if self.seen_index is not None:
+            self.seen_index.close()
+
+    def _save_state(self) -> None:
+        if self.uploader.failed:
+            print(f"{self.uploader.failed} uploads failed, state files not saved.")
+        else:
+            if self.checkpoints is not None:
+                self.checkpoints.save()
+            if self.comment_index is not None:
+                self.comment_index.save()
+            if self.seen_index is not None:
+                self.seen_index.save()
+            if self.change_detector is not None:
+                self.change_detector.save()
+
+
+def process_post(
+    post: praw.models.Submission,
+    client: RedditClient,
+    context: ExtractionContext,
+) -> None:
+    """
+    Fetches the comments of a post and uploads the resulting document.
+
+    Posts already uploaded by an earlier run are skipped before their comments
+    are fetched. In comment refresh mode, posts are revisited instead, and
+    those whose comment count did not change since they were last fetched are
+    skipped. With a change detector, a post seen again is only written in
+    full if its content changed, as a delta record if only its score or
+    comment count moved, and not at all otherwise; skipped posts are still
+    compared by the counts of the listing, see `write_count_delta`. Written
+    posts enter the seen-ID index once the uploader has stored them (see
+    `main`).
+
+    Args:
+        post (praw.models.Submission): The Reddit post object.
+        client (RedditClient): The client the post was listed with.
+        context (ExtractionContext): The shared extraction state.
+    """
+    if not post.id:  # Ensure the post is valid
+        return
+    subreddit = str(post.subreddit)
+    comment_index = context.comment_index
+    seen_index = context.seen_index
+    change_detector = context.change_detector
+    if comment_index and not comment_index.has_changed(post.id, post.num_comments):
+        METRICS.increment("skipped", subreddit)
+        write_count_delta(post, context)
+        return
+    if not comment_index and seen_index is not None and post.id in seen_index:
+        METRICS.increment("duplicates", subreddit)
+        write_count_delta(post, context)
+        return
+
+    post_data = build_post_data(
+        post, client.rate_limiter, context.expansion_limit, client.reddit
+    )
+    record = change_detector.diff(post_data) if change_detector else post_data
+    if record is post_data:
+        context.writer.write(post_data)
+        context.count_post(post_data)
+        METRICS.increment("posts", subreddit)
+        METRICS.increment("comments", subreddit, len(post_data["comments"]))
+    elif record is None:
+        METRICS.increment("unchanged", subreddit)
+        if seen_index is not None:
+            seen_index.add(post.id)  # Its last version is already stored
+    else:
+        write_delta(record, context)
+    if comment_index:
+        comment_index.record(post.id, post.num_comments)
+
+
+def write_delta(delta: Optional[dict], context: ExtractionContext) -> None:
+    """
+    Hands a delta record, if any, to the writer.
+
+    Args:
+        delta (Optional[dict]): The delta record built by the change detector.
+        context (ExtractionContext): The shared extraction state.
+    """
+    if delta is not None:
+        context.writer.write(delta)
+        METRICS.increment("deltas", delta["subreddit"])
+
+
+def settle_posts(futures: Dict[Future, str], handled: Set[str]) -> None:
+    """
+    Cancels the posts not started yet, waits for the others and adds the ids
+    of those processed without error to `handled`.
+
+    Args:
+        futures (Dict[Future, str]): The post id of each `process_post` call.
+        handled (Set[str]): Ids of the posts already processed.
+    """
+    for future in futures:
+        future.cancel()
+    wait(futures)
+    handled.update(
+        post_id
+        for future, post_id in futures.items()
+        if not future.cancelled() and future.exception() is None
+    )
+
+
+def write_count_delta(post: praw.models.Submission, context: ExtractionContext) -> None:
+    """
+    Hands a delta record to the writer if the score or comment count the
+    listing reports for a post that is not fetched again moved since its last
+    written version. Does nothing without a change detector.
+
+    Args:
+        post (praw.models.Submission): The Reddit post object.
+        context (ExtractionContext): The shared extraction state.
+    """
+    if context.change_detector is not None:
+        write_delta(
+            context.change_detector.diff_counts(
+                post.id, str(post.subreddit), post.score, post.num_comments
+            ),
+            context,
+        )
+
+
+def process_subreddit(  # pylint: disable=too-many-locals
+    client: RedditClient,
+    subreddit: str,
+    context: ExtractionContext,
+    post_executor: Optional[BoundedExecutor] = None,
+    handled: Optional[Set[str]] = None,
+) -> List[float]:
+    """
+    Fetches the latest posts of a subreddit and saves each of them to the bucket.
+
+    Posts are handled one after the other when no executor is given, otherwise
+    they are handed to the comment fetch workers of `post_executor`, listing
+    pauses while their backlog is full, and every post is awaited before
+    returning. If listing or a post fails, the posts not started yet are
+    cancelled and the others awaited before the error is raised, see
+    `settle_posts`. With a checkpoint store, paging stops at the first post
+    that was already ingested and the high-watermark moves forward once every
+    new post has been handled. With a change detector, the rest of the listing
+    is walked instead and the counts of the ingested posts are compared, see
+    `write_count_delta`. In comment refresh mode the whole listing is walked
+    so that older threads with new comments are picked up again.
+
+    Args:
+        client (RedditClient): The Reddit client and its rate limiter.
+        subreddit (str): The subreddit name.
+        context (ExtractionContext): The shared extraction state.
+        post_executor (Optional[BoundedExecutor]): Pool used to process posts.
+        handled (Optional[Set[str]]): Ids of the posts processed by a previous
+            attempt, skipped and completed with those processed by this one.
+
+    Returns:
+        List[float]: Creation times of the posts listed, newest first.
+    """
+    print(f"Fetching posts from subreddit: {subreddit} with '{client.name}'...")
+    checkpoints = context.checkpoints
+    rate_limiter = client.rate_limiter
+    listed: List[float] = []
+    handled = set() if handled is None else handled
+    futures: Dict[Future, str] = {}
     try:
-        post.comments.replace_more(limit=None)  # Load all comments
-        rate_limiter.increment()
-
-        for comment in post.comments.list():
-            comments.append(
-                {
-                    "id": comment.id,
-                    "author": str(comment.author) if comment.author else "[deleted]",
-                    "body": comment.body,
-                    "score": comment.score,
-                    "created_utc": comment.created_utc,
-                    "parent_id": comment.parent_id,
-                    "is_submitter": comment.is_submitter,
-                }
+        # Fetch the latest 100 posts, timing each listing page request
+        posts = METRICS.timed_iter(
+            client.reddit.subreddit(subreddit).new(limit=100), "listing_fetch"
+        )
+        refresh = context.comment_index is not None
+        watermark = checkpoints.get(subreddit) if checkpoints and not refresh else None
+        newest = None  # (created_utc, fullname) of the newest post
+
+        for post in posts:
+            rate_limiter.acquire()
+            listed.append(post.created_utc)
+
+            if watermark and (
+                post.fullname == watermark["fullname"]
+                or post.created_utc < watermark["created_utc"]
+            ):
+                if context.change_detector is None:
+                    break  # Everything older was ingested by a previous run
+                write_count_delta(post, context)
+                continue
+            if newest is None:
+                newest = (post.created_utc, post.fullname)
+            if post.id in handled:
+                continue  # Processed before the previous client failed
+
+            if post_executor is None:
+                process_post(post, client, context)
+                handled.add(post.id)
+            else:
+                futures[post_executor.submit(process_post, post, client, context)] = (
+                    post.id
+                )
+
+        for future in futures:
+            future.result()
+
+        if checkpoints and newest is not None:
+            checkpoints.update(subreddit, *newest)
+    except (PRAWException, RequestException) as error:
+        print(f"Error processing subreddit '{subreddit}': {error}")
+        METRICS.increment("errors", subreddit)
+    finally:
+        settle_posts(futures, handled)
+    return listed
+
+
+def extract_subreddit(
+    subreddit: str,
+    context: ExtractionContext,
+    post_executor: Optional[BoundedExecutor] = None,
+) -> List[float]:
+    """
+    Processes a subreddit with the client it is sharded to.
+
+    When that client fails, it is taken out of rotation and the subreddit is
+    retried with the next client on the hash ring, once the posts of the
+    failed attempt are settled. The posts it processed are not fetched again.
+
+    Args:
+        subreddit (str): The subreddit name.
+        context (ExtractionContext): The shared extraction state.
+        post_executor (Optional[BoundedExecutor]): Pool used to process posts.
+
+    Returns:
+        List[float]: Creation times of the posts listed, empty if every
+        client failed.
+    """
+    handled: Set[str] = set()
+    for attempt in range(len(context.clients)):
+        client = context.clients.client_for(subreddit)
+        try:
+            return process_subreddit(client, subreddit, context, post_executor, handled)
+        except prawcore.exceptions.PrawcoreException as error:
+            print(f"Reddit error on '{subreddit}' with '{client.name}': {error}")
+            METRICS.increment("errors", subreddit)
+            context.clients.mark_failed(client)
+            if attempt == len(context.clients) - 1:
+                print(f"Giving up on subreddit '{subreddit}'.")
+    return []
+
+
+def get_env_int(name: str, default: int) -> int:
+    """
+    Reads a positive integer setting from the environment.
+
+    Args:
+        name (str): The environment variable name.
+        default (int): The value used when the variable is not set.
+
+    Returns:
+        int: The configured value.
+
+    Raises:
+        ValueError: If the variable is not a positive integer.
+    """
+    value = int(os.getenv(name, str(default)))
+    if value < 1:
+        raise ValueError(f"{name} must be a positive integer")
+    return value
+
+
+def build_sink(bucket_name: str) -> StorageSink:
+    """
+    Builds the storage sink, the bucket unless `LOCAL_SINK_DIR` is set.
+
+    Args:
+        bucket_name (str): The target GCS bucket name.
+
+    Returns:
+        StorageSink: Where the post documents are written.
+    """
+    local_dir = os.getenv("LOCAL_SINK_DIR")
+    if local_dir:
+        return LocalSink(local_dir)
+    return GCSSink(bucket_name)
+
+
+def build_writer(uploader: BucketUploader) -> PostWriter:
+    """
+    Builds the post writer selected by the `OUTPUT_FORMAT` environment variable.
+
+    "ndjson" (the default) packs posts into compressed newline-delimited JSON
+    batches, "json" writes each post as its own `{id}.json` object.
+
+    Args:
+        uploader (BucketUploader): The uploader the objects are queued on.
+
+    Returns:
+        PostWriter: The writer the post documents are handed to.
+
+    Raises:
+        ValueError: If the output format is unknown.
+    """
+    output_format = os.getenv("OUTPUT_FORMAT", "ndjson")
+    if output_format == "json":
+        return uploader
+    if output_format == "ndjson":
+        return RollingNDJSONWriter(
+            uploader,
+            compression=os.getenv("OUTPUT_COMPRESSION", "gzip"),
+            max_bytes=get_env_int("BATCH_MAX_BYTES", 16 * 1024 * 1024),
+            max_age_seconds=get_env_int("BATCH_MAX_AGE_SECONDS", 300),
+        )
+    raise ValueError(f"Unknown OUTPUT_FORMAT '{output_format}'")
+
+
+def build_rate_limiter(sessions: RedditSessions, index: int) -> RedditRateLimiter:
+    """
+    Builds the rate limiter of a Reddit client from the environment.
+
+    `RATE_LIMIT_PER_MINUTE` and `RATE_LIMIT_BURST` set the budget of each app.
+    When `RATE_LIMIT_SHARED_FILE` is set, the budget of app `index` is kept in
+    `<file>.<index>` and shared with every extractor process using that path.
+
+    Args:
+        sessions (RedditSessions): The clients whose rate-limit headers are followed.
+        index (int): Position of the client in the credentials file.
+
+    Returns:
+        RedditRateLimiter: The rate limiter.
+    """
+    shared_file = os.getenv("RATE_LIMIT_SHARED_FILE")
+    return RedditRateLimiter(
+        max_requests_per_minute=get_env_int("RATE_LIMIT_PER_MINUTE", 100),
+        burst=get_env_int("RATE_LIMIT_BURST", 5),
+        limits=sessions.limits,
+        bucket=FileTokenBucket(f"{shared_file}.{index}") if shared_file else None,
+    )
+
+
+def build_client_pool(factories: List[Callable[[], praw.Reddit]]) -> ClientPool:
+    """
+    Wraps each Reddit app with its own rate limiter in a sharded pool.
+
+    Args:
+        factories (List[Callable[[], praw.Reddit]]): Build the authenticated
+            clients of each app.
+
+    Returns:
+        ClientPool: The pool subreddits are sharded across.
+    """
+    clients = []
+    for index, factory in enumerate(factories):
+        sessions = RedditSessions(factory)
+        clients.append(
+            RedditClient(f"app-{index}", sessions, build_rate_limiter(sessions, index))
+        )
+    return ClientPool(clients)
+
+
+def get_expansion_limit() -> Optional[int]:
+    """
+    Reads the per-post comment expansion budget from the environment.
+
+    Returns:
+        Optional[int]: The value of `COMMENT_EXPANSION_LIMIT`, None (unbounded)
+        when the variable is not set.
+
+    Raises:
+        ValueError: If the variable is a negative integer.
+    """
+    value = os.getenv("COMMENT_EXPANSION_LIMIT")
+    if value is None or value == "":
+        return None
+    if int(value) < 0:
+        raise ValueError("COMMENT_EXPANSION_LIMIT must not be negative")
+    return int(value)
+
+
+def shutdown_executors(
+    subreddit_executor: ThreadPoolExecutor, post_executor: BoundedExecutor
+) -> None:
+    """
+    Stops the worker pools of a run, letting the posts in flight finish.
+
+    Queued subreddits and posts are cancelled, then the posts already being
+    processed are handed to the writer before returning, so that closing the
+    context afterwards uploads them instead of losing them.
+
+    Args:
+        subreddit_executor (ThreadPoolExecutor): The listing workers.
+        post_executor (BoundedExecutor): The comment fetch workers.
+    """
+    subreddit_executor.shutdown(wait=False, cancel_futures=True)
+    post_executor.shutdown(wait=True, cancel_futures=True)
+    subreddit_executor.shutdown(wait=True)
+
+
+def run_extraction(
+    all_subreddits: List[str],
+    context: ExtractionContext,
+    concurrency: int,
+    queue_size: Optional[int] = None,
+) -> None:
+    """
+    Processes every subreddit as a pipeline of stages connected by bounded queues.
+
+    Listing workers page through up to `concurrency` subreddits at once and
+    hand each post to `concurrency` comment fetch workers, which expand the
+    comments and pass the document on to the writer and the background
+    uploader. The stages overlap, and a stage that falls behind blocks the one
+    feeding it, so at most `queue_size` listed posts and `concurrency`
+    expanded threads are held in memory on top of the upload queue.
+
+    Args:
+        all_subreddits (List[str]): The subreddits to process.
+        context (ExtractionContext): The shared extraction state.
+        concurrency (int): Maximum number of subreddits and of posts in flight.
+        queue_size (Optional[int]): Maximum number of listed posts waiting for a
+            comment fetch worker, twice `concurrency` by default.
+    """
+    subreddit_executor = ThreadPoolExecutor(
+        max_workers=min(concurrency, len(all_subreddits) or 1),
+        thread_name_prefix="subreddit",
+    )
+    post_executor = BoundedExecutor(
+        max_workers=concurrency,
+        queue_size=queue_size if queue_size is not None else 2 * concurrency,
+        thread_name_prefix="post",
+    )
+    try:
+        futures = [
+            subreddit_executor.submit(
+                extract_subreddit, subreddit, context, post_executor
             )
-    except (APIException, ClientException, RequestException) as error:
-        print(f"Error fetching comments for post {post.id}: {error}")
-    return comments
+            for subreddit in all_subreddits
+        ]
+        for future in as_completed(futures):
+            future.result()
+    finally:
+        shutdown_executors(subreddit_executor, post_executor)
+
+
+def run_daemon(
+    scheduler: PollScheduler,
+    context: ExtractionContext,
+    concurrency: int,
+    save_interval: float = 300.0,
+) -> None:
+    """
+    Polls subreddits forever, each one when the scheduler says it is due.
+
+    Up to `concurrency` subreddits are polled at once through the same
+    pipeline as a regular run, then rescheduled from the activity their
+    listing showed. Every `save_interval` seconds, new polls are held back
+    until the running ones are done, then every written post is uploaded and
+    the state files are saved, so they never get ahead of the bucket.
+
+    Args:
+        scheduler (PollScheduler): The subreddits and their next poll times.
+        context (ExtractionContext): The shared extraction state.
+        concurrency (int): Maximum number of subreddits and of posts in flight.
+        save_interval (float): Seconds between two saves of the state files.
+    """
+    subreddit_executor = ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="subreddit"
+    )
+    post_executor = BoundedExecutor(
+        max_workers=concurrency,
+        queue_size=2 * concurrency,
+        thread_name_prefix="post",
+    )
+    in_flight: Dict[Future, str] = {}
+    next_save = time.monotonic() + save_interval
+    try:
+        while True:
+            saving = time.monotonic() >= next_save
+            if saving and not in_flight:
+                context.flush()
+                next_save = time.monotonic() + save_interval
+                saving = False
+            while not saving and len(in_flight) < concurrency:
+                subreddit = scheduler.pop_due()
+                if subreddit is None:
+                    break
+                METRICS.increment("polls", subreddit)
+                future = subreddit_executor.submit(
+                    extract_subreddit, subreddit, context, post_executor
+                )
+                in_flight[future] = subreddit
+
+            timeout = max(
+                min(scheduler.seconds_until_due(), next_save - time.monotonic()), 1.0
+            )
+            if in_flight:
+                done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    subreddit = in_flight.pop(future)
+                    interval = scheduler.reschedule(subreddit, future.result())
+                    print(f"Next poll of '{subreddit}' in {interval:.0f}s.")
+            else:
+                time.sleep(timeout)
+            if isinstance(context.writer, RollingNDJSONWriter):
+                context.writer.roll_if_expired()
+    finally:
+        shutdown_executors(subreddit_executor, post_executor)
 
 
 def main() -> None:
     """
     Main function to fetch posts from subreddits and save them as JSON files in a GCS bucket.
+
+    Listing, comment fetching and uploads run as concurrent stages connected
+    by bounded queues; `POST_QUEUE_SIZE` bounds the listed posts waiting for
+    their comments. Set `EXTRACTION_CONCURRENCY` above 1 to process several
+    subreddits and posts in parallel. Subreddits are sharded across every app
+    listed in the credentials file, each with its own rate limiter. Uploads
+    run in the background and queued posts are flushed before returning, even
+    when the run is interrupted.
+
+    With `EXTRACTION_DAEMON=1`, the extractor keeps running and polls each
+    subreddit at an interval set by its activity (see `run_daemon`).
+
+    Only posts newer than the checkpoints stored at `CHECKPOINT_PATH` (a local
+    file or a `gs://` object, empty to disable) are fetched. The checkpoints
+    are saved at the end of the run unless an upload failed.
+
+    With `COMMENT_REFRESH=1`, the latest posts are revisited instead and only
+    those whose comment count changed since `COMMENT_INDEX_PATH` recorded them
+    are fetched again. Otherwise, posts recorded in the seen-ID index at
+    `SEEN_INDEX_PATH` (a local SQLite file, empty to disable) are never
+    fetched twice. Posts fetched again are compared with the content hashes
+    kept at `CHANGE_INDEX_PATH` (empty to disable) and unchanged ones are
+    written as small delta records, as are the posts skipped whose listed
+    score or comment count moved. `COMMENT_EXPANSION_LIMIT` caps the "load more comments"
+    requests issued per post.
+
+    Stage timings and per-subreddit counters are served in the Prometheus
+    format on `127.0.0.1:METRICS_PORT` when that variable is set, and written
+    to `METRICS_SUMMARY_PATH` (default `metrics_summary.json`, empty to
+    disable) at the end of the run.
     """
+    context = None
+    summary_path = os.getenv("METRICS_SUMMARY_PATH", "metrics_summary.json")
     try:
-        reddit = get_credentials()  # Initialize Reddit API client
+        if os.getenv("METRICS_PORT"):
+            METRICS.serve(get_env_int("METRICS_PORT", 9100))
+        factories = get_credentials()  # Prepare the Reddit API clients
         all_subreddits = get_subject()  # Load subreddits to process
         bucket_name = "reddit-feelings-pipeline-bucket"
-        rate_limiter = RedditRateLimiter()
-
-        for subreddit in all_subreddits:
-            print(f"Fetching posts from subreddit: {subreddit}...")
-            try:
-                sub = reddit.subreddit(subreddit)
-                posts = sub.new(limit=100)  # Fetch the latest 100 posts
-
-                for post in posts:
-                    rate_limiter.increment()
-
-                    if post.id:  # Ensure the post is valid
-                        comments = fetch_comments(post, rate_limiter)
-                        post_data = {
-                            "title": post.title,
-                            "id": post.id,
-                            "url": post.url,
-                            "score": post.score,
-                            "author": str(post.author),
-                            "created_utc": post.created_utc,
-                            "num_comments": post.num_comments,
-                            "selftext": post.selftext,
-                            "subreddit": str(post.subreddit),
-                            "comments": comments,
-                        }
-                        save_post_to_bucket(bucket_name, post_data)
-            except (PRAWException, RequestException) as error:
-                print(f"Error processing subreddit '{subreddit}': {error}")
-            except KeyboardInterrupt:
-                print("Process interrupted by user.")
-                return
+        concurrency = get_env_int("EXTRACTION_CONCURRENCY", 1)
+        sink = build_sink(bucket_name)
+        seen_index_path = os.getenv("SEEN_INDEX_PATH", "seen_ids.db")
+        seen_index = SeenIndex(seen_index_path) if seen_index_path else None
+        uploader = BucketUploader(
+            sink,
+            num_workers=get_env_int("UPLOAD_WORKERS", 4),
+            queue_size=get_env_int("UPLOAD_QUEUE_SIZE", 100),
+            # Posts only count as seen once stored, so a lost upload is retried
+            on_uploaded=seen_index.update if seen_index is not None else None,
+        )
+        checkpoint_path = os.getenv("CHECKPOINT_PATH", "checkpoints.json")
+        comment_index_path = os.getenv("COMMENT_INDEX_PATH", "comment_index.json")
+        change_index_path = os.getenv("CHANGE_INDEX_PATH", "content_hashes.json")
+        context = ExtractionContext(
+            uploader,
+            build_writer(uploader),
+            build_client_pool(factories),
+            checkpoints=(
+                CheckpointStore(checkpoint_path, sink.client)
+                if checkpoint_path
+                else None
+            ),
+            comment_index=(
+                CommentIndex(comment_index_path, sink.client)
+                if os.getenv("COMMENT_REFRESH") == "1"
+                else None
+            ),
+            seen_index=seen_index,
+            change_detector=(
+                ChangeDetector(change_index_path, sink.client)
+                if change_index_path
+                else None
+            ),
+            expansion_limit=get_expansion_limit(),
+        )
+
+        if os.getenv("EXTRACTION_DAEMON") == "1":
+            scheduler = PollScheduler(
+                all_subreddits,
+                min_interval=get_env_int("POLL_MIN_INTERVAL_SECONDS", 60),
+                max_interval=get_env_int("POLL_MAX_INTERVAL_SECONDS", 3600),
+            )
+            run_daemon(
+                scheduler,
+                context,
+                concurrency,
+                save_interval=get_env_int("STATE_SAVE_INTERVAL_SECONDS", 300),
+            )
+        else:
+            run_extraction(
+                all_subreddits,
+                context,
+                concurrency,
+                queue_size=get_env_int("POST_QUEUE_SIZE", 2 * concurrency),
+            )
     except (PRAWException, RequestException) as error:
         print(f"Critical error in main function: {error}")
         time.sleep(30)
     except KeyboardInterrupt:
         print("Process interrupted by user.")
-        return
+    finally:
+        if context is not None:
+            context.close()
+        if summary_path:
+            METRICS.write_summary(summary_path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,213 @@
+"""
+Metrics file
+
+Stage timings and per-subreddit counters of an extraction run, exported in
+the Prometheus text format on a localhost endpoint and as a JSON summary.
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Iterator, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """
+    A thread-safe registry of stage timings and per-subreddit counters.
+
+    Stages are the steps a post goes through (listing fetch, comment
+    expansion, serialization, upload, rate-limit waits...). For each of them
+    the number of calls, the total and the longest duration are kept.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty registry.
+        """
+        self._stages: Dict[str, List[float]] = {}
+        self._counters: Dict[Tuple[str, str], float] = {}
+        self._started = time.time()
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """
+        Records one call of a stage.
+
+        Args:
+            stage (str): The stage name.
+            seconds (float): Time spent in the stage.
+        """
+        with self._lock:
+            calls, total, longest = self._stages.get(stage, (0, 0.0, 0.0))
+            self._stages[stage] = [calls + 1, total + seconds, max(longest, seconds)]
+
+    @contextmanager
+    def time_stage(self, stage: str) -> Iterator[None]:
+        """
+        Times the enclosed block as one call of a stage.
+
+        Args:
+            stage (str): The stage name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed_iter(self, iterable: Iterable[T], stage: str) -> Iterator[T]:
+        """
+        Times each step of a lazy iterator, such as a paginated praw listing.
+
+        Args:
+            iterable (Iterable[T]): The iterable to walk.
+            stage (str): The stage the time spent fetching items is recorded as.
+
+        Yields:
+            T: The items of the iterable.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.time_stage(stage):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def increment(self, name: str, subreddit: str, value: float = 1) -> None:
+        """
+        Adds to a per-subreddit counter.
+
+        Args:
+            name (str): The counter name, e.g. "posts" or "errors".
+            subreddit (str): The subreddit the counter applies to.
+            value (float): The amount to add.
+        """
+        with self._lock:
+            key = (name, subreddit)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def summary(self) -> dict:
+        """
+        Builds a snapshot of every metric.
+
+        Returns:
+            dict: Stage timings and per-subreddit counters.
+        """
+        with self._lock:
+            stages = {
+                stage: {
+                    "calls": int(calls),
+                    "total_seconds": round(total, 3),
+                    "max_seconds": round(longest, 3),
+                }
+                for stage, (calls, total, longest) in sorted(self._stages.items())
+            }
+            subreddits: Dict[str, Dict[str, float]] = {}
+            for (name, subreddit), value in sorted(self._counters.items()):
+                subreddits.setdefault(subreddit, {})[name] = value
+        return {
+            "started_at": self._started,
+            "elapsed_seconds": round(time.time() - self._started, 3),
+            "stages": stages,
+            "subreddits": subreddits,
+        }
+
+    def render_prometheus(self) -> str:
+        """
+        Renders every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics page.
+        """
+        with self._lock:
+            stages = sorted(self._stages.items())
+            counters = sorted(self._counters.items())
+
+        lines = []
+        for suffix, index, kind, help_text in (
+            ("calls_total", 0, "counter", "Number of calls of each extraction stage."),
+            ("seconds_total", 1, "counter", "Time spent in each extraction stage."),
+            ("seconds_max", 2, "gauge", "Longest call of each extraction stage."),
+        ):
+            lines.append(f"# HELP extraction_stage_{suffix} {help_text}")
+            lines.append(f"# TYPE extraction_stage_{suffix} {kind}")
+            for stage, values in stages:
+                lines.append(
+                    f'extraction_stage_{suffix}{{stage="{_escape(stage)}"}} '
+                    f"{values[index]:g}"
+                )
+
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(
+                f"# HELP extraction_{name}_total Extracted {name} per subreddit."
+            )
+            lines.append(f"# TYPE extraction_{name}_total counter")
+            for (counter, subreddit), value in counters:
+                if counter == name:
+                    lines.append(
+                        f'extraction_{name}_total{{subreddit="{_escape(subreddit)}"}} '
+                        f"{value:g}"
+                    )
+        return "\n".join(lines) + "\n"
+
+    def write_summary(self, path: str) -> None:
+        """
+        Writes the JSON summary of the run.
+
+        Args:
+            path (str): Path of the summary file.
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.summary(), file, indent=4)
+        print(f"Metrics summary written to '{path}'.")
+
+    def serve(self, port: int) -> ThreadingHTTPServer:
+        """
+        Serves the Prometheus metrics page on localhost from a background thread.
+
+        Args:
+            port (int): The port to listen on.
+
+        Returns:
+            ThreadingHTTPServer: The running server.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """
+            Answers every GET with the metrics page.
+            """
+
+            def do_GET(self) -> None:  # pylint: disable=invalid-name
+                """
+                Sends the metrics page.
+                """
+                body = metrics.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:  # pylint: disable=arguments-differ
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(
+            target=server.serve_forever, name="metrics", daemon=True
+        ).start()
+        print(f"Serving metrics on http://127.0.0.1:{port}/metrics")
+        return server
+
+
+METRICS = Metrics()
@@ -0,0 +1,61 @@
+"""
+BoundedExecutor file
+"""
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+
+class BoundedExecutor:
+    """
+    A thread pool whose backlog of pending tasks is bounded.
+
+    `submit` blocks while `queue_size` tasks are already waiting or running,
+    which applies backpressure to the producing stage instead of letting it
+    run ahead and buffer an unbounded amount of work.
+    """
+
+    def __init__(self, max_workers: int, queue_size: int, thread_name_prefix: str = ""):
+        """
+        Initializes the executor.
+
+        Args:
+            max_workers (int): Number of worker threads.
+            queue_size (int): Maximum number of tasks waiting for a worker.
+            thread_name_prefix (str): Prefix of the worker thread names.
+        """
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=thread_name_prefix
+        )
+        self._slots = threading.BoundedSemaphore(max_workers + queue_size)
+
+    def submit(self, function: Callable[..., Any], *args: Any) -> Future:
+        """
+        Schedules a call, blocking while the backlog is full.
+
+        Args:
+            function (Callable[..., Any]): The function to run.
+            *args (Any): Its positional arguments.
+
+        Returns:
+            Future: The future of the call.
+        """
+        self._slots.acquire()  # pylint: disable=consider-using-with
+        try:
+            future = self._executor.submit(function, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False) -> None:
+        """
+        Stops the worker threads, see `ThreadPoolExecutor.shutdown`.
+
+        Args:
+            wait (bool): Whether to wait for the running tasks.
+            cancel_futures (bool): Whether to cancel the pending tasks.
+        """
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
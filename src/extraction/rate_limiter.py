@@ -2,46 +2,233 @@
 RedditRateLimiter file
 """
 
+import asyncio
+import fcntl
+import json
+import threading
 import time
+from typing import Callable, Dict, Optional, Union
 
+from metrics import METRICS
 
-class RedditRateLimiter:
+
+class TokenBucket:  # pylint: disable=too-few-public-methods
+    """
+    A token bucket kept in memory, shared by the threads of one process.
+    """
+
+    def __init__(self, capacity: float):
+        """
+        Initializes a full bucket.
+
+        Args:
+            capacity (float): Maximum number of tokens the bucket holds.
+        """
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, count: float, rate: float, capacity: float) -> float:
+        """
+        Takes tokens from the bucket, going into debt if there are not enough.
+
+        Args:
+            count (float): Number of tokens to take.
+            rate (float): Refill rate in tokens per second.
+            capacity (float): Maximum number of tokens the bucket holds.
+
+        Returns:
+            float: Seconds the caller must wait before using the tokens.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+            self.updated = now
+            self.tokens -= count
+            return max(0.0, -self.tokens / rate)
+
+
+class FileTokenBucket:  # pylint: disable=too-few-public-methods
+    """
+    A token bucket stored in a locked file, shared by several processes.
+
+    Every extractor process pointing at the same path draws from one budget.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initializes the bucket file.
+
+        Args:
+            path (str): Path of the file holding the bucket state.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def reserve(self, count: float, rate: float, capacity: float) -> float:
+        """
+        Takes tokens from the bucket, going into debt if there are not enough.
+
+        Args:
+            count (float): Number of tokens to take.
+            rate (float): Refill rate in tokens per second.
+            capacity (float): Maximum number of tokens the bucket holds.
+
+        Returns:
+            float: Seconds the caller must wait before using the tokens.
+        """
+        with self._lock, open(self.path, "a+", encoding="utf-8") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                file.seek(0)
+                content = file.read()
+                now = time.time()
+                state = (
+                    json.loads(content)
+                    if content
+                    else {"tokens": capacity, "updated": now}
+                )
+                tokens = min(
+                    capacity, state["tokens"] + (now - state["updated"]) * rate
+                )
+                tokens -= count
+                file.seek(0)
+                file.truncate()
+                json.dump({"tokens": tokens, "updated": now}, file)
+                file.flush()
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+        return max(0.0, -tokens / rate)
+
+
+class RedditRateLimiter:  # pylint: disable=too-many-instance-attributes
     """
     A class to handle Reddit API rate limiting (100 requests per minute).
+
+    Requests are spread evenly with a token bucket instead of bursting and then
+    stalling until the end of the minute. When given the rate-limit headers of
+    the app, the rate also follows the `X-Ratelimit-Remaining`/`Reset` headers
+    of the last response, and requests are held back until the reset once
+    they report an exhausted budget. A single instance can be shared between
+    threads and coroutines; a `FileTokenBucket` shares the budget between
+    processes.
     """
 
-    def __init__(self, max_requests_per_minute: int = 100):
+    def __init__(
+        self,
+        max_requests_per_minute: int = 100,
+        burst: int = 5,
+        limits: Optional[Callable[[], Dict[str, Optional[float]]]] = None,
+        bucket: Optional[Union[TokenBucket, FileTokenBucket]] = None,
+    ):
         """
         Initializes the rate limiter.
 
         Args:
             max_requests_per_minute (int): Maximum number of requests allowed per minute.
+            burst (int): Number of requests that may be sent back to back.
+            limits (Optional[Callable[[], Dict[str, Optional[float]]]]): Reads the
+                rate-limit headers to follow, see `RedditSessions.limits`.
+            bucket (Optional[Union[TokenBucket, FileTokenBucket]]): Where tokens are
+                kept, an in-memory bucket by default.
         """
         self.max_requests = max_requests_per_minute
-        self.request_count = 0
-        self.start_time = time.time()
+        self.rate = max_requests_per_minute / 60
+        self.capacity = float(burst)
+        self.limits = limits
+        self.bucket = bucket if bucket is not None else TokenBucket(self.capacity)
+        self.total_wait = 0.0
+        self._exhausted_until = 0.0
+        self._wait_lock = threading.Lock()
 
-    def increment(self):
+    def acquire(self) -> None:
         """
-        Increment the request counter and enforce the rate limit if necessary.
+        Blocks until the next request may be sent.
+        """
+        reset_wait = self._reset_wait()
+        if reset_wait > 0:
+            with METRICS.time_stage("rate_limit_wait"):
+                time.sleep(reset_wait)
+        wait_time = self._reserve()
+        if wait_time > 0:
+            with METRICS.time_stage("rate_limit_wait"):
+                time.sleep(wait_time)
 
-        Raises:
-            Exception: If the rate limit logic encounters an error.
+    async def acquire_async(self) -> None:
+        """
+        Waits, without blocking the event loop, until the next request may be sent.
         """
-        self.request_count += 1
+        reset_wait = self._reset_wait()
+        if reset_wait > 0:
+            with METRICS.time_stage("rate_limit_wait"):
+                await asyncio.sleep(reset_wait)
+        wait_time = self._reserve()
+        if wait_time > 0:
+            with METRICS.time_stage("rate_limit_wait"):
+                await asyncio.sleep(wait_time)
 
-        # If we've hit the limit, pause to respect the API restrictions
-        if self.request_count >= self.max_requests:
-            elapsed_time = time.time() - self.start_time
-            if elapsed_time < 60:  # If less than a minute has passed
-                wait_time = 60 - elapsed_time
-                print(f"Rate limit reached. Waiting {wait_time:.2f} seconds...")
-                time.sleep(wait_time)  # Pause for the remaining time
-            self.reset()  # Reset the counter and timer
+    def increment(self) -> None:
+        """
+        Counts a request against the budget; kept as an alias of `acquire`.
+        """
+        self.acquire()
+
+    def current_rate(self) -> float:
+        """
+        Computes the allowed request rate from the configuration and the headers.
+
+        Returns:
+            float: The allowed number of requests per second.
+        """
+        if self.limits is None:
+            return self.rate
+        limits = self.limits()
+        remaining = limits.get("remaining")
+        reset_timestamp = limits.get("reset_timestamp")
+        if remaining is None or reset_timestamp is None:
+            return self.rate
+
+        seconds_to_reset = reset_timestamp - time.time()
+        if seconds_to_reset <= 0:
+            return self.rate  # The headers describe a window that is over
+        return min(self.rate, max(remaining, 1.0) / max(seconds_to_reset, 1.0))
 
-    def reset(self):
+    def _reset_wait(self) -> float:
         """
-        Reset the request counter and the timer.
+        Computes how long requests are held back while the budget is exhausted,
+        logging it once per rate-limit window.
+
+        Returns:
+            float: Seconds until the window resets, 0 unless the last response
+            reported no remaining request.
+        """
+        if self.limits is None:
+            return 0.0
+        limits = self.limits()
+        remaining = limits.get("remaining")
+        reset_timestamp = limits.get("reset_timestamp")
+        if remaining is None or reset_timestamp is None or remaining >= 1:
+            return 0.0
+        now = time.time()
+        wait_time = reset_timestamp - now
+        if wait_time <= 0:
+            return 0.0
+        with self._wait_lock:
+            self.total_wait += wait_time
+            if now >= self._exhausted_until:
+                self._exhausted_until = reset_timestamp
+                print(f"Rate limit exhausted. Next request in {wait_time:.2f}s...")
+        return wait_time
+
+    def _reserve(self) -> float:
+        """
+        Takes a token and records the time the caller will spend waiting for it.
+
+        Returns:
+            float: Seconds to wait before sending the request.
         """
-        self.request_count = 0
-        self.start_time = time.time()
+        wait_time = self.bucket.reserve(1, self.current_rate(), self.capacity)
+        if wait_time > 0:
+            with self._wait_lock:
+                self.total_wait += wait_time
+        return wait_time
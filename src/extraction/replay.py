@@ -0,0 +1,198 @@
+"""
+Record/replay requestors file
+
+These requestors plug into `praw.Reddit(requestor_class=...)`. The recording
+one stores every Reddit API response in a fixtures directory; the replaying
+one stands in for Reddit and serves those fixtures back without any network
+access, so the extraction can be measured offline.
+"""
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional
+
+import prawcore
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+
+# A URL path, not a secret
+ACCESS_TOKEN_PATH = "/api/v1/access_token"  # nosec B105
+# Placeholder credentials and token of the replayed apps, never sent to Reddit
+REPLAY_CREDENTIAL = "replay"
+
+
+def fixture_key(method: str, url: str, params: Any = None, data: Any = None) -> str:
+    """
+    Computes the fixture file name of a request.
+
+    Args:
+        method (str): The HTTP method.
+        url (str): The request URL.
+        params (Any): The query parameters.
+        data (Any): The form data.
+
+    Returns:
+        str: A stable file name identifying the request.
+    """
+    normalized = json.dumps(
+        [
+            method.upper(),
+            url,
+            sorted((params or {}).items()),
+            sorted(dict(data or {}).items()),
+        ],
+        default=str,
+    )
+    digest = hashlib.sha1(normalized.encode("utf-8"), usedforsecurity=False)
+    return digest.hexdigest() + ".json"
+
+
+def build_response(
+    status_code: int, body: str, headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    Builds a `requests.Response` as if it came from the network.
+
+    Args:
+        status_code (int): The HTTP status code.
+        body (str): The response body.
+        headers (Optional[Dict[str, str]]): The response headers.
+
+    Returns:
+        Response: The response object.
+    """
+    response = Response()
+    response.status_code = status_code
+    response.headers = CaseInsensitiveDict(headers or {})
+    response.encoding = "utf-8"
+    response._content = body.encode("utf-8")  # pylint: disable=protected-access
+    return response
+
+
+class RecordingRequestor(prawcore.Requestor):
+    """
+    A requestor saving every Reddit API response to a fixtures directory.
+
+    Access token exchanges are not recorded, so no credential ends up in the
+    fixtures.
+    """
+
+    def __init__(self, *args: Any, fixtures_dir: str = "fixtures", **kwargs: Any):
+        """
+        Initializes the requestor.
+
+        Args:
+            *args (Any): Positional arguments of `prawcore.Requestor`.
+            fixtures_dir (str): Directory the responses are written to.
+            **kwargs (Any): Keyword arguments of `prawcore.Requestor`.
+        """
+        super().__init__(*args, **kwargs)
+        self.fixtures_dir = fixtures_dir
+        os.makedirs(fixtures_dir, exist_ok=True)
+
+    def request(
+        self, *args: Any, timeout: Optional[float] = None, **kwargs: Any
+    ) -> Response:
+        """
+        Issues the request and records its response.
+        """
+        response = super().request(*args, timeout=timeout, **kwargs)
+        method, url = args[0], args[1]
+        if not url.endswith(ACCESS_TOKEN_PATH):
+            fixture = {
+                "method": method,
+                "url": url,
+                "status_code": response.status_code,
+                "headers": {"content-type": response.headers.get("content-type", "")},
+                "body": response.text,
+            }
+            name = fixture_key(method, url, kwargs.get("params"), kwargs.get("data"))
+            with open(
+                os.path.join(self.fixtures_dir, name), "w", encoding="utf-8"
+            ) as file:
+                json.dump(fixture, file)
+        return response
+
+
+class ReplayRequestor(prawcore.Requestor):
+    """
+    A requestor standing in for Reddit, answering from recorded fixtures.
+
+    Rate-limit headers are left out of the replayed responses so that only the
+    extractor's own rate limiter paces the run.
+    """
+
+    def __init__(self, *args: Any, fixtures_dir: str = "fixtures", **kwargs: Any):
+        """
+        Initializes the requestor.
+
+        Args:
+            *args (Any): Positional arguments of `prawcore.Requestor`.
+            fixtures_dir (str): Directory the responses are read from.
+            **kwargs (Any): Keyword arguments of `prawcore.Requestor`.
+        """
+        super().__init__(*args, **kwargs)
+        self.fixtures_dir = fixtures_dir
+
+    def request(
+        self, *args: Any, timeout: Optional[float] = None, **kwargs: Any
+    ) -> Response:
+        """
+        Answers the request from the fixtures.
+
+        Raises:
+            prawcore.exceptions.RequestException: If no fixture matches the request.
+        """
+        method, url = args[0], args[1]
+        if url.endswith(ACCESS_TOKEN_PATH):
+            # "bearer" is the OAuth token type, not a secret
+            token = {  # nosec B105
+                "access_token": REPLAY_CREDENTIAL,
+                "expires_in": 86400,
+                "scope": "*",
+                "token_type": "bearer",
+            }
+            return build_response(200, json.dumps(token))
+
+        name = fixture_key(method, url, kwargs.get("params"), kwargs.get("data"))
+        try:
+            with open(
+                os.path.join(self.fixtures_dir, name), "r", encoding="utf-8"
+            ) as file:
+                fixture = json.load(file)
+        except FileNotFoundError as error:
+            raise prawcore.exceptions.RequestException(error, args, kwargs) from None
+        response = build_response(
+            fixture["status_code"], fixture["body"], fixture["headers"]
+        )
+        response.url = url
+        return response
+
+
+def get_requestor_options() -> Dict[str, Any]:
+    """
+    Reads the record/replay settings from the environment.
+
+    `REDDIT_REPLAY_MODE` is "record" or "replay" and `REDDIT_FIXTURES_DIR`
+    (default `fixtures`) is where the responses are kept.
+
+    Returns:
+        Dict[str, Any]: Keyword arguments for `praw.Reddit`, empty when neither
+        mode is enabled.
+
+    Raises:
+        ValueError: If the mode is unknown.
+    """
+    mode = os.getenv("REDDIT_REPLAY_MODE", "")
+    if not mode:
+        return {}
+    requestor_classes = {"record": RecordingRequestor, "replay": ReplayRequestor}
+    if mode not in requestor_classes:
+        raise ValueError(f"Unknown REDDIT_REPLAY_MODE '{mode}'")
+    return {
+        "requestor_class": requestor_classes[mode],
+        "requestor_kwargs": {
+            "fixtures_dir": os.getenv("REDDIT_FIXTURES_DIR", "fixtures")
+        },
+    }
@@ -0,0 +1,144 @@
+"""
+PollScheduler file
+"""
+
+import heapq
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+def activity_score(timestamps: List[float], now: float) -> float:
+    """
+    Scores how active a subreddit is from the creation times of its latest posts.
+
+    This is the formula of `calculate_activity_score` in
+    `src/utils/reddit_sub_analyzer.py`, applied to posts the extractor already
+    listed instead of issuing a request of its own.
+
+    Args:
+        timestamps (List[float]): Creation times of the latest posts, newest first.
+        now (float): The current UNIX time.
+
+    Returns:
+        float: Activity score between 0 and 1, where 1 indicates high activity.
+    """
+    if not timestamps:
+        return 0.0
+    latest_post_age = max(now - timestamps[0], 0.0) / 86400
+    if len(timestamps) > 1:
+        time_diffs = [
+            timestamps[i] - timestamps[i + 1] for i in range(len(timestamps) - 1)
+        ]
+        avg_time_between_posts = sum(time_diffs) / len(time_diffs) / 86400
+    else:
+        avg_time_between_posts = latest_post_age
+    recency_score = 1.0 / (1 + latest_post_age)
+    frequency_score = 1.0 / (1 + avg_time_between_posts)
+    return (recency_score + frequency_score) / 2
+
+
+class PollScheduler:
+    """
+    A priority queue of subreddits ordered by the time they are next due.
+
+    After each poll, a subreddit is rescheduled after an interval that shrinks
+    geometrically from `max_interval` for a dead subreddit (score 0) to
+    `min_interval` for the busiest ones (score 1). Busy subreddits are thus
+    polled more often and draw a larger share of the request budget, while
+    quiet ones stop spending requests on empty listings.
+    """
+
+    def __init__(
+        self,
+        subreddits: Iterable[str],
+        min_interval: float = 60.0,
+        max_interval: float = 3600.0,
+        history: int = 10,
+    ):
+        """
+        Initializes the scheduler with every subreddit due immediately.
+
+        Args:
+            subreddits (Iterable[str]): The subreddits to poll.
+            min_interval (float): Seconds between polls of the busiest subreddits.
+            max_interval (float): Seconds between polls of inactive subreddits.
+            history (int): Number of latest posts the activity is measured on.
+
+        Raises:
+            ValueError: If the intervals are not positive and ordered.
+        """
+        if not 0 < min_interval <= max_interval:
+            raise ValueError("Poll intervals must satisfy 0 < min <= max")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.history = history
+        now = time.time()
+        self._queue: List[Tuple[float, int, str]] = [
+            (now, order, subreddit) for order, subreddit in enumerate(subreddits)
+        ]
+        heapq.heapify(self._queue)
+        self._order = len(self._queue)
+        self._timestamps: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def pop_due(self, now: Optional[float] = None) -> Optional[str]:
+        """
+        Takes the most overdue subreddit off the queue.
+
+        Args:
+            now (Optional[float]): The current UNIX time.
+
+        Returns:
+            Optional[str]: The subreddit to poll, or None if none is due yet.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if not self._queue or self._queue[0][0] > now:
+                return None
+            return heapq.heappop(self._queue)[2]
+
+    def seconds_until_due(self, now: Optional[float] = None) -> float:
+        """
+        Computes how long until the next subreddit is due.
+
+        Args:
+            now (Optional[float]): The current UNIX time.
+
+        Returns:
+            float: Seconds to wait, 0 if one is already due.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if not self._queue:
+                return self.max_interval
+            return max(self._queue[0][0] - now, 0.0)
+
+    def reschedule(self, subreddit: str, timestamps: Iterable[float]) -> float:
+        """
+        Records the posts seen by a poll and queues the subreddit again.
+
+        Args:
+            subreddit (str): The subreddit that was polled.
+            timestamps (Iterable[float]): Creation times of the posts it listed.
+
+        Returns:
+            float: Seconds until the subreddit is polled again.
+        """
+        now = time.time()
+        with self._lock:
+            latest = sorted(
+                set(self._timestamps.get(subreddit, [])) | set(timestamps),
+                reverse=True,
+            )[: self.history]
+            self._timestamps[subreddit] = latest
+            score = activity_score(latest, now)
+            interval = (
+                self.max_interval * (self.min_interval / self.max_interval) ** score
+            )
+            heapq.heappush(self._queue, (now + interval, self._order, subreddit))
+            self._order += 1
+        return interval
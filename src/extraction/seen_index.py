@@ -0,0 +1,197 @@
+"""
+SeenIndex file
+"""
+
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+from typing import Iterable, Iterator, Set
+
+
+class BloomFilter:
+    """
+    A fixed-size Bloom filter over string keys.
+
+    Membership tests never give false negatives; false positives happen at
+    roughly `error_rate` while fewer than `capacity` keys were added.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        """
+        Initializes an empty filter sized for the expected number of keys.
+
+        Args:
+            capacity (int): Number of keys the filter is sized for.
+            error_rate (float): Target false positive rate at full capacity.
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def add(self, key: str) -> None:
+        """
+        Adds a key to the filter.
+
+        Args:
+            key (str): The key to add.
+        """
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+    def _positions(self, key: str) -> Iterator[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:], "big") | 1
+        for index in range(self.num_hashes):
+            yield (first + index * second) % self.num_bits
+
+
+class SeenIndex:
+    """
+    A class remembering the ids of every post already uploaded.
+
+    The ids are kept exactly in a SQLite file. A Bloom filter, stored in the
+    same file, answers most lookups of new posts without touching the table,
+    and only possible hits are confirmed with an indexed query. Ids added
+    during a run are written to the file when the index is saved.
+    """
+
+    def __init__(self, path: str, capacity: int = 1_000_000, error_rate: float = 0.01):
+        """
+        Opens the index file and loads its Bloom filter.
+
+        Args:
+            path (str): Local path of the SQLite file, created if missing.
+            capacity (int): Number of ids the Bloom filter is sized for; it is
+                rebuilt twice as large once the index outgrows it.
+            error_rate (float): Target false positive rate of the Bloom filter.
+
+        Raises:
+            ValueError: If a `gs://` path is given.
+        """
+        if path.startswith("gs://"):
+            raise ValueError("The seen-ID index must be a local file")
+        self.path = path
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._pending: Set[str] = set()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS seen (
+                id TEXT PRIMARY KEY, seen_at REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS bloom (
+                capacity INTEGER NOT NULL, error_rate REAL NOT NULL, bits BLOB NOT NULL
+            );
+            """)
+        self._count = self._connection.execute("SELECT COUNT(*) FROM seen").fetchone()[
+            0
+        ]
+        self._bloom = self._load_bloom(max(capacity, 2 * self._count))
+
+    def __contains__(self, post_id: str) -> bool:
+        with self._lock:
+            if post_id not in self._bloom:
+                return False
+            if post_id in self._pending:
+                return True
+            row = self._connection.execute(
+                "SELECT 1 FROM seen WHERE id = ?", (post_id,)
+            ).fetchone()
+        return row is not None
+
+    def add(self, post_id: str) -> None:
+        """
+        Records a post as uploaded.
+
+        Args:
+            post_id (str): The post id.
+        """
+        with self._lock:
+            self._bloom.add(post_id)
+            self._pending.add(post_id)
+
+    def update(self, post_ids: Iterable[str]) -> None:
+        """
+        Records several posts as uploaded.
+
+        Args:
+            post_ids (Iterable[str]): The post ids.
+        """
+        with self._lock:
+            for post_id in post_ids:
+                self._bloom.add(post_id)
+                self._pending.add(post_id)
+
+    def save(self) -> None:
+        """
+        Writes the ids added since the last save, along with the Bloom filter.
+        """
+        with self._lock:
+            now = time.time()
+            with self._connection:
+                inserted = self._connection.executemany(
+                    "INSERT OR IGNORE INTO seen (id, seen_at) VALUES (?, ?)",
+                    ((post_id, now) for post_id in self._pending),
+                ).rowcount
+                self._count += max(inserted, 0)
+                if self._count > self._bloom.capacity:
+                    self._bloom = self._build_bloom(2 * self._count, self._all_ids())
+                self._store_bloom()
+            self._pending.clear()
+        print(f"Seen-ID index saved to '{self.path}' ({self._count} ids).")
+
+    def close(self) -> None:
+        """
+        Closes the index file without saving pending ids.
+        """
+        with self._lock:
+            self._connection.close()
+
+    def _load_bloom(self, capacity: int) -> BloomFilter:
+        """
+        Reads the stored Bloom filter, rebuilding it from the table when it is
+        missing or too small for the stored ids.
+        """
+        row = self._connection.execute(
+            "SELECT capacity, error_rate, bits FROM bloom"
+        ).fetchone()
+        if row is not None and row[0] >= self._count and row[1] == self.error_rate:
+            bloom = BloomFilter(row[0], row[1])
+            if len(row[2]) == len(bloom.bits):
+                bloom.bits = bytearray(row[2])
+                return bloom
+        bloom = self._build_bloom(capacity, self._all_ids())
+        with self._connection:
+            self._bloom = bloom
+            self._store_bloom()
+        return bloom
+
+    def _build_bloom(self, capacity: int, post_ids: Iterable[str]) -> BloomFilter:
+        bloom = BloomFilter(capacity, self.error_rate)
+        for post_id in post_ids:
+            bloom.add(post_id)
+        return bloom
+
+    def _all_ids(self) -> Iterator[str]:
+        return (row[0] for row in self._connection.execute("SELECT id FROM seen"))
+
+    def _store_bloom(self) -> None:
+        """
+        Replaces the stored Bloom filter. Must be called inside a transaction.
+        """
+        self._connection.execute("DELETE FROM bloom")
+        self._connection.execute(
+            "INSERT INTO bloom (capacity, error_rate, bits) VALUES (?, ?, ?)",
+            (self._bloom.capacity, self._bloom.error_rate, bytes(self._bloom.bits)),
+        )
@@ -0,0 +1,234 @@
+"""
+ClientPool file
+"""
+
+import bisect
+import hashlib
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import praw
+from rate_limiter import RedditRateLimiter
+
+
+class HashRing:  # pylint: disable=too-few-public-methods
+    """
+    A consistent hash ring mapping keys to node names.
+
+    Each node is placed on the ring `replicas` times so that keys spread evenly,
+    and adding or removing a node only moves the keys it owned.
+    """
+
+    def __init__(self, nodes: Iterable[str], replicas: int = 100):
+        """
+        Initializes the ring.
+
+        Args:
+            nodes (Iterable[str]): The node names.
+            replicas (int): Number of points each node gets on the ring.
+        """
+        self._points: List[Tuple[int, str]] = sorted(
+            (self._hash(f"{node}#{replica}"), node)
+            for node in nodes
+            for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in self._points]
+
+    def get_nodes(self, key: str) -> List[str]:
+        """
+        Lists the distinct nodes met walking the ring clockwise from a key.
+
+        Args:
+            key (str): The key to place on the ring.
+
+        Returns:
+            List[str]: The owner of the key first, then its fallbacks in order.
+        """
+        start = bisect.bisect(self._hashes, self._hash(key))
+        nodes: List[str] = []
+        for offset in range(len(self._points)):
+            node = self._points[(start + offset) % len(self._points)][1]
+            if node not in nodes:
+                nodes.append(node)
+        return nodes
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+
+class RedditSessions:
+    """
+    One `praw.Reddit` instance per thread for a single Reddit app.
+
+    PRAW is not thread-safe: its HTTP session and rate-limit state must not be
+    shared between threads. Each thread gets its own instance of the app on
+    first use, all built with the same credentials.
+    """
+
+    def __init__(self, factory: Callable[[], praw.Reddit]):
+        """
+        Initializes the sessions.
+
+        Args:
+            factory (Callable[[], praw.Reddit]): Builds an authenticated client.
+        """
+        self.factory = factory
+        self._local = threading.local()
+        self._instances: List[praw.Reddit] = []
+        self._lock = threading.Lock()
+
+    def get(self) -> praw.Reddit:
+        """
+        Returns the instance of the calling thread, building it on first use.
+
+        Returns:
+            praw.Reddit: The client of the calling thread.
+        """
+        reddit = getattr(self._local, "reddit", None)
+        if reddit is None:
+            reddit = self.factory()
+            self._local.reddit = reddit
+            with self._lock:
+                self._instances.append(reddit)
+        return reddit
+
+    def limits(self) -> Dict[str, Optional[float]]:
+        """
+        Reads the rate-limit headers of the app.
+
+        Every instance draws from the budget of the app, so the lowest
+        remaining count reported for the current window is the accurate one.
+
+        Returns:
+            Dict[str, Optional[float]]: The `remaining` and `reset_timestamp`
+            reported by the most recent response, empty before any response.
+        """
+        with self._lock:
+            instances = list(self._instances)
+        now = time.time()
+        current: Dict[str, Optional[float]] = {}
+        for reddit in instances:
+            limits = reddit.auth.limits
+            remaining = limits.get("remaining")
+            reset_timestamp = limits.get("reset_timestamp")
+            if remaining is None or reset_timestamp is None or reset_timestamp <= now:
+                continue
+            if not current or remaining < current["remaining"]:
+                current = {"remaining": remaining, "reset_timestamp": reset_timestamp}
+        return current
+
+
+class RedditClient:  # pylint: disable=too-few-public-methods
+    """
+    A Reddit app along with its own rate limiter.
+    """
+
+    def __init__(
+        self, name: str, sessions: RedditSessions, rate_limiter: RedditRateLimiter
+    ):
+        """
+        Initializes the client.
+
+        Args:
+            name (str): Name of the client, used as its node on the hash ring.
+            sessions (RedditSessions): The per-thread clients of the app.
+            rate_limiter (RedditRateLimiter): The rate limiter of this app.
+        """
+        self.name = name
+        self.sessions = sessions
+        self.rate_limiter = rate_limiter
+
+    @property
+    def reddit(self) -> praw.Reddit:
+        """
+        praw.Reddit: The authenticated client of the calling thread.
+        """
+        return self.sessions.get()
+
+
+class ClientPool:
+    """
+    A class sharding subreddits across several Reddit apps.
+
+    Subreddits are assigned to clients by consistent hashing. A client that
+    failed recently, or whose rate-limit headers report an almost exhausted
+    budget, is skipped and its subreddits move to the next client on the ring.
+    """
+
+    def __init__(
+        self,
+        clients: List[RedditClient],
+        cooldown_seconds: float = 60.0,
+        min_remaining: float = 10.0,
+    ):
+        """
+        Initializes the pool.
+
+        Args:
+            clients (List[RedditClient]): The available clients.
+            cooldown_seconds (float): How long a failing client is avoided.
+            min_remaining (float): Remaining requests under which a client is
+                considered throttled.
+
+        Raises:
+            ValueError: If no client is given.
+        """
+        if not clients:
+            raise ValueError("At least one Reddit client is required")
+        self.clients: Dict[str, RedditClient] = {
+            client.name: client for client in clients
+        }
+        self.cooldown_seconds = cooldown_seconds
+        self.min_remaining = min_remaining
+        self._ring = HashRing(self.clients)
+        self._failed_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    def client_for(self, subreddit: str) -> RedditClient:
+        """
+        Picks the client a subreddit should be fetched with.
+
+        Args:
+            subreddit (str): The subreddit name.
+
+        Returns:
+            RedditClient: The first available client on the ring, or the owner
+            of the subreddit when every client is unavailable.
+        """
+        candidates = [self.clients[name] for name in self._ring.get_nodes(subreddit)]
+        for client in candidates:
+            if self._is_available(client):
+                return client
+        return candidates[0]
+
+    def mark_failed(self, client: RedditClient) -> None:
+        """
+        Takes a client out of rotation for the cooldown period.
+
+        Args:
+            client (RedditClient): The client that failed.
+        """
+        print(f"Reddit client '{client.name}' failing, rebalancing its subreddits.")
+        with self._lock:
+            self._failed_until[client.name] = time.time() + self.cooldown_seconds
+
+    def _is_available(self, client: RedditClient) -> bool:
+        with self._lock:
+            if self._failed_until.get(client.name, 0.0) > time.time():
+                return False
+        limits = client.sessions.limits()
+        remaining = limits.get("remaining")
+        reset_timestamp = limits.get("reset_timestamp")
+        throttled = (
+            remaining is not None
+            and remaining < self.min_remaining
+            and reset_timestamp is not None
+            and reset_timestamp > time.time()
+        )
+        return not throttled
@@ -0,0 +1,105 @@
+"""
+Storage sinks file
+"""
+
+import os
+import threading
+from typing import NamedTuple, Tuple, Union
+
+from google.cloud import storage
+
+
+class StoredObject(NamedTuple):
+    """
+    An object waiting to be written to the storage sink, along with the ids
+    of the posts it holds.
+    """
+
+    name: str
+    data: bytes
+    content_type: str
+    post_ids: Tuple[str, ...] = ()
+
+
+class GCSSink:  # pylint: disable=too-few-public-methods
+    """
+    A sink writing objects to a Google Cloud Storage bucket.
+
+    A single `storage.Client` (and its pooled HTTP session) is shared by every
+    upload.
+    """
+
+    def __init__(self, bucket_name: str):
+        """
+        Initializes the sink.
+
+        Args:
+            bucket_name (str): The target GCS bucket name.
+        """
+        self.client = storage.Client()
+        self.bucket = self.client.bucket(bucket_name)
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+
+    def save(self, stored_object: StoredObject) -> None:
+        """
+        Uploads an object to the bucket.
+
+        Args:
+            stored_object (StoredObject): The object name, payload and content type.
+
+        Raises:
+            Exception: If the upload fails.
+        """
+        try:
+            blob = self.bucket.blob(stored_object.name)
+            blob.upload_from_string(
+                stored_object.data, content_type=stored_object.content_type
+            )
+            with self._lock:
+                self.bytes_written += len(stored_object.data)
+
+            print(
+                f"Object '{stored_object.name}' saved to bucket '{self.bucket.name}'."
+            )
+        except Exception as error:
+            print(f"Error saving object '{stored_object.name}' to bucket: {error}")
+            raise
+
+
+class LocalSink:  # pylint: disable=too-few-public-methods
+    """
+    A sink writing objects to a local directory, mirroring the bucket layout.
+    """
+
+    def __init__(self, directory: str):
+        """
+        Initializes the sink.
+
+        Args:
+            directory (str): The directory objects are written to.
+        """
+        self.client = None
+        self.directory = directory
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+
+    def save(self, stored_object: StoredObject) -> None:
+        """
+        Writes an object to the directory.
+
+        Args:
+            stored_object (StoredObject): The object name, payload and content type.
+
+        Raises:
+            OSError: If the file cannot be written.
+        """
+        path = os.path.join(self.directory, stored_object.name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(stored_object.data)
+        with self._lock:
+            self.bytes_written += len(stored_object.data)
+
+
+StorageSink = Union[GCSSink, LocalSink]
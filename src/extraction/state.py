@@ -0,0 +1,94 @@
+"""
+JSONStateFile file
+"""
+
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+from google.cloud import storage
+
+
+def drop_expired(
+    entries: Dict[str, List], timestamp_index: int, max_age_seconds: float
+) -> Dict[str, List]:
+    """
+    Filters out the entries of a state document that were not touched recently.
+
+    Args:
+        entries (Dict[str, List]): The entries, each a list holding a timestamp.
+        timestamp_index (int): Position of the timestamp in each entry.
+        max_age_seconds (float): Age after which an entry is dropped.
+
+    Returns:
+        Dict[str, List]: The entries still recent enough.
+    """
+    oldest = time.time() - max_age_seconds
+    return {
+        key: entry for key, entry in entries.items() if entry[timestamp_index] >= oldest
+    }
+
+
+class JSONStateFile:
+    """
+    A class reading and writing a JSON document kept between extraction runs.
+
+    The document lives either in a local file or, when the path starts with
+    `gs://`, in an object of that bucket.
+    """
+
+    def __init__(self, path: str, client: Optional[storage.Client] = None):
+        """
+        Initializes the state file.
+
+        Args:
+            path (str): Local file path, or `gs://<bucket>/<object>` for the bucket.
+            client (Optional[storage.Client]): Storage client used for `gs://` paths.
+
+        Raises:
+            ValueError: If a `gs://` path is given without a client.
+        """
+        self.path = path
+        self.blob = None
+        if path.startswith("gs://"):
+            if client is None:
+                raise ValueError("A storage client is required for gs:// paths")
+            bucket_name, blob_name = path[len("gs://") :].split("/", 1)
+            self.blob = client.bucket(bucket_name).blob(blob_name)
+
+    def load(self) -> dict:
+        """
+        Reads the document, starting from scratch when none was saved yet.
+
+        Returns:
+            dict: The stored document, or an empty dict.
+        """
+        try:
+            if self.blob is not None:
+                if not self.blob.exists():
+                    return {}
+                return json.loads(self.blob.download_as_text())
+            with open(self.path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as error:
+            print(f"Ignoring malformed state file '{self.path}': {error}")
+            return {}
+
+    def save(self, document: dict) -> None:
+        """
+        Writes the document to the local file (atomically) or the bucket.
+
+        Args:
+            document (dict): The document to store.
+        """
+        data = json.dumps(document, indent=4)
+        if self.blob is not None:
+            self.blob.upload_from_string(data, content_type="application/json")
+        else:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                file.write(data)
+            os.replace(tmp_path, self.path)
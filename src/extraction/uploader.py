@@ -0,0 +1,165 @@
+"""
+BucketUploader file
+"""
+
+import json
+import queue
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from google.api_core.exceptions import GoogleAPIError
+from requests.exceptions import RequestException
+from metrics import METRICS
+from sinks import StorageSink, StoredObject
+
+_STOP = object()
+
+
+class BucketUploader:  # pylint: disable=too-many-instance-attributes
+    """
+    A class uploading objects to a storage sink from background threads.
+
+    Objects are handed over through a bounded queue, so callers only block
+    when the queue is full. The ids of the posts an object holds are reported
+    once the object is stored.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        sink: StorageSink,
+        num_workers: int = 2,
+        queue_size: int = 100,
+        max_retries: int = 5,
+        backoff_seconds: float = 1.0,
+        on_uploaded: Optional[Callable[[Tuple[str, ...]], None]] = None,
+    ):
+        """
+        Initializes the uploader and starts its worker threads.
+
+        Args:
+            sink (StorageSink): Where the objects are written, usually a `GCSSink`.
+            num_workers (int): Number of background upload threads.
+            queue_size (int): Maximum number of objects waiting to be uploaded.
+            max_retries (int): Number of retries before an object is given up on.
+            backoff_seconds (float): Initial delay between retries, doubled each time.
+            on_uploaded (Optional[Callable[[Tuple[str, ...]], None]]): Called from
+                the upload threads with the post ids of each stored object.
+        """
+        self.sink = sink
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.on_uploaded = on_uploaded
+        self.failed = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._workers: List[threading.Thread] = [
+            threading.Thread(target=self._run, name=f"uploader-{index}", daemon=True)
+            for index in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def write(self, post_data: dict) -> None:
+        """
+        Queues a post as its own pretty-printed `{id}.json` object.
+
+        Delta records are named `{id}-delta-{timestamp}.json` so that they
+        never replace the full document of the post.
+
+        Args:
+            post_data (dict): The post data, or delta record, to be saved.
+        """
+        with METRICS.time_stage("serialization"):
+            json_data = json.dumps(post_data, ensure_ascii=False, indent=4)
+        name = post_data["id"]
+        if post_data.get("record_type") == "delta":
+            name = f"{name}-delta-{time.time_ns()}"
+        self.submit(
+            StoredObject(
+                f"{name}.json",
+                json_data.encode("utf-8"),
+                "application/json",
+                (post_data["id"],),
+            )
+        )
+
+    def submit(self, stored_object: StoredObject) -> None:
+        """
+        Queues an object for upload, blocking only while the queue is full.
+
+        Args:
+            stored_object (StoredObject): The object to be saved.
+        """
+        self._queue.put(stored_object)
+
+    def flush(self) -> None:
+        """
+        Blocks until every queued object has been uploaded or given up on.
+        """
+        self._queue.join()
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Uploads every queued object, then stops the worker threads.
+
+        Args:
+            timeout (Optional[float]): Maximum time to wait for each worker.
+        """
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join(timeout)
+
+    def __enter__(self) -> "BucketUploader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        """
+        Worker loop: uploads queued objects until the stop sentinel is received.
+        """
+        while True:
+            stored_object = self._queue.get()
+            try:
+                if stored_object is _STOP:
+                    return
+                self._upload_with_retry(stored_object)
+            finally:
+                self._queue.task_done()
+
+    def _upload_with_retry(self, stored_object: StoredObject) -> None:
+        """
+        Uploads an object, retrying with exponential backoff on transient errors,
+        then reports the post ids it holds.
+
+        Args:
+            stored_object (StoredObject): The object to be saved.
+        """
+        delay = self.backoff_seconds
+        for attempt in range(self.max_retries + 1):
+            try:
+                with METRICS.time_stage("upload"):
+                    self.sink.save(stored_object)
+                break
+            except (GoogleAPIError, RequestException, OSError) as error:
+                if attempt == self.max_retries:
+                    print(
+                        f"Giving up on '{stored_object.name}' after "
+                        f"{attempt + 1} attempts: {error}"
+                    )
+                    with self._lock:
+                        self.failed += 1
+                    return
+                print(f"Retrying '{stored_object.name}' in {delay:.1f}s: {error}")
+                time.sleep(delay)
+                delay *= 2
+            except Exception:  # pylint: disable=broad-exception-caught
+                # Already reported by the sink; keep the worker alive
+                with self._lock:
+                    self.failed += 1
+                return
+        if self.on_uploaded is not None and stored_object.post_ids:
+            self.on_uploaded(stored_object.post_ids)
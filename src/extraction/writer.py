@@ -0,0 +1,137 @@
+"""
+RollingNDJSONWriter file
+"""
+
+import gzip
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List
+
+from metrics import METRICS
+from sinks import StoredObject
+from uploader import BucketUploader
+
+try:
+    import zstandard
+except ImportError:  # zstd output is optional
+    zstandard = None
+
+COMPRESSIONS = {
+    "gzip": (".ndjson.gz", "application/gzip"),
+    "zstd": (".ndjson.zst", "application/zstd"),
+}
+
+
+class RollingNDJSONWriter:  # pylint: disable=too-many-instance-attributes
+    """
+    A class packing posts into compressed newline-delimited JSON objects.
+
+    Posts are serialized as one compact JSON line each and buffered until the
+    batch reaches `max_bytes` (uncompressed) or `max_age_seconds`, at which
+    point the batch is compressed and handed to the uploader as one object.
+    """
+
+    def __init__(
+        self,
+        uploader: BucketUploader,
+        prefix: str = "batches",
+        compression: str = "gzip",
+        max_bytes: int = 16 * 1024 * 1024,
+        max_age_seconds: float = 300.0,
+    ):
+        """
+        Initializes the writer.
+
+        Args:
+            uploader (BucketUploader): The uploader the finished batches are queued on.
+            prefix (str): Folder of the bucket the batches are written to.
+            compression (str): Either "gzip" or "zstd" (requires `zstandard`).
+            max_bytes (int): Uncompressed size at which a batch is rolled over.
+            max_age_seconds (float): Age at which a non-empty batch is rolled over.
+
+        Raises:
+            ValueError: If the compression is unknown or unavailable.
+        """
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression '{compression}'")
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package")
+
+        self.uploader = uploader
+        self.prefix = prefix.strip("/")
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._lines: List[bytes] = []
+        self._post_ids: List[str] = []
+        self._size = 0
+        self._opened_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def write(self, post_data: dict) -> None:
+        """
+        Appends a post to the current batch, rolling it over when it is full or old.
+
+        Args:
+            post_data (dict): The post data to be saved.
+        """
+        with METRICS.time_stage("serialization"):
+            line = json.dumps(post_data, ensure_ascii=False, separators=(",", ":"))
+            encoded = line.encode("utf-8") + b"\n"
+        with self._lock:
+            if not self._lines:
+                self._opened_at = time.monotonic()
+            self._lines.append(encoded)
+            self._post_ids.append(post_data["id"])
+            self._size += len(encoded)
+            if self._size >= self.max_bytes or self._is_expired():
+                self._roll()
+
+    def roll_if_expired(self) -> None:
+        """
+        Rolls the current batch over if it is older than `max_age_seconds`.
+        """
+        with self._lock:
+            if self._lines and self._is_expired():
+                self._roll()
+
+    def close(self) -> None:
+        """
+        Rolls over whatever is left in the current batch.
+        """
+        with self._lock:
+            if self._lines:
+                self._roll()
+
+    def _is_expired(self) -> bool:
+        return time.monotonic() - self._opened_at >= self.max_age_seconds
+
+    def _roll(self) -> None:
+        """
+        Compresses the buffered lines and queues them as a single object.
+        Must be called with the lock held.
+        """
+        payload = b"".join(self._lines)
+        with METRICS.time_stage("compression"):
+            if self.compression == "zstd":
+                data = zstandard.ZstdCompressor().compress(payload)
+            else:
+                data = gzip.compress(payload)
+        extension, content_type = COMPRESSIONS[self.compression]
+
+        timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        name = f"{self.prefix}/{timestamp}-{uuid.uuid4().hex[:8]}{extension}"
+        print(
+            f"Rolling batch of {len(self._lines)} posts "
+            f"({self._size} bytes, {len(data)} compressed) to '{name}'."
+        )
+        self.uploader.submit(
+            StoredObject(name, data, content_type, tuple(self._post_ids))
+        )
+
+        self._lines = []
+        self._post_ids = []
+        self._size = 0
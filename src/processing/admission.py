@@ -0,0 +1,100 @@
+"""
+AdmissionController file
+
+Used by the driver only, to size the micro-batches of the streaming job from
+the measured throughput and the files waiting in the source.
+"""
+
+import math
+from typing import List, Optional
+
+
+class AdmissionController:
+    """
+    A class choosing how many files each micro-batch admits.
+
+    The budget of a batch is the number of bytes the job processes in
+    `target_batch_seconds` at its measured throughput, capped by
+    `max_batch_bytes` and by the bytes `max_batch_rows` records take on
+    average. The backlog is then split evenly into as few batches as this
+    budget allows. Before any measurement, only the caps apply.
+
+    Records are the posts and delta records read from the files, as Spark
+    counts its input rows, before their comments are flattened.
+    """
+
+    def __init__(
+        self,
+        max_batch_bytes: int,
+        max_batch_rows: int,
+        target_batch_seconds: float = 60.0,
+        smoothing: float = 0.5,
+    ):
+        """
+        Initializes the controller without any measurement.
+
+        Args:
+            max_batch_bytes (int): Maximum input bytes per batch.
+            max_batch_rows (int): Maximum input records per batch.
+            target_batch_seconds (float): Time a batch should take.
+            smoothing (float): Weight of the latest measurement in the
+                moving averages of the throughput.
+        """
+        self.max_batch_bytes = max_batch_bytes
+        self.max_batch_rows = max_batch_rows
+        self.target_batch_seconds = target_batch_seconds
+        self.smoothing = smoothing
+        self.bytes_per_second: Optional[float] = None
+        self.bytes_per_row: Optional[float] = None
+
+    def finish_round(self, input_bytes: int, input_rows: int, seconds: float) -> None:
+        """
+        Updates the throughput with the batches processed during a round.
+
+        Args:
+            input_bytes (int): Size of the files processed during the round.
+            input_rows (int): Number of records read during the round.
+            seconds (float): Time the round took.
+        """
+        if input_bytes and seconds > 0:
+            self.bytes_per_second = self._average(
+                self.bytes_per_second, input_bytes / seconds
+            )
+        if input_bytes and input_rows:
+            self.bytes_per_row = self._average(
+                self.bytes_per_row, input_bytes / input_rows
+            )
+
+    def batch_bytes(self) -> float:
+        """
+        Computes the input bytes a batch may admit.
+
+        Returns:
+            float: The byte budget of a batch.
+        """
+        budget = float(self.max_batch_bytes)
+        if self.bytes_per_row is not None:
+            budget = min(budget, self.max_batch_rows * self.bytes_per_row)
+        if self.bytes_per_second is not None:
+            budget = min(budget, self.bytes_per_second * self.target_batch_seconds)
+        return max(budget, 1.0)
+
+    def files_per_trigger(self, file_sizes: List[int]) -> int:
+        """
+        Computes the `maxFilesPerTrigger` for the current backlog.
+
+        Args:
+            file_sizes (List[int]): Size in bytes of each file waiting.
+
+        Returns:
+            int: Number of files each batch may admit, at least 1.
+        """
+        if not file_sizes:
+            return 1
+        batches = math.ceil(sum(file_sizes) / self.batch_bytes())
+        return max(1, math.ceil(len(file_sizes) / max(batches, 1)))
+
+    def _average(self, current: Optional[float], measured: float) -> float:
+        if current is None:
+            return measured
+        return self.smoothing * measured + (1 - self.smoothing) * current
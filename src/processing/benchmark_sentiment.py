@@ -0,0 +1,155 @@
+"""
+Sentiment benchmark script
+
+Runs the comments of extracted NDJSON batches through each sentiment backend,
+reports their throughput and checks that they agree with the PyTorch model.
+Example:
+
+    python benchmark_sentiment.py batches/*.ndjson.gz --backends torch onnx --json
+"""
+
+import argparse
+import gzip
+import json
+import sys
+import time
+from typing import Dict, List, Optional
+
+from sentiment import MODEL_NAME, get_sentiment_analyzer, infer
+
+
+def load_comments(paths: List[str], limit: int) -> List[str]:
+    """
+    Reads the non-empty comment bodies of NDJSON batches.
+
+    Args:
+        paths (List[str]): Batch files, gzip-compressed or not.
+        limit (int): Maximum number of comments to read.
+
+    Returns:
+        List[str]: The comment bodies.
+    """
+    texts: List[str] = []
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as file:
+            for line in file:
+                post = json.loads(line)
+                texts.extend(
+                    comment["body"]
+                    for comment in post.get("comments") or []
+                    if comment.get("body")
+                )
+                if len(texts) >= limit:
+                    return texts[:limit]
+    return texts
+
+
+def run_benchmark(  # pylint: disable=too-many-arguments
+    texts: List[str],
+    backends: List[str],
+    *,
+    batch_size: int = 64,
+    token_budget: int = 8192,
+    threads: int = 1,
+    onnx_model_path: Optional[str] = None,
+) -> dict:
+    """
+    Labels the texts with each backend and measures the runs.
+
+    Args:
+        texts (List[str]): The texts to label.
+        backends (List[str]): The backends to compare, "torch" being the reference.
+        batch_size (int): Maximum number of texts per forward pass.
+        token_budget (int): Maximum padded tokens per forward pass.
+        threads (int): Intra-op threads of each backend.
+        onnx_model_path (Optional[str]): Where the ONNX model is cached.
+
+    Returns:
+        dict: Load time, rows/s and, for the other backends, the fraction of
+        texts labelled like the PyTorch model and the largest score gap.
+    """
+    report: Dict[str, dict] = {}
+    predictions: Dict[str, list] = {}
+    for backend in backends:
+        start = time.perf_counter()
+        analyzer = get_sentiment_analyzer(backend, threads, onnx_model_path)
+        loaded = time.perf_counter()
+        predictions[backend] = infer(analyzer, texts, batch_size, token_budget)
+        elapsed = time.perf_counter() - loaded
+        report[backend] = {
+            "load_seconds": round(loaded - start, 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(len(texts) / elapsed, 2),
+        }
+
+    reference = predictions.get("torch")
+    for backend in backends:
+        if reference is None or backend == "torch":
+            continue
+        pairs = [
+            (expected, actual)
+            for expected, actual in zip(reference, predictions[backend])
+            if expected is not None and actual is not None
+        ]
+        report[backend]["agreement"] = round(
+            sum(expected["label"] == actual["label"] for expected, actual in pairs)
+            / max(len(pairs), 1),
+            4,
+        )
+        report[backend]["max_score_diff"] = round(
+            max(
+                (
+                    abs(expected["score"] - actual["score"])
+                    for expected, actual in pairs
+                ),
+                default=0.0,
+            ),
+            4,
+        )
+    return {"model": MODEL_NAME, "rows": len(texts), "backends": report}
+
+
+def main() -> None:
+    """
+    Parses the command line, runs the benchmark and prints its report.
+
+    Exits with status 1 if a backend agrees with PyTorch on less than
+    `--min-agreement` of the texts.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("inputs", nargs="+", help="NDJSON batches (.ndjson[.gz])")
+    parser.add_argument("--limit", type=int, default=5000, help="Comments to label")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx"])
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--token-budget", type=int, default=8192)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--onnx-model-path", help="Where the ONNX model is cached")
+    parser.add_argument("--min-agreement", type=float, default=0.98)
+    parser.add_argument("--json", action="store_true", help="Print a JSON report")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        load_comments(args.inputs, args.limit),
+        args.backends,
+        batch_size=args.batch_size,
+        token_budget=args.token_budget,
+        threads=args.threads,
+        onnx_model_path=args.onnx_model_path,
+    )
+    if args.json:
+        print(json.dumps(report))
+    else:
+        for backend, values in report["backends"].items():
+            for key, value in values.items():
+                print(f"{backend:>8} {key:>18}: {value}")
+
+    if any(
+        values.get("agreement", 1.0) < args.min_agreement
+        for values in report["backends"].values()
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
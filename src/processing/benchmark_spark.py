@@ -0,0 +1,188 @@
+"""
+Processing benchmark script
+
+Runs the Spark job in local mode over a directory of NDJSON batches (see
+`generate_corpus.py`), into Parquet files or driver memory, then reports its
+end-to-end throughput and the time spent in each stage. Example:
+
+    python benchmark_spark.py corpus --sink memory --max-files-per-trigger 5 --json
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Optional
+
+from spark_metrics import BatchListener, JobMetrics
+from spark_sinks import MemorySink, ParquetSink
+from spark_windows import (
+    SENTIMENT_WINDOWS,
+    make_window_writer,
+    parse_windows,
+    start_sentiment_query,
+)
+from spark import (
+    FileSource,
+    InferenceSettings,
+    create_spark_session,
+    make_batch_writer,
+    make_sentiment_udf,
+    run_available,
+)
+
+# Durations Spark reports for each micro-batch, see StreamingQueryProgress
+PROGRESS_STAGES = ("latestOffset", "queryPlanning", "addBatch", "walCommit")
+
+
+def run_benchmark(  # pylint: disable=too-many-arguments,too-many-locals
+    corpus_dir: str,
+    *,
+    sink_type: str = "memory",
+    output_dir: Optional[str] = None,
+    max_files_per_trigger: int = 1,
+    settings: InferenceSettings = InferenceSettings(),
+    master: str = "local[*]",
+    arrow_batch_size: int = 2048,
+    metrics_path: Optional[str] = None,
+) -> dict:
+    """
+    Processes every batch of the corpus once and measures the run.
+
+    Args:
+        corpus_dir (str): Directory holding the `*.ndjson.*` batches.
+        sink_type (str): Either "memory" or "parquet".
+        output_dir (Optional[str]): Where the Parquet tables are written, a
+            temporary directory by default.
+        max_files_per_trigger (int): Maximum number of files per micro-batch.
+        settings (InferenceSettings): How the sentiment model runs.
+        master (str): The Spark master URL.
+        arrow_batch_size (int): Rows handed to the sentiment UDF at once.
+        metrics_path (Optional[str]): JSON-lines file the metrics of each
+            micro-batch are appended to, see `spark_metrics.BatchListener`.
+
+    Returns:
+        dict: Rows written per table, rows/s, and the time spent in each
+        stage of the batches, in the sentiment UDF and in Spark's own steps,
+        and the share of comments answered by each tier of the cascade.
+
+    Raises:
+        ValueError: If the sink type is unknown.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if sink_type == "memory":
+            sink = MemorySink()
+        elif sink_type == "parquet":
+            sink = ParquetSink(output_dir or f"{temp_dir}/tables")
+        else:
+            raise ValueError(f"Unknown sink '{sink_type}'")
+
+        spark = create_spark_session(
+            master=master, gcs=False, arrow_batch_size=arrow_batch_size
+        )
+        # Keep the progress of every batch, not only the last 100
+        spark.conf.set("spark.sql.streaming.numRecentProgressUpdates", "1000000")
+        metrics = JobMetrics(spark.sparkContext)
+        source = FileSource(f"{corpus_dir}/*.ndjson.*")
+        if metrics_path:
+            # The corpus files are not archived, so there is no backlog to list
+            spark.streams.addListener(BatchListener(metrics, path=metrics_path))
+        write_batch = make_batch_writer(
+            sink,
+            make_sentiment_udf(settings, metrics),
+            metrics,
+            f"{temp_dir}/sentiment-staging",
+        )
+        try:
+            start = time.perf_counter()
+            query = run_available(
+                spark,
+                source,
+                write_batch,
+                f"{temp_dir}/checkpoint",
+                max_files_per_trigger,
+            )
+            # The windows the watermark has not passed yet stay in its state
+            start_sentiment_query(
+                spark,
+                f"{temp_dir}/sentiment-staging",
+                make_window_writer(sink, metrics),
+                f"{temp_dir}/sentiment-checkpoint",
+                parse_windows(SENTIMENT_WINDOWS),
+                availableNow=True,
+            ).awaitTermination()
+            elapsed = time.perf_counter() - start
+            progress = query.recentProgress
+            if sink_type == "parquet":
+                rows = {
+                    table: spark.read.parquet(f"{sink.directory}/{table}").count()
+                    for table in (
+                        "posts",
+                        "comments",
+                        "post_updates",
+                        "comment_sentiment_windows",
+                    )
+                    if os.path.isdir(f"{sink.directory}/{table}")
+                }
+            else:
+                rows = {table: len(values) for table, values in sink.tables.items()}
+        finally:
+            spark.stop()
+
+    summary = metrics.summary()
+    return {
+        "batches": len(progress),
+        "records": sum(batch["numInputRows"] for batch in progress),
+        "rows": rows,
+        "elapsed_seconds": round(elapsed, 3),
+        "records_per_second": round(
+            sum(batch["numInputRows"] for batch in progress) / elapsed, 2
+        ),
+        "comments_per_second": round(rows.get("comments", 0) / elapsed, 2),
+        "stages": summary["stages"],
+        "spark_stages_ms": {
+            stage: sum(batch["durationMs"].get(stage, 0) for batch in progress)
+            for stage in PROGRESS_STAGES
+        },
+        "inference": summary["inference"],
+        "cache": summary["cache"],
+        "cascade": summary["cascade"],
+    }
+
+
+def main() -> None:
+    """
+    Parses the command line, runs the benchmark and prints its report.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("corpus_dir", help="Directory holding the NDJSON batches")
+    parser.add_argument("--sink", choices=("memory", "parquet"), default="memory")
+    parser.add_argument("--output-dir", help="Keep the Parquet tables there")
+    parser.add_argument("--max-files-per-trigger", type=int, default=1)
+    parser.add_argument("--master", default="local[*]")
+    parser.add_argument("--arrow-batch-size", type=int, default=2048)
+    parser.add_argument("--metrics-path", help="Append per-batch metrics there")
+    parser.add_argument("--json", action="store_true", help="Print a JSON report")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        args.corpus_dir,
+        sink_type=args.sink,
+        output_dir=args.output_dir,
+        max_files_per_trigger=args.max_files_per_trigger,
+        # INFERENCE_BATCH_SIZE, SENTIMENT_BACKEND... as for the job
+        settings=InferenceSettings.from_env(),
+        master=args.master,
+        arrow_batch_size=args.arrow_batch_size,
+        metrics_path=args.metrics_path,
+    )
+    if args.json:
+        print(json.dumps(report))
+    else:
+        for key, value in report.items():
+            print(f"{key:>20}: {value}")
+
+
+if __name__ == "__main__":
+    main()
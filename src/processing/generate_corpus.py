@@ -0,0 +1,264 @@
+"""
+Synthetic corpus generator script
+
+Writes gzip-compressed NDJSON batches of made-up posts and comments, shaped
+like the ones the extraction uploads (see `schema` in `spark.py`), to run and
+profile the processing job locally. Example:
+
+    python generate_corpus.py corpus --files 20 --posts-per-file 50 --comments-median 30
+"""
+
+import argparse
+import gzip
+import json
+import math
+import os
+import random
+import string
+import time
+from typing import List, NamedTuple
+
+WORDS = (
+    "the a this that it is was are not just really very so too I you they we "
+    "people post thread comment sub reddit game movie code update team time "
+    "year day thing way point idea question answer problem issue fix version "
+    "think know see feel want need like love hate enjoy agree disagree "
+    "good great amazing awesome nice helpful interesting funny cool fine "
+    "bad terrible awful boring wrong broken stupid annoying sad disappointing "
+    "but and or because if when though still also maybe probably actually"
+).split()
+
+# Comments that come back over and over in real threads
+COMMON_COMMENTS = (
+    "[deleted]",
+    "[removed]",
+    "this",
+    "lol",
+    "Thanks!",
+    "Same.",
+    "Source?",
+    "This is the way.",
+)
+
+SUBREDDITS = ("python", "learnpython", "france", "gaming", "movies", "worldnews")
+
+
+class CorpusShape(NamedTuple):
+    """
+    The distributions the corpus is drawn from.
+
+    Thread sizes and text lengths follow log-normal distributions, which
+    match the long tail of Reddit: most threads and comments are short, a
+    few are very long.
+    """
+
+    comments_median: float = 20.0
+    comments_sigma: float = 1.2
+    max_comments: int = 2000
+    words_median: float = 15.0
+    words_sigma: float = 1.0
+    max_words: int = 1000
+    repeat_rate: float = 0.1
+    empty_rate: float = 0.02
+    delta_rate: float = 0.1
+
+
+def lognormal_int(rng: random.Random, median: float, sigma: float, high: int) -> int:
+    """
+    Draws an integer from a log-normal distribution.
+
+    Args:
+        rng (random.Random): The random generator.
+        median (float): Median of the distribution.
+        sigma (float): Standard deviation of its logarithm.
+        high (int): Largest value returned.
+
+    Returns:
+        int: The value, between 0 and `high`.
+    """
+    return min(high, int(rng.lognormvariate(math.log(max(median, 1e-9)), sigma)))
+
+
+def random_id(rng: random.Random) -> str:
+    """
+    Draws a Reddit-like base-36 id.
+
+    Args:
+        rng (random.Random): The random generator.
+
+    Returns:
+        str: The id, 7 characters long.
+    """
+    return "".join(rng.choices(string.ascii_lowercase + string.digits, k=7))
+
+
+def random_text(rng: random.Random, shape: CorpusShape) -> str:
+    """
+    Draws a comment body of a log-normal number of words.
+
+    Args:
+        rng (random.Random): The random generator.
+        shape (CorpusShape): The distribution of the comment lengths.
+
+    Returns:
+        str: The body, at least one word long.
+    """
+    length = max(
+        1, lognormal_int(rng, shape.words_median, shape.words_sigma, shape.max_words)
+    )
+    return " ".join(rng.choices(WORDS, k=length))
+
+
+def generate_comment(
+    rng: random.Random, post_id: str, created_utc: float, shape: CorpusShape
+) -> dict:
+    """
+    Generates a comment as built by the extraction.
+
+    Args:
+        rng (random.Random): The random generator.
+        post_id (str): Id of the post the comment belongs to.
+        created_utc (float): Creation time of the post.
+        shape (CorpusShape): The distributions of the corpus.
+
+    Returns:
+        dict: The comment.
+    """
+    draw = rng.random()
+    if draw < shape.empty_rate:
+        body = ""
+    elif draw < shape.empty_rate + shape.repeat_rate:
+        body = rng.choice(COMMON_COMMENTS)
+    else:
+        body = random_text(rng, shape)
+    return {
+        "id": random_id(rng),
+        "author": f"user_{rng.randrange(100_000)}",
+        "body": body,
+        "score": int(rng.paretovariate(1.5)) - 1,
+        "created_utc": created_utc + rng.uniform(0, 86400),
+        "parent_id": f"t3_{post_id}",
+        "is_submitter": rng.random() < 0.05,
+    }
+
+
+def generate_post(rng: random.Random, now: float, shape: CorpusShape) -> dict:
+    """
+    Generates a post and its comments as built by the extraction.
+
+    Args:
+        rng (random.Random): The random generator.
+        now (float): The current UNIX time.
+        shape (CorpusShape): The distributions of the corpus.
+
+    Returns:
+        dict: The post.
+    """
+    post_id = random_id(rng)
+    subreddit = rng.choice(SUBREDDITS)
+    created_utc = now - rng.uniform(0, 7 * 86400)
+    num_comments = lognormal_int(
+        rng, shape.comments_median, shape.comments_sigma, shape.max_comments
+    )
+    return {
+        "title": random_text(rng, shape._replace(words_median=8, words_sigma=0.5)),
+        "id": post_id,
+        "url": f"https://www.reddit.com/r/{subreddit}/comments/{post_id}/",
+        "score": int(rng.paretovariate(1.2)) - 1,
+        "author": f"user_{rng.randrange(100_000)}",
+        "created_utc": created_utc,
+        "num_comments": num_comments,
+        "selftext": random_text(rng, shape) if rng.random() < 0.5 else "",
+        "subreddit": subreddit,
+        "comments": [
+            generate_comment(rng, post_id, created_utc, shape)
+            for _ in range(num_comments)
+        ],
+    }
+
+
+def generate_corpus(
+    output_dir: str,
+    files: int,
+    posts_per_file: int,
+    shape: CorpusShape = CorpusShape(),
+    seed: int = 0,
+) -> List[str]:
+    """
+    Writes NDJSON batches of synthetic posts.
+
+    Some of the posts already written are repeated as "delta" records, like
+    the extraction does when only their score or comment count moved.
+
+    Args:
+        output_dir (str): The directory the batches are written to.
+        files (int): Number of batches.
+        posts_per_file (int): Number of records per batch.
+        shape (CorpusShape): The distributions of the corpus.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        List[str]: Paths of the batches.
+    """
+    # Synthetic benchmark data, reproducible from its seed
+    rng = random.Random(seed)  # nosec B311
+    now = time.time()
+    os.makedirs(output_dir, exist_ok=True)
+    written: List[dict] = []
+    paths = []
+    for index in range(files):
+        lines = []
+        for _ in range(posts_per_file):
+            if written and rng.random() < shape.delta_rate:
+                post = rng.choice(written)
+                record = {
+                    "id": post["id"],
+                    "record_type": "delta",
+                    "subreddit": post["subreddit"],
+                    "score": post["score"] + rng.randrange(100),
+                    "num_comments": post["num_comments"] + rng.randrange(10),
+                }
+            else:
+                record = generate_post(rng, now, shape)
+                written.append(record)
+            lines.append(json.dumps(record, ensure_ascii=False))
+        path = os.path.join(output_dir, f"synthetic-{index:05d}.ndjson.gz")
+        with gzip.open(path, "wt", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+        paths.append(path)
+    return paths
+
+
+def main() -> None:
+    """
+    Parses the command line and writes the corpus.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("output_dir", help="Directory the batches are written to")
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--posts-per-file", type=int, default=50)
+    parser.add_argument("--comments-median", type=float, default=20.0)
+    parser.add_argument("--comments-sigma", type=float, default=1.2)
+    parser.add_argument("--words-median", type=float, default=15.0)
+    parser.add_argument("--words-sigma", type=float, default=1.0)
+    parser.add_argument("--repeat-rate", type=float, default=0.1)
+    parser.add_argument("--delta-rate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    shape = CorpusShape(
+        comments_median=args.comments_median,
+        comments_sigma=args.comments_sigma,
+        words_median=args.words_median,
+        words_sigma=args.words_sigma,
+        repeat_rate=args.repeat_rate,
+        delta_rate=args.delta_rate,
+    )
+    paths = generate_corpus(
+        args.output_dir, args.files, args.posts_per_file, shape, args.seed
+    )
+    print(f"{len(paths)} batches written to '{args.output_dir}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,530 @@
+"""
+Sentiment inference file
+
+Shipped to the executors with `SparkContext.addPyFile`, so that the Python
+workers import it instead of unpickling it with every task: the model held in
+module state is then loaded once per worker process and reused by every batch.
+"""
+
+from typing import Dict, List, Optional
+
+import pandas as pd
+import torch
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+from sentiment_cache import SentimentCache, cache_key
+from sentiment_client import SentimentClient
+from sentiment_lexicon import score_text
+
+try:
+    from sentiment_onnx import OnnxSentimentModel
+except ImportError:  # the ONNX backend is optional
+    OnnxSentimentModel = None
+
+MODEL_NAME = "distilbert-base-uncased-finetuned-sst-2-english"
+# Commit of the model on the Hugging Face Hub, pinned so that every executor,
+# and every backend, runs the same weights
+MODEL_REVISION = "714eb0f"
+MAX_TOKENS = 512
+
+_sentiment_analyzers: dict = {}
+# The cache, cascade and server client of the worker, built on first use
+_sentiment_state: dict = {}
+
+
+class TorchSentimentModel:  # pylint: disable=too-few-public-methods
+    """
+    The sentiment model run by eager PyTorch, the reference backend.
+    """
+
+    def __init__(
+        self,
+        model_name: str = MODEL_NAME,
+        threads: int = 1,
+        revision: str = MODEL_REVISION,
+    ):
+        """
+        Loads the model and its tokenizer.
+
+        Args:
+            model_name (str): The Hugging Face model name.
+            threads (int): Intra-op threads, 0 for the PyTorch default.
+            revision (str): The commit of the model on the Hugging Face Hub.
+        """
+        if threads:
+            torch.set_num_threads(threads)
+        self.name = f"{model_name}@{revision}"
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, revision=revision)
+        self.model = AutoModelForSequenceClassification.from_pretrained(
+            model_name, revision=revision
+        )
+        self.model.eval()
+
+    def predict(self, input_ids: List[List[int]]) -> List[dict]:
+        """
+        Runs the model on a batch of tokenized texts.
+
+        Args:
+            input_ids (List[List[int]]): The token ids of each text, unpadded.
+
+        Returns:
+            List[dict]: One prediction per text, with a "label" and a "score".
+        """
+        encoded = self.tokenizer.pad({"input_ids": input_ids}, return_tensors="pt")
+        with torch.inference_mode():
+            logits = self.model(**encoded).logits
+        scores, indices = logits.softmax(dim=-1).max(dim=-1)
+        id2label = self.model.config.id2label
+        return [
+            {"label": id2label[int(index)], "score": float(score)}
+            for score, index in zip(scores, indices)
+        ]
+
+
+def get_sentiment_analyzer(
+    backend: str = "torch", threads: int = 1, model_path: Optional[str] = None
+):
+    """
+    Loads the sentiment model on first use and keeps it for the worker's lifetime.
+
+    Args:
+        backend (str): Either "torch" or "onnx" (int8 model run by ONNX
+            Runtime, requires `onnxruntime`).
+        threads (int): Intra-op threads of the backend, 0 for its default.
+        model_path (Optional[str]): Where the ONNX model is cached.
+
+    Returns:
+        TorchSentimentModel | OnnxSentimentModel: The model of the backend.
+
+    Raises:
+        ValueError: If the backend is unknown or its package is missing.
+    """
+    if backend not in _sentiment_analyzers:
+        if backend == "torch":
+            _sentiment_analyzers[backend] = TorchSentimentModel(MODEL_NAME, threads)
+        elif backend == "onnx":
+            if OnnxSentimentModel is None:
+                raise ValueError("The onnx backend requires the 'onnxruntime' package")
+            _sentiment_analyzers[backend] = OnnxSentimentModel(
+                MODEL_NAME, MODEL_REVISION, model_path, threads
+            )
+        else:
+            raise ValueError(f"Unknown sentiment backend '{backend}'")
+    return _sentiment_analyzers[backend]
+
+
+def analyzer_name(backend: str = "torch") -> str:
+    """
+    Names the model of a backend without loading it.
+
+    Args:
+        backend (str): Either "torch" or "onnx".
+
+    Returns:
+        str: The name its predictions are cached under.
+
+    Raises:
+        ValueError: If the backend is unknown or its package is missing.
+    """
+    if backend == "torch":
+        return f"{MODEL_NAME}@{MODEL_REVISION}"
+    if backend == "onnx":
+        if OnnxSentimentModel is None:
+            raise ValueError("The onnx backend requires the 'onnxruntime' package")
+        return OnnxSentimentModel.model_id(MODEL_NAME, MODEL_REVISION)
+    raise ValueError(f"Unknown sentiment backend '{backend}'")
+
+
+class SentimentCascade:  # pylint: disable=too-many-instance-attributes
+    """
+    Answers the texts the lexicon is confident about without the model.
+
+    Short texts whose lexicon confidence reaches `min_confidence` take the
+    lexicon's label; the others go to the model. A fixed share of the texts
+    answered by the lexicon, picked by their hash, also goes to the model to
+    measure how often both agree. The rows handled by each tier are counted
+    for the worker's lifetime.
+    """
+
+    def __init__(
+        self,
+        min_confidence: float = 0.9,
+        max_words: int = 30,
+        sample_rate: float = 0.02,
+    ):
+        """
+        Initializes the cascade with empty counters.
+
+        Args:
+            min_confidence (float): Lexicon confidence, between 0.5 and 1,
+                from which its label is kept.
+            max_words (int): Texts longer than this always go to the model.
+            sample_rate (float): Share of the lexicon answers checked against
+                the model.
+        """
+        self.min_confidence = min_confidence
+        self.max_words = max_words
+        self.sample_rate = sample_rate
+        self.empty = 0
+        self.lexicon = 0
+        self.model = 0
+        self.sampled = 0
+        self.agreed = 0
+
+    def classify(self, texts: Dict[bytes, str]) -> Dict[bytes, dict]:
+        """
+        Runs the lexicon on texts.
+
+        Args:
+            texts (Dict[bytes, str]): The texts, by cache key.
+
+        Returns:
+            Dict[bytes, dict]: The predictions confident enough to keep, with
+            a "label" and a "score" like the model's.
+        """
+        predictions = {}
+        for key, text in texts.items():
+            prediction = score_text(text)
+            if (
+                prediction.words <= self.max_words
+                and prediction.score >= self.min_confidence
+            ):
+                predictions[key] = {
+                    "label": prediction.label,
+                    "score": prediction.score,
+                }
+        return predictions
+
+    def is_sampled(self, key: bytes) -> bool:
+        """
+        Tells whether a lexicon answer is checked against the model.
+
+        Args:
+            key (bytes): The cache key of the text.
+
+        Returns:
+            bool: True for about `sample_rate` of the keys, always the same.
+        """
+        return int.from_bytes(key[:8], "big") < self.sample_rate * 2**64
+
+    def record(
+        self,
+        positions: Dict[bytes, List[int]],
+        lexicon: Dict[bytes, dict],
+        model: Dict[bytes, Optional[dict]],
+    ) -> None:
+        """
+        Counts the rows answered by each tier and the sampled agreements.
+
+        Args:
+            positions (Dict[bytes, List[int]]): The rows of each text.
+            lexicon (Dict[bytes, dict]): The lexicon answers kept.
+            model (Dict[bytes, Optional[dict]]): The model predictions.
+        """
+        for key, key_positions in positions.items():
+            rows = len(key_positions)
+            if key not in lexicon:
+                self.model += rows
+                continue
+            self.lexicon += rows
+            if model.get(key) is not None:
+                self.sampled += rows
+                if model[key]["label"] == lexicon[key]["label"]:
+                    self.agreed += rows
+
+    def counts(self) -> tuple:
+        """
+        Returns:
+            tuple: The empty, lexicon, model, sampled and agreed row counts.
+        """
+        return self.empty, self.lexicon, self.model, self.sampled, self.agreed
+
+
+def get_sentiment_cascade(
+    min_confidence: float = 0.9, max_words: int = 30, sample_rate: float = 0.02
+) -> SentimentCascade:
+    """
+    Creates the cascade on first use and keeps it for the worker's lifetime.
+
+    Args:
+        min_confidence (float): See `SentimentCascade`.
+        max_words (int): See `SentimentCascade`.
+        sample_rate (float): See `SentimentCascade`.
+
+    Returns:
+        SentimentCascade: The cascade of the worker.
+    """
+    if "cascade" not in _sentiment_state:
+        _sentiment_state["cascade"] = SentimentCascade(
+            min_confidence, max_words, sample_rate
+        )
+    return _sentiment_state["cascade"]
+
+
+def get_sentiment_cache(
+    max_entries: int = 100_000, path: Optional[str] = None
+) -> SentimentCache:
+    """
+    Opens the prediction cache on first use and keeps it for the worker's lifetime.
+
+    Args:
+        max_entries (int): Number of predictions kept in memory.
+        path (Optional[str]): Local path of the persistent SQLite cache, or
+            None to keep the cache in memory only.
+
+    Returns:
+        SentimentCache: The cache of the worker.
+    """
+    if "cache" not in _sentiment_state:
+        _sentiment_state["cache"] = SentimentCache(max_entries, path)
+    return _sentiment_state["cache"]
+
+
+def get_sentiment_client(
+    socket_path: str, server_args: Optional[List[str]] = None
+) -> SentimentClient:
+    """
+    Creates the inference server client on first use and keeps it for the
+    worker's lifetime.
+
+    Args:
+        socket_path (str): The socket the server of the node listens on.
+        server_args (Optional[List[str]]): See `SentimentClient`.
+
+    Returns:
+        SentimentClient: The client of the worker.
+    """
+    if "client" not in _sentiment_state:
+        _sentiment_state["client"] = SentimentClient(socket_path, server_args)
+    return _sentiment_state["client"]
+
+
+def to_label(result: dict) -> str:
+    """
+    Maps a model prediction to the labels stored in BigQuery.
+
+    Args:
+        result (dict): The prediction, with a "label" and a "score".
+
+    Returns:
+        str: "très positif", "positif", "négatif", "très négatif" or "neutre".
+    """
+    if result["label"] == "POSITIVE":
+        if result["score"] > 0.8:
+            return "très positif"
+        return "positif"
+    if result["label"] == "NEGATIVE":
+        if result["score"] > 0.8:
+            return "très négatif"
+        return "négatif"
+    return "neutre"
+
+
+def plan_batches(
+    lengths: List[int], token_budget: int, max_batch_size: int
+) -> List[List[int]]:
+    """
+    Groups texts of similar length into batches bounded by a token budget.
+
+    Texts are sorted by length, so each batch is padded to a length close to
+    that of all its members, and a batch is closed once padding it to its
+    longest text would exceed `token_budget` tokens or `max_batch_size` rows.
+
+    Args:
+        lengths (List[int]): Token count of each text.
+        token_budget (int): Maximum padded tokens per batch.
+        max_batch_size (int): Maximum number of texts per batch.
+
+    Returns:
+        List[List[int]]: Positions of the texts in each batch.
+    """
+    batches: List[List[int]] = []
+    batch: List[int] = []
+    for position in sorted(range(len(lengths)), key=lengths.__getitem__):
+        # Sorted ascending, so the new text is the longest of the batch
+        padded = (len(batch) + 1) * lengths[position]
+        if batch and (padded > token_budget or len(batch) >= max_batch_size):
+            batches.append(batch)
+            batch = []
+        batch.append(position)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def infer(
+    analyzer, texts: List[str], batch_size: int, token_budget: int
+) -> List[Optional[dict]]:
+    """
+    Runs the model on texts, batched by token length.
+
+    The texts are tokenized, truncated to the model's 512 tokens, and grouped
+    by length into batches of at most `token_budget` padded tokens (see
+    `plan_batches`). If a batch fails, its texts are retried one by one.
+
+    Args:
+        analyzer (TorchSentimentModel | OnnxSentimentModel): The model.
+        texts (List[str]): The non-empty texts.
+        batch_size (int): Maximum number of texts per forward pass.
+        token_budget (int): Maximum padded tokens per forward pass.
+
+    Returns:
+        List[Optional[dict]]: One prediction per text, in the same order, or
+        None for the texts that still failed alone.
+    """
+    input_ids = analyzer.tokenizer(texts, truncation=True, max_length=MAX_TOKENS)[
+        "input_ids"
+    ]
+    truncated = sum(len(ids) >= MAX_TOKENS for ids in input_ids)
+    if truncated:
+        print(f"Attention: {truncated} textes tronqués à {MAX_TOKENS} tokens")
+
+    results: List[Optional[dict]] = [None] * len(texts)
+    lengths = [len(ids) for ids in input_ids]
+    for batch in plan_batches(lengths, max(token_budget, MAX_TOKENS), batch_size):
+        try:
+            predictions = analyzer.predict([input_ids[index] for index in batch])
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            print(f"Erreur lors de l'analyse du lot: {str(e)}")
+            predictions = [_predict_one(analyzer, input_ids[index]) for index in batch]
+        for index, prediction in zip(batch, predictions):
+            results[index] = prediction
+    return results
+
+
+def analyze_texts(  # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+    texts: pd.Series,
+    batch_size: int = 64,
+    token_budget: int = 8192,
+    cache: Optional[SentimentCache] = None,
+    backend: str = "torch",
+    threads: int = 1,
+    model_path: Optional[str] = None,
+    cascade: Optional[SentimentCascade] = None,
+    server: Optional[SentimentClient] = None,
+) -> pd.DataFrame:
+    """
+    Labels the sentiment of a batch of texts.
+
+    Empty texts are labelled "neutral". The others are deduplicated on their
+    normalized form and, with a cascade, first scored by the lexicon. Only
+    the texts left (and the lexicon answers sampled) are looked up in the
+    cache, and only the misses are run through the model (see `infer`): the
+    one of the node's inference server if given, else the worker's own,
+    loaded on first need. Their predictions are then cached and the labels
+    put back in the order of the input. Texts the model failed on are
+    labelled "neutre" and not cached.
+
+    Args:
+        texts (pd.Series): The texts, as received by a pandas UDF.
+        batch_size (int): Maximum number of texts per forward pass.
+        token_budget (int): Maximum padded tokens per forward pass.
+        cache (Optional[SentimentCache]): Cache of earlier predictions, kept
+            apart for each backend since their scores differ slightly.
+        backend (str): See `get_sentiment_analyzer`.
+        threads (int): See `get_sentiment_analyzer`.
+        model_path (Optional[str]): See `get_sentiment_analyzer`.
+        cascade (Optional[SentimentCascade]): The lexicon tier, or None to
+            run every text through the model.
+        server (Optional[SentimentClient]): The client of the node's
+            inference server, running the same backend. The worker loads its
+            own model only if the server cannot be reached.
+
+    Returns:
+        pd.DataFrame: The "label" of each text, in the same order, and the
+        "score" (confidence) of the prediction it comes from, None for the
+        empty texts and those the model failed on.
+    """
+    namespace = analyzer_name(backend)
+    labels: List[Optional[str]] = [None] * len(texts)
+    positions: Dict[bytes, List[int]] = {}
+    unique_texts: Dict[bytes, str] = {}
+    for position, text in enumerate(texts):
+        if not isinstance(text, str) or not text:
+            labels[position] = "neutral"
+        else:
+            key = cache_key(text, namespace)
+            positions.setdefault(key, []).append(position)
+            unique_texts.setdefault(key, text)
+
+    lexicon: Dict[bytes, dict] = {}
+    if cascade is not None:
+        cascade.empty += labels.count("neutral")
+        lexicon = cascade.classify(unique_texts)
+    needed = {
+        key: text
+        for key, text in unique_texts.items()
+        if key not in lexicon or cascade.is_sampled(key)
+    }
+
+    predictions: Dict[bytes, Optional[dict]] = {}
+    if cache is not None and needed:
+        predictions.update(
+            (key, {"label": label, "score": score})
+            for key, (label, score) in cache.get_many(needed).items()
+        )
+    missing = {key: text for key, text in needed.items() if key not in predictions}
+    if missing:
+        results = _run_model(
+            list(missing.values()),
+            server,
+            (backend, threads, model_path),
+            batch_size,
+            token_budget,
+        )
+        predictions.update(_store(dict(zip(missing, results)), cache))
+    if cascade is not None:
+        cascade.record(positions, lexicon, predictions)
+        predictions.update(lexicon)
+
+    scores: List[Optional[float]] = [None] * len(texts)
+    for key, key_positions in positions.items():
+        prediction = predictions[key]
+        label = to_label(prediction) if prediction is not None else "neutre"
+        for position in key_positions:
+            labels[position] = label
+            scores[position] = prediction["score"] if prediction is not None else None
+    return pd.DataFrame({"label": labels, "score": scores}, index=texts.index)
+
+
+def _run_model(
+    texts: List[str],
+    server: Optional[SentimentClient],
+    analyzer_args: tuple,
+    batch_size: int,
+    token_budget: int,
+) -> List[Optional[dict]]:
+    """
+    Runs the model on texts, through the node's inference server if any.
+    """
+    if server is not None:
+        try:
+            return server.infer(texts)
+        except (OSError, RuntimeError) as e:
+            print(f"Serveur d'inférence indisponible, modèle local utilisé: {str(e)}")
+    analyzer = get_sentiment_analyzer(*analyzer_args)
+    return infer(analyzer, texts, batch_size, token_budget)
+
+
+def _store(
+    results: Dict[bytes, Optional[dict]], cache: Optional[SentimentCache]
+) -> Dict[bytes, Optional[dict]]:
+    """
+    Caches the predictions that succeeded.
+    """
+    if cache is not None:
+        cache.put_many(
+            {
+                key: (result["label"], result["score"])
+                for key, result in results.items()
+                if result is not None
+            }
+        )
+    return results
+
+
+def _predict_one(analyzer, input_ids: List[int]) -> Optional[dict]:
+    try:
+        return analyzer.predict([input_ids])[0]
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        print(f"Erreur lors de l'analyse: {str(e)}")
+        return None
@@ -0,0 +1,170 @@
+"""
+SentimentCache file
+
+Shipped to the executors along with `sentiment.py`. Reddit comments repeat a
+lot ("[deleted]", "this", "lol", copypastas...), so predictions are cached by
+a hash of the normalized text: first in a per-worker LRU, then optionally in
+a SQLite file shared by the Python workers of a machine and kept across runs.
+"""
+
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+Prediction = Tuple[str, float]
+
+
+def normalize(text: str) -> str:
+    """
+    Normalizes a text the way the uncased tokenizer would see it.
+
+    Args:
+        text (str): The raw text.
+
+    Returns:
+        str: The lowercased text with its whitespace collapsed.
+    """
+    return " ".join(text.split()).lower()
+
+
+def cache_key(text: str, namespace: str = "") -> bytes:
+    """
+    Computes the cache key of a text.
+
+    Args:
+        text (str): The raw text.
+        namespace (str): Identifies the model, so that its predictions are not
+            mixed with those of another one.
+
+    Returns:
+        bytes: A 16-byte digest of the namespace and the normalized text.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(namespace.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize(text).encode("utf-8"))
+    return digest.digest()
+
+
+class SentimentCache:
+    """
+    A two-tier cache of model predictions, each a `(label, score)` pair.
+
+    Lookups go to the in-memory LRU first; its misses are then looked up in
+    the SQLite file, if any, and the hits found there are promoted to the LRU.
+    New predictions are written to both tiers. Errors of the SQLite file are
+    printed and treated as misses, the cache never fails a batch.
+    """
+
+    def __init__(self, max_entries: int = 100_000, path: Optional[str] = None):
+        """
+        Initializes the cache.
+
+        Args:
+            max_entries (int): Number of predictions kept in memory.
+            path (Optional[str]): Local path of the SQLite file, created if
+                missing, or None to keep the cache in memory only.
+        """
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[bytes, Prediction]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        if path:
+            self._connection = sqlite3.connect(
+                path, timeout=30, check_same_thread=False
+            )
+            # Several Python workers of the same machine share the file
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS predictions (
+                    key BLOB PRIMARY KEY, label TEXT NOT NULL, score REAL NOT NULL
+                ) WITHOUT ROWID
+                """)
+            self._connection.commit()
+
+    def get_many(self, keys: Iterable[bytes]) -> Dict[bytes, Prediction]:
+        """
+        Looks up the predictions of several texts.
+
+        The hit and miss counters are updated once per distinct key.
+
+        Args:
+            keys (Iterable[bytes]): The cache keys.
+
+        Returns:
+            Dict[bytes, Prediction]: The cached predictions, by key.
+        """
+        keys = list(dict.fromkeys(keys))
+        found: Dict[bytes, Prediction] = {}
+        with self._lock:
+            for key in keys:
+                prediction = self._entries.get(key)
+                if prediction is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = prediction
+        missing = [key for key in keys if key not in found]
+        if missing and self._connection is not None:
+            stored = self._load(missing)
+            self._remember(stored)
+            found.update(stored)
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, predictions: Dict[bytes, Prediction]) -> None:
+        """
+        Stores new predictions in both tiers.
+
+        Args:
+            predictions (Dict[bytes, Prediction]): The predictions, by key.
+        """
+        if not predictions:
+            return
+        self._remember(predictions)
+        if self._connection is None:
+            return
+        try:
+            with self._lock, self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO predictions (key, label, score) "
+                    "VALUES (?, ?, ?)",
+                    (
+                        (key, label, score)
+                        for key, (label, score) in predictions.items()
+                    ),
+                )
+        except sqlite3.Error as e:
+            print(f"Erreur lors de l'écriture du cache '{self.path}': {str(e)}")
+
+    def _load(self, keys: list) -> Dict[bytes, Prediction]:
+        stored: Dict[bytes, Prediction] = {}
+        try:
+            with self._lock:
+                # SQLite limits the number of parameters of a query
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start : start + 500]
+                    placeholders = ", ".join("?" * len(chunk))
+                    # Only "?" placeholders are formatted in, the keys are bound
+                    query = (
+                        "SELECT key, label, score FROM predictions "  # nosec B608
+                        f"WHERE key IN ({placeholders})"
+                    )
+                    rows = self._connection.execute(query, chunk).fetchall()
+                    stored.update((key, (label, score)) for key, label, score in rows)
+        except sqlite3.Error as e:
+            print(f"Erreur lors de la lecture du cache '{self.path}': {str(e)}")
+        return stored
+
+    def _remember(self, predictions: Dict[bytes, Prediction]) -> None:
+        with self._lock:
+            self._entries.update(predictions)
+            for key in predictions:
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,224 @@
+"""
+Sentiment client file
+
+Sends texts to the inference server of the node (see `sentiment_server.py`)
+over a UNIX socket, so that the Python workers of a node share one model
+instead of loading one each. Shipped to the executors with
+`SparkContext.addPyFile`.
+"""
+
+import fcntl
+import json
+import os
+import socket
+import struct
+
+# Only used to start sentiment_server.py with the current interpreter
+import subprocess  # nosec B404
+import sys
+import time
+from typing import List, Optional
+
+# Messages are JSON objects preceded by their length
+HEADER = struct.Struct(">I")
+SERVER_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "sentiment_server.py"
+)
+
+
+def send_message(connection: socket.socket, message: dict) -> None:
+    """
+    Sends a message on a connection.
+
+    Args:
+        connection (socket.socket): The connection.
+        message (dict): The message, serializable to JSON.
+    """
+    payload = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    connection.sendall(HEADER.pack(len(payload)) + payload)
+
+
+def receive_message(connection: socket.socket) -> Optional[dict]:
+    """
+    Receives a message from a connection.
+
+    Args:
+        connection (socket.socket): The connection.
+
+    Returns:
+        Optional[dict]: The message, or None if the connection was closed
+        before a new one.
+
+    Raises:
+        ConnectionError: If the connection was closed in the middle of one.
+    """
+    header = _receive_exactly(connection, HEADER.size)
+    if header is None:
+        return None
+    payload = _receive_exactly(connection, HEADER.unpack(header)[0])
+    if payload is None:
+        raise ConnectionError("Connection closed in the middle of a message")
+    return json.loads(payload)
+
+
+def _receive_exactly(connection: socket.socket, size: int) -> Optional[bytes]:
+    chunks = []
+    while size:
+        chunk = connection.recv(min(size, 1 << 20))
+        if not chunk:
+            if chunks:
+                raise ConnectionError("Connection closed in the middle of a message")
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def connect(socket_path: str, timeout: float) -> socket.socket:
+    """
+    Opens a connection to the server.
+
+    Args:
+        socket_path (str): The socket the server listens on.
+        timeout (float): Seconds an operation on the connection may take.
+
+    Returns:
+        socket.socket: The connection.
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(timeout)
+    try:
+        connection.connect(socket_path)
+    except OSError:
+        connection.close()
+        raise
+    return connection
+
+
+def start_server(socket_path: str, server_args: List[str], timeout: float) -> None:
+    """
+    Starts the server of the node, unless another worker already has.
+
+    The workers of a node take turns on a lock file next to the socket: the
+    first one starts the server in the background, logging to
+    `<socket>.log`, and waits until it accepts connections. The others then
+    find it running.
+
+    Args:
+        socket_path (str): The socket the server listens on.
+        server_args (List[str]): The command-line options of the server.
+        timeout (float): Seconds to wait for the server to load its model.
+
+    Raises:
+        RuntimeError: If the server stopped or did not start in time.
+    """
+    with open(f"{socket_path}.lock", "w", encoding="utf-8") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            connect(socket_path, timeout).close()
+            return
+        except OSError:
+            pass
+        print(f"Démarrage du serveur d'inférence sur '{socket_path}'")
+        with open(f"{socket_path}.log", "a", encoding="utf-8") as log:
+            # The argv is fixed: this interpreter, the server script next to
+            # this file and the job's own options, without a shell
+            # pylint: disable-next=consider-using-with
+            process = subprocess.Popen(  # nosec B603
+                [
+                    sys.executable,
+                    "-u",
+                    SERVER_SCRIPT,
+                    "--socket",
+                    socket_path,
+                    *server_args,
+                ],
+                cwd=os.path.dirname(SERVER_SCRIPT),
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(
+                    f"The inference server stopped, see '{socket_path}.log'"
+                )
+            try:
+                connect(socket_path, timeout).close()
+                return
+            except OSError:
+                time.sleep(0.5)
+        raise RuntimeError(f"The inference server did not start in {timeout:.0f}s")
+
+
+class SentimentClient:
+    """
+    A connection to the inference server of the node, opened on first use.
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        server_args: Optional[List[str]] = None,
+        timeout: float = 300.0,
+    ):
+        """
+        Initializes the client.
+
+        Args:
+            socket_path (str): The socket the server listens on.
+            server_args (Optional[List[str]]): The options to start the
+                server with if none answers, or None to expect it running.
+            timeout (float): Seconds a request, or starting the server, may
+                take.
+        """
+        self.socket_path = socket_path
+        self.server_args = server_args
+        self.timeout = timeout
+        self._connection: Optional[socket.socket] = None
+
+    def infer(self, texts: List[str]) -> List[Optional[dict]]:
+        """
+        Runs the server's model on texts.
+
+        Args:
+            texts (List[str]): The non-empty texts.
+
+        Returns:
+            List[Optional[dict]]: One prediction per text, in the same order,
+            or None for the texts the model failed on.
+
+        Raises:
+            OSError: If the server cannot be reached; the connection is then
+                reopened by the next call.
+            RuntimeError: If the server had to be started and failed to.
+        """
+        if self._connection is None:
+            self._connection = self._connect()
+        try:
+            send_message(self._connection, {"texts": texts})
+            response = receive_message(self._connection)
+            if response is None:
+                raise ConnectionError("The inference server closed the connection")
+        except OSError:
+            self.close()
+            raise
+        return response["predictions"]
+
+    def close(self) -> None:
+        """
+        Closes the connection, if open.
+        """
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _connect(self) -> socket.socket:
+        try:
+            return connect(self.socket_path, self.timeout)
+        except OSError:
+            if self.server_args is None:
+                raise
+        start_server(self.socket_path, self.server_args, self.timeout)
+        return connect(self.socket_path, self.timeout)
@@ -0,0 +1,124 @@
+"""
+Sentiment lexicon file
+
+A word-list classifier scoring a comment in microseconds, used as the first
+tier of the sentiment cascade: the comments it is confident about skip the
+transformer. Shipped to the executors with `SparkContext.addPyFile`.
+"""
+
+import math
+import re
+from typing import List, NamedTuple
+
+# Weight of each polarized word, 2 for the strong ones
+POSITIVE_WORDS = {
+    **dict.fromkeys(
+        (
+            "good great nice cool enjoy enjoyed fun funny "
+            "helpful useful interesting glad happy thanks thank agree agreed "
+            "beautiful better best win wins won fair "
+            "recommend solid clean smart impressive congrats congratulations "
+            "bien bon bonne merci génial sympa"
+        ).split(),
+        1.0,
+    ),
+    **dict.fromkeys(
+        (
+            "love loved loving amazing awesome excellent fantastic wonderful "
+            "perfect brilliant incredible outstanding superb masterpiece "
+            "adore magnifique parfait incroyable"
+        ).split(),
+        2.0,
+    ),
+}
+NEGATIVE_WORDS = {
+    **dict.fromkeys(
+        (
+            "bad wrong boring annoying sad disappointing disappointed "
+            "ugly worse poor fail failed fails broken buggy "
+            "stupid dumb sucks useless pointless "
+            "unfortunately angry mad lame mauvais nul triste dommage bof"
+        ).split(),
+        1.0,
+    ),
+    **dict.fromkeys(
+        (
+            "hate hated terrible awful horrible worst disgusting pathetic "
+            "garbage trash atrocious disaster nulle catastrophe"
+        ).split(),
+        2.0,
+    ),
+}
+NEGATIONS = frozenset(
+    "not no never nothing nobody neither nor without isn't wasn't aren't "
+    "don't doesn't didn't can't couldn't won't wouldn't shouldn't ne pas "
+    "jamais".split()
+)
+INTENSIFIERS = frozenset("very really so too extremely super truly très".split())
+# A negation flips the polarized words up to that many words after it
+NEGATION_SCOPE = 3
+
+_WORD = re.compile(r"[\w']+")
+
+
+class LexiconPrediction(NamedTuple):
+    """
+    The lexicon's guess for a text, in the format of the transformer's.
+    """
+
+    label: str
+    score: float
+    words: int
+
+
+def polarity(words: List[str]) -> float:
+    """
+    Sums the weights of the polarized words of a text.
+
+    Negated words count with the opposite sign, and words right after an
+    intensifier count one and a half times.
+
+    Args:
+        words (List[str]): The lowercase words of the text.
+
+    Returns:
+        float: Positive for a positive text, negative for a negative one.
+    """
+    total = 0.0
+    negated_until = -1
+    for position, word in enumerate(words):
+        if word in NEGATIONS:
+            negated_until = position + NEGATION_SCOPE
+            continue
+        weight = POSITIVE_WORDS.get(word, 0.0) - NEGATIVE_WORDS.get(word, 0.0)
+        if not weight:
+            continue
+        if position and words[position - 1] in INTENSIFIERS:
+            weight *= 1.5
+        if position <= negated_until:
+            weight = -weight
+        total += weight
+    return total
+
+
+def score_text(text: str) -> LexiconPrediction:
+    """
+    Guesses the sentiment of a text from its words.
+
+    The confidence grows with the polarity of the text and is 0.5, as good
+    as a coin toss, when it has no polarized word or as many of each side.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        LexiconPrediction: "POSITIVE" or "NEGATIVE" with a confidence between
+        0.5 and 1, and the number of words of the text.
+    """
+    words = _WORD.findall(text.lower())
+    total = polarity(words)
+    return LexiconPrediction(
+        "NEGATIVE" if total < 0 else "POSITIVE",
+        0.5 + 0.5 * math.tanh(abs(total) / 2),
+        len(words),
+    )
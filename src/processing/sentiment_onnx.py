@@ -0,0 +1,248 @@
+"""
+ONNX Runtime sentiment backend file
+
+Shipped to the executors along with `sentiment.py`. The model is exported
+once to ONNX with its weights dynamically quantized to int8, and the
+artifact is cached on disk, so that every later worker only opens an ONNX
+Runtime session on it, which runs much faster on CPU than eager PyTorch.
+"""
+
+import os
+import tempfile
+from typing import List, Optional
+
+import numpy as np
+import onnxruntime
+import torch
+from onnxruntime.quantization import QuantType, quantize_dynamic
+from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+
+# Checked against the PyTorch model when the artifact is exported
+PARITY_TEXTS = [
+    "I love this, thank you so much!",
+    "This is the worst thing I have ever read.",
+    "Not bad at all, actually pretty good.",
+    "I don't think this is a good idea.",
+    "Absolutely fantastic work, well done.",
+    "I'm so disappointed in this community.",
+]
+
+
+def default_model_path(model_name: str, revision: str) -> str:
+    """
+    Computes where the quantized model is cached by default.
+
+    Args:
+        model_name (str): The Hugging Face model name.
+        revision (str): The commit of the model on the Hugging Face Hub.
+
+    Returns:
+        str: A path in the Hugging Face cache directory.
+    """
+    cache_dir = os.getenv("HF_HOME", os.path.expanduser("~/.cache/huggingface"))
+    file_name = f"{model_name.replace('/', '--')}-{revision}-int8.onnx"
+    return os.path.join(cache_dir, "onnx", file_name)
+
+
+def create_session(model_path: str, threads: int) -> onnxruntime.InferenceSession:
+    """
+    Opens an ONNX Runtime session on the CPU.
+
+    Args:
+        model_path (str): Path of the ONNX model.
+        threads (int): Intra-op threads, 0 for the ONNX Runtime default.
+
+    Returns:
+        onnxruntime.InferenceSession: The session.
+    """
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return onnxruntime.InferenceSession(
+        model_path, options, providers=["CPUExecutionProvider"]
+    )
+
+
+def run_session(
+    session: onnxruntime.InferenceSession, tokenizer, id2label: dict, input_ids
+) -> List[dict]:
+    """
+    Runs an ONNX session on a batch of tokenized texts.
+
+    Args:
+        session (onnxruntime.InferenceSession): The session.
+        tokenizer (transformers.PreTrainedTokenizer): Tokenizer used to pad the batch.
+        id2label (dict): Label of each output class.
+        input_ids (List[List[int]]): The token ids of each text, unpadded.
+
+    Returns:
+        List[dict]: One prediction per text, with a "label" and a "score".
+    """
+    encoded = tokenizer.pad({"input_ids": input_ids}, return_tensors="np")
+    (logits,) = session.run(
+        ["logits"],
+        {
+            "input_ids": encoded["input_ids"].astype(np.int64),
+            "attention_mask": encoded["attention_mask"].astype(np.int64),
+        },
+    )
+    exponentials = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    probabilities = exponentials / exponentials.sum(axis=-1, keepdims=True)
+    return [
+        {"label": id2label[int(index)], "score": float(row[index])}
+        for row, index in zip(probabilities, probabilities.argmax(axis=-1))
+    ]
+
+
+def check_parity(model, tokenizer, session: onnxruntime.InferenceSession) -> float:
+    """
+    Compares the labels of an ONNX session with those of the PyTorch model.
+
+    Args:
+        model (transformers.PreTrainedModel): The PyTorch model.
+        tokenizer (transformers.PreTrainedTokenizer): Its tokenizer.
+        session (onnxruntime.InferenceSession): A session on the exported model.
+
+    Returns:
+        float: The fraction of `PARITY_TEXTS` both label the same.
+    """
+    input_ids = tokenizer(PARITY_TEXTS)["input_ids"]
+    encoded = tokenizer.pad({"input_ids": input_ids}, return_tensors="pt")
+    with torch.inference_mode():
+        expected = model(**encoded)[0].argmax(dim=-1).tolist()
+    id2label = model.config.id2label
+    actual = run_session(session, tokenizer, id2label, input_ids)
+    return sum(
+        id2label[index] == prediction["label"]
+        for index, prediction in zip(expected, actual)
+    ) / len(PARITY_TEXTS)
+
+
+def export_quantized_model(
+    model_name: str, revision: str, model_path: str, min_agreement: float = 0.99
+) -> str:
+    """
+    Exports the model to ONNX with int8 weights, unless it already was.
+
+    The model is written to a temporary file first and moved in place once
+    quantized, so that workers exporting at the same time never open a
+    partial file. Before that, its labels are compared with those of the
+    PyTorch model on `PARITY_TEXTS`.
+
+    Args:
+        model_name (str): The Hugging Face model name.
+        revision (str): The commit of the model on the Hugging Face Hub.
+        model_path (str): Where the quantized model is cached.
+        min_agreement (float): Minimum fraction of `PARITY_TEXTS` on which
+            both models must agree.
+
+    Returns:
+        str: The path of the quantized model.
+
+    Raises:
+        RuntimeError: If the quantized model disagrees with the PyTorch one.
+    """
+    if os.path.exists(model_path):
+        return model_path
+    directory = os.path.dirname(os.path.abspath(model_path))
+    os.makedirs(directory, exist_ok=True)
+    print(f"Export du modèle '{model_name}@{revision}' vers '{model_path}'")
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name, revision=revision)
+    model = AutoModelForSequenceClassification.from_pretrained(
+        model_name, revision=revision
+    ).eval()
+    model.config.return_dict = False
+    sample = tokenizer(PARITY_TEXTS[:2], padding=True, return_tensors="pt")
+    with tempfile.TemporaryDirectory(dir=directory) as temp_dir:
+        exported_path = os.path.join(temp_dir, "model.onnx")
+        quantized_path = os.path.join(temp_dir, "model.int8.onnx")
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            exported_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"},
+            },
+            opset_version=17,
+        )
+        quantize_dynamic(exported_path, quantized_path, weight_type=QuantType.QInt8)
+
+        agreement = check_parity(model, tokenizer, create_session(quantized_path, 0))
+        if agreement < min_agreement:
+            raise RuntimeError(
+                f"The quantized model agrees with PyTorch on {agreement:.0%} "
+                f"of the parity texts, below {min_agreement:.0%}"
+            )
+        os.replace(quantized_path, model_path)
+    return model_path
+
+
+class OnnxSentimentModel:  # pylint: disable=too-few-public-methods
+    """
+    The sentiment model run by ONNX Runtime with int8 weights.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        revision: str,
+        model_path: Optional[str] = None,
+        threads: int = 1,
+    ):
+        """
+        Exports the model if needed and opens a session on it.
+
+        Args:
+            model_name (str): The Hugging Face model name.
+            revision (str): The commit of the model on the Hugging Face Hub,
+                the one the PyTorch backend runs.
+            model_path (Optional[str]): Where the quantized model is cached,
+                see `default_model_path` for the default.
+            threads (int): Intra-op threads, 0 for the ONNX Runtime default.
+        """
+        self.name = self.model_id(model_name, revision)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, revision=revision)
+        self.id2label = AutoConfig.from_pretrained(
+            model_name, revision=revision
+        ).id2label
+        self.session = create_session(
+            export_quantized_model(
+                model_name,
+                revision,
+                model_path or default_model_path(model_name, revision),
+            ),
+            threads,
+        )
+
+    @staticmethod
+    def model_id(model_name: str, revision: str) -> str:
+        """
+        Names the quantized model, apart from the PyTorch one in the cache.
+
+        Args:
+            model_name (str): The Hugging Face model name.
+            revision (str): The commit of the model on the Hugging Face Hub.
+
+        Returns:
+            str: The name.
+        """
+        return f"{model_name}@{revision}:onnx-int8"
+
+    def predict(self, input_ids: List[List[int]]) -> List[dict]:
+        """
+        Runs the model on a batch of tokenized texts.
+
+        Args:
+            input_ids (List[List[int]]): The token ids of each text, unpadded.
+
+        Returns:
+            List[dict]: One prediction per text, with a "label" and a "score".
+        """
+        return run_session(self.session, self.tokenizer, self.id2label, input_ids)
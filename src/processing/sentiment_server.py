@@ -0,0 +1,227 @@
+"""
+Sentiment inference server script
+
+Holds one sentiment model for a whole node and serves the Spark Python
+workers of the node over a UNIX socket (see `sentiment_client.py`). The
+texts of requests arriving together are merged into one batch, run once it
+holds `--max-batch-texts` texts or its first request has waited
+`--max-latency-ms`. Example:
+
+    python sentiment_server.py --socket /opt/bitnami/spark/cache/sentiment.sock --threads 2
+"""
+
+import argparse
+import os
+import queue
+import socketserver
+import threading
+import time
+from typing import List, Optional
+
+from sentiment import get_sentiment_analyzer, infer
+from sentiment_client import receive_message, send_message
+
+
+class _Request:  # pylint: disable=too-few-public-methods
+    """
+    Texts waiting for their predictions.
+    """
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.predictions: List[Optional[dict]] = []
+        self.done = threading.Event()
+        # Set once the caller stopped waiting, so the batches skip it
+        self.cancelled = False
+
+
+class DynamicBatcher:  # pylint: disable=too-many-instance-attributes
+    """
+    Merges the requests of concurrent connections into batches for the model.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        analyzer,
+        max_batch_texts: int = 512,
+        max_latency: float = 0.02,
+        batch_size: int = 64,
+        token_budget: int = 8192,
+        request_timeout: float = 240.0,
+    ):
+        """
+        Initializes the batcher.
+
+        Args:
+            analyzer (TorchSentimentModel | OnnxSentimentModel): The model.
+            max_batch_texts (int): Texts from which a batch is run at once.
+            max_latency (float): Seconds the first request of a batch waits
+                for others at most.
+            batch_size (int): Maximum number of texts per forward pass.
+            token_budget (int): Maximum padded tokens per forward pass.
+            request_timeout (float): Seconds a request waits for its
+                predictions, shorter than the clients' timeout.
+        """
+        self.analyzer = analyzer
+        self.max_batch_texts = max_batch_texts
+        self.max_latency = max_latency
+        self.batch_size = batch_size
+        self.token_budget = token_budget
+        self.request_timeout = request_timeout
+        self.batches = 0
+        self.requests = 0
+        self.texts = 0
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+
+    def submit(self, texts: List[str]) -> List[Optional[dict]]:
+        """
+        Waits for the predictions of texts.
+
+        Args:
+            texts (List[str]): The non-empty texts.
+
+        Returns:
+            List[Optional[dict]]: One prediction per text, see `infer`, all
+            None if they did not come in `request_timeout` seconds.
+        """
+        request = _Request(texts)
+        self._queue.put(request)
+        if not request.done.wait(self.request_timeout):
+            request.cancelled = True
+            print(f"Aucune prédiction après {self.request_timeout:.0f}s")
+            return [None] * len(texts)
+        return request.predictions
+
+    def run(self, report_seconds: float = 60.0) -> None:
+        """
+        Runs the batches forever, printing their average size regularly.
+
+        Args:
+            report_seconds (float): Seconds between two reports.
+        """
+        last_report = time.monotonic()
+        while True:
+            requests = [
+                request for request in self._next_batch() if not request.cancelled
+            ]
+            if not requests:
+                continue
+            texts = [text for request in requests for text in request.texts]
+            try:
+                predictions = infer(
+                    self.analyzer, texts, self.batch_size, self.token_budget
+                )
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                print(f"Erreur lors de l'analyse du lot: {str(e)}")
+                predictions = [None] * len(texts)
+            start = 0
+            for request in requests:
+                request.predictions = predictions[start : start + len(request.texts)]
+                start += len(request.texts)
+                request.done.set()
+
+            self.batches += 1
+            self.requests += len(requests)
+            self.texts += len(texts)
+            if time.monotonic() - last_report >= report_seconds:
+                print(
+                    f"{self.texts} textes en {self.batches} lots "
+                    f"({self.texts / self.batches:.1f} textes, "
+                    f"{self.requests / self.batches:.1f} requêtes par lot)"
+                )
+                last_report = time.monotonic()
+
+    def _next_batch(self) -> List[_Request]:
+        requests: List[_Request] = []
+        size = 0
+        deadline = None
+        while size < self.max_batch_texts:
+            timeout = (
+                None if deadline is None else max(0.0, deadline - time.monotonic())
+            )
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request.cancelled:
+                continue
+            if deadline is None:
+                deadline = time.monotonic() + self.max_latency
+            requests.append(request)
+            size += len(request.texts)
+        return requests
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """
+    Answers the requests of one worker connection until it closes.
+    """
+
+    def handle(self) -> None:
+        while True:
+            message = receive_message(self.request)
+            if message is None:
+                return
+            predictions = self.server.batcher.submit(message["texts"])
+            send_message(self.request, {"predictions": predictions})
+
+
+class InferenceServer(socketserver.ThreadingUnixStreamServer):
+    """
+    The UNIX socket server, one thread per worker connection.
+    """
+
+    daemon_threads = True
+    # Every Python worker of the node may connect at once
+    request_queue_size = 128
+
+    def __init__(self, socket_path: str, batcher: DynamicBatcher):
+        """
+        Binds the socket, replacing the one a stopped server left.
+
+        Args:
+            socket_path (str): The socket path.
+            batcher (DynamicBatcher): Runs the requests.
+        """
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, _Handler)
+        self.batcher = batcher
+
+
+def main() -> None:
+    """
+    Parses the command line, loads the model and serves until killed.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--socket", required=True, help="The UNIX socket path")
+    parser.add_argument("--backend", default="torch", choices=("torch", "onnx"))
+    parser.add_argument("--threads", type=int, default=0, help="0 for all cores")
+    parser.add_argument("--model-path", help="Where the ONNX model is cached")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--token-budget", type=int, default=8192)
+    parser.add_argument("--max-batch-texts", type=int, default=512)
+    parser.add_argument("--max-latency-ms", type=float, default=20.0)
+    parser.add_argument(
+        "--request-timeout", type=float, default=240.0, help="Seconds per request"
+    )
+    args = parser.parse_args()
+
+    # Loaded before binding the socket, so clients only connect once it is ready
+    analyzer = get_sentiment_analyzer(args.backend, args.threads, args.model_path)
+    batcher = DynamicBatcher(
+        analyzer,
+        args.max_batch_texts,
+        args.max_latency_ms / 1000,
+        args.batch_size,
+        args.token_budget,
+        args.request_timeout,
+    )
+    threading.Thread(target=batcher.run, daemon=True).start()
+    with InferenceServer(args.socket, batcher) as server:
+        print(f"Serveur d'inférence prêt sur '{args.socket}' ({analyzer.name})")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,82 @@
-from pyspark.sql import SparkSession
+"""
+Spark processing job
+
+Reads the posts written by the extraction, scores their comments and writes
+the posts, comments and post updates tables. `main` runs it on the cluster,
+from the bucket to BigQuery; the functions below let it run against any file
+source and sink, e.g. locally in `benchmark_spark.py`.
+"""
+
+import os
+import time
+from functools import partial
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import pandas as pd
+from pyspark.sql import Column, DataFrame, SparkSession
+from pyspark.sql.streaming import StreamingQuery
 from pyspark.sql.types import (
     StructType,
     StructField,
     StringType,
-    TimestampType,
     IntegerType,
     ArrayType,
     FloatType,
 )
-from pyspark.sql.functions import from_unixtime, col, explode, current_timestamp, udf
-from transformers import pipeline
-
-spark = (
-    SparkSession.builder.appName("feeling analysis")
-    .config("spark.jars", "/opt/bitnami/spark/jars/gcs-connector-hadoop3-2.2.11.jar")
-    .config("fs.gs.impl", "com.google.cloud.hadoop.fs.gcs.GoogleHadoopFileSystem")
-    .config(
-        "fs.AbstractFileSystem.gs.impl", "com.google.cloud.hadoop.fs.gcs.GoogleHadoopFS"
-    )
-    .getOrCreate()
+from pyspark.sql.functions import (
+    from_unixtime,
+    array,
+    col,
+    coalesce,
+    concat,
+    concat_ws,
+    explode,
+    current_timestamp,
+    lit,
+    pandas_udf,
+    sha2,
+    struct,
+    to_json,
+    when,
+)
+from admission import AdmissionController
+from sentiment import (
+    analyze_texts,
+    get_sentiment_cache,
+    get_sentiment_cascade,
+    get_sentiment_client,
+)
+from spark_metrics import BatchListener, JobMetrics
+from spark_sinks import BigQuerySink, make_table_writer
+from spark_windows import (
+    SCORED_COMMENT_SCHEMA,
+    SENTIMENT_WATERMARK,
+    SENTIMENT_WINDOWS,
+    make_window_writer,
+    parse_windows,
+    start_sentiment_query,
 )
 
-
-@udf(StringType(), useArrow=True)
-def analyze_sentiment(text):
-
-    sentiment_analyzer = pipeline(
-        task="sentiment-analysis",
-        model="distilbert-base-uncased-finetuned-sst-2-english",
-        device=-1,
-    )
-    if not text:
-        return "neutral"
-    try:
-        if len(text) > 512:
-            print(f"Attention: Texte tronqué de {len(text)} à 512 caractères")
-        result = sentiment_analyzer(text[:512])[0]
-        if result["label"] == "POSITIVE":
-            if result["score"] > 0.8:
-                return "très positif"
-            return "positif"
-        elif result["label"] == "NEGATIVE":
-            if result["score"] > 0.8:
-                return "très négatif"
-            return "négatif"
-        return "neutre"
-    except Exception as e:
-        print(f"Erreur lors de l'analyse: {str(e)}")
-        return "neutre"
-
+# The executors import these modules instead of unpickling them with each
+# task, so every Python worker loads the model only once.
+EXECUTOR_MODULES = (
+    "sentiment_cache.py",
+    "sentiment_client.py",
+    "sentiment_lexicon.py",
+    "sentiment_onnx.py",
+    "sentiment.py",
+    "sentiment_server.py",
+)
+GCS_CONNECTOR_JAR = "/opt/bitnami/spark/jars/gcs-connector-hadoop3-2.2.11.jar"
+SOURCE_BUCKET = "gs://reddit-feelings-pipeline-bucket"
+CHECKPOINT_LOCATION = "reddit-feelings-pipeline-process-bucket/pipeline-dedup"
+# How long a comment is remembered after it was first processed
+DEDUP_WATERMARK = "7 days"
+# The scored comments waiting for the sentiment aggregates, and their query
+SENTIMENT_STAGING_LOCATION = "reddit-feelings-pipeline-process-bucket/sentiment-staging"
+SENTIMENT_CHECKPOINT_LOCATION = (
+    "reddit-feelings-pipeline-process-bucket/sentiment-windows"
+)
 
 schema = StructType(
     [
@@ -61,6 +89,7 @@ schema = StructType(
         StructField("num_comments", IntegerType(), True),
         StructField("selftext", StringType(), True),
         StructField("subreddit", StringType(), True),
+        StructField("record_type", StringType(), True),
         StructField(
             "comments",
             ArrayType(
@@ -80,17 +109,9 @@ schema = StructType(
         ),
     ]
 )
-
-streaming_df = (
-    spark.readStream.format("json")
-    .schema(schema)
-    .option("maxFilesPerTrigger", 1)
-    .option("latestFirst", "true")
-    .option("cleanSource", "archive")
-    .load("gs://reddit-feelings-pipeline-bucket/*.json")
-)
-
-posts_df = streaming_df.select(
+COMMENT_TYPE = schema["comments"].dataType.elementType
+# The fields of a post identifying its content in the posts table
+POST_COLUMNS = (
     "id",
     "title",
     "url",
@@ -99,53 +120,808 @@ posts_df = streaming_df.select(
     "num_comments",
     "selftext",
     "subreddit",
-    from_unixtime("created_utc").alias("post_date"),
-    current_timestamp().alias("processing_time"),
 )
 
 
-comments_df = (
-    streaming_df.select("id", explode("comments").alias("comment"))
-    .select(
-        col("id").alias("post_id"),
-        col("comment.id").alias("comment_id"),
-        col("comment.author").alias("comment_author"),
-        col("comment.body").alias("comment_body"),
-        col("comment.score").alias("comment_score"),
-        from_unixtime("comment.created_utc").alias("comment_date"),
+class InferenceSettings(NamedTuple):
+    """
+    How the sentiment UDF runs the model, see `sentiment.analyze_texts`.
+    """
+
+    batch_size: int = 64
+    token_budget: int = 8192
+    backend: str = "torch"
+    threads: int = 1
+    onnx_model_path: Optional[str] = None
+    cache_size: int = 100_000
+    cache_path: Optional[str] = None
+    cascade: bool = False
+    cascade_min_confidence: float = 0.9
+    cascade_max_words: int = 30
+    cascade_sample_rate: float = 0.02
+    server_socket: Optional[str] = None
+    server_autostart: bool = False
+    server_threads: int = 0
+    server_max_batch_texts: int = 512
+    server_max_latency_ms: float = 20.0
+
+    @classmethod
+    def from_env(cls) -> "InferenceSettings":
+        """
+        Reads the settings from the environment variables.
+
+        Returns:
+            InferenceSettings: The settings.
+        """
+        return cls(
+            batch_size=int(os.getenv("INFERENCE_BATCH_SIZE", "64")),
+            token_budget=int(os.getenv("INFERENCE_TOKEN_BUDGET", "8192")),
+            # "torch" or "onnx" (int8 model exported once to ONNX_MODEL_PATH)
+            backend=os.getenv("SENTIMENT_BACKEND", "torch"),
+            threads=int(os.getenv("INFERENCE_THREADS", "1")),
+            onnx_model_path=os.getenv("ONNX_MODEL_PATH") or None,
+            # Predictions cached per worker, then in a SQLite file local to
+            # each machine
+            cache_size=int(os.getenv("SENTIMENT_CACHE_SIZE", "100000")),
+            cache_path=os.getenv("SENTIMENT_CACHE_PATH") or None,
+            # The lexicon answers the short, clearly polarized comments
+            cascade=os.getenv("SENTIMENT_CASCADE") == "1",
+            cascade_min_confidence=float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.9")),
+            cascade_max_words=int(os.getenv("CASCADE_MAX_WORDS", "30")),
+            cascade_sample_rate=float(os.getenv("CASCADE_SAMPLE_RATE", "0.02")),
+            # One model per node, shared by its Python workers over a socket
+            server_socket=os.getenv("INFERENCE_SERVER_SOCKET") or None,
+            server_autostart=os.getenv("INFERENCE_SERVER_AUTOSTART") == "1",
+            server_threads=int(os.getenv("INFERENCE_SERVER_THREADS", "0")),
+            server_max_batch_texts=int(
+                os.getenv("INFERENCE_SERVER_MAX_BATCH_TEXTS", "512")
+            ),
+            server_max_latency_ms=float(
+                os.getenv("INFERENCE_SERVER_MAX_LATENCY_MS", "20")
+            ),
+        )
+
+    def server_args(self) -> List[str]:
+        """
+        Builds the options `sentiment_server.py` is started with.
+
+        Returns:
+            List[str]: The command-line options.
+        """
+        args = [
+            "--backend",
+            self.backend,
+            "--threads",
+            str(self.server_threads),
+            "--batch-size",
+            str(self.batch_size),
+            "--token-budget",
+            str(self.token_budget),
+            "--max-batch-texts",
+            str(self.server_max_batch_texts),
+            "--max-latency-ms",
+            str(self.server_max_latency_ms),
+        ]
+        if self.onnx_model_path:
+            args += ["--model-path", self.onnx_model_path]
+        return args
+
+
+class FileSource(NamedTuple):
+    """
+    The JSON files the job reads.
+    """
+
+    path: str
+    multi_line: bool = False
+    archive_dir: Optional[str] = None
+
+
+def get_bucket_source(source_format: str) -> FileSource:
+    """
+    Builds the source reading the extraction bucket.
+
+    Args:
+        source_format (str): "ndjson" for the compressed newline-delimited
+            batches written by the extraction RollingNDJSONWriter (one post
+            per line), or "json" for the legacy pretty-printed `{id}.json`
+            object per post, which needs the multiLine reader.
+
+    Returns:
+        FileSource: The source, archiving processed files under `archive/`.
+
+    Raises:
+        ValueError: If the format is unknown.
+    """
+    archive_dir = f"{SOURCE_BUCKET}/archive"
+    if source_format == "ndjson":
+        return FileSource(f"{SOURCE_BUCKET}/batches/*.ndjson.*", False, archive_dir)
+    if source_format == "json":
+        return FileSource(f"{SOURCE_BUCKET}/*.json", True, archive_dir)
+    raise ValueError(f"Unknown SOURCE_FORMAT '{source_format}'")
+
+
+def create_spark_session(
+    master: Optional[str] = None, gcs: bool = True, arrow_batch_size: int = 2048
+) -> SparkSession:
+    """
+    Creates the Spark session and ships the modules the executors import.
+
+    Args:
+        master (Optional[str]): The master URL, e.g. "local[*]", or None to
+            use the one given by `spark-submit`.
+        gcs (bool): Whether to load the Cloud Storage connector.
+        arrow_batch_size (int): Rows handed to the sentiment UDF at once.
+
+    Returns:
+        SparkSession: The session.
+    """
+    builder = SparkSession.builder.appName("feeling analysis").config(
+        "spark.sql.execution.arrow.maxRecordsPerBatch", str(arrow_batch_size)
+    )
+    if master:
+        builder = builder.master(master)
+    if gcs:
+        builder = (
+            builder.config("spark.jars", GCS_CONNECTOR_JAR)
+            .config(
+                "fs.gs.impl", "com.google.cloud.hadoop.fs.gcs.GoogleHadoopFileSystem"
+            )
+            .config(
+                "fs.AbstractFileSystem.gs.impl",
+                "com.google.cloud.hadoop.fs.gcs.GoogleHadoopFS",
+            )
+        )
+    # The deduplication state lives on the executors' disks, not in their heap
+    builder = builder.config(
+        "spark.sql.streaming.stateStore.providerClass",
+        "org.apache.spark.sql.execution.streaming.state.RocksDBStateStoreProvider",
+    )
+    spark = builder.getOrCreate()
+    for module in EXECUTOR_MODULES:
+        spark.sparkContext.addPyFile(
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), module)
+        )
+    return spark
+
+
+def make_sentiment_udf(settings: InferenceSettings, metrics: JobMetrics) -> Callable:
+    """
+    Builds the pandas UDF labelling the sentiment of comment bodies.
+
+    Args:
+        settings (InferenceSettings): How the model runs.
+        metrics (JobMetrics): Holds the accumulators the UDF adds its cache
+            and cascade counters and inference time to.
+
+    Returns:
+        Callable: The UDF, taking a string column and returning a struct of
+        the "label" and its "score".
+    """
+    # Captured as plain values, the closure is pickled without this module
+    batching = (settings.batch_size, settings.token_budget)
+    model = (settings.backend, settings.threads, settings.onnx_model_path)
+    cache_size, cache_path = settings.cache_size, settings.cache_path
+    cascade_settings = (
+        (
+            settings.cascade_min_confidence,
+            settings.cascade_max_words,
+            settings.cascade_sample_rate,
+        )
+        if settings.cascade
+        else None
+    )
+    server_socket = settings.server_socket
+    server_args = settings.server_args() if settings.server_autostart else None
+    cache_hits, cache_misses = metrics.cache_hits, metrics.cache_misses
+    cascade_rows = metrics.cascade_rows
+    inference_rows, inference_seconds = (
+        metrics.inference_rows,
+        metrics.inference_seconds,
+    )
+
+    @pandas_udf(
+        StructType(
+            [
+                StructField("label", StringType(), True),
+                StructField("score", FloatType(), True),
+            ]
+        )
+    )
+    def analyze_sentiment(texts: pd.Series) -> pd.DataFrame:
+        start = time.perf_counter()
+        cache = get_sentiment_cache(cache_size, cache_path)
+        hits, misses = cache.hits, cache.misses
+        cascade = get_sentiment_cascade(*cascade_settings) if cascade_settings else None
+        counts = cascade.counts() if cascade else ()
+        server = (
+            get_sentiment_client(server_socket, server_args) if server_socket else None
+        )
+        predictions = analyze_texts(texts, *batching, cache, *model, cascade, server)
+        cache_hits.add(cache.hits - hits)
+        cache_misses.add(cache.misses - misses)
+        if cascade:
+            for accumulator, before, after in zip(
+                cascade_rows, counts, cascade.counts()
+            ):
+                accumulator.add(after - before)
+        inference_rows.add(len(texts))
+        inference_seconds.add(time.perf_counter() - start)
+        return predictions
+
+    return analyze_sentiment
+
+
+def read_source(
+    spark: SparkSession, source: FileSource, max_files_per_trigger: int
+) -> DataFrame:
+    """
+    Reads the source as a stream of records.
+
+    The newest files are read first, and processed files are moved to the
+    archive directory of the source, if it has one.
+
+    Args:
+        spark (SparkSession): The session.
+        source (FileSource): The source.
+        max_files_per_trigger (int): Maximum number of files per micro-batch.
+
+    Returns:
+        DataFrame: The streaming records, see `schema`.
+    """
+    reader = (
+        spark.readStream.format("json")
+        .schema(schema)
+        .option("multiLine", str(source.multi_line).lower())
+        .option("maxFilesPerTrigger", max_files_per_trigger)
+        .option("latestFirst", "true")
+    )
+    if source.archive_dir:
+        reader = reader.option("cleanSource", "archive").option(
+            "sourceArchiveDir", source.archive_dir
+        )
+    return reader.load(source.path)
+
+
+def list_source_status(spark: SparkSession, source: FileSource) -> Dict[str, int]:
+    """
+    Lists the files in the source.
+
+    Processed files are moved to the archive directory when the batch after
+    theirs is planned, so the files of the last batch stay listed until then.
+
+    Args:
+        spark (SparkSession): The session.
+        source (FileSource): The source.
+
+    Returns:
+        Dict[str, int]: Size in bytes of each file, by path.
+    """
+    # pylint: disable=protected-access
+    path = spark._jvm.org.apache.hadoop.fs.Path(source.path)
+    file_system = path.getFileSystem(spark._jsc.hadoopConfiguration())
+    return {
+        status.getPath().toString(): status.getLen()
+        for status in file_system.globStatus(path) or []
+    }
+
+
+def list_source_files(spark: SparkSession, source: FileSource) -> List[int]:
+    """
+    Lists the files waiting in the source.
+
+    This is the backlog give or take the last batch, see `list_source_status`.
+
+    Args:
+        spark (SparkSession): The session.
+        source (FileSource): The source.
+
+    Returns:
+        List[int]: Size in bytes of each file.
+    """
+    return list(list_source_status(spark, source).values())
+
+
+def record_type() -> Column:
+    """
+    Reads the type of a record.
+
+    The extraction writes a small "delta" record instead of the full post
+    when only its score or comment count changed; records without a type
+    are posts.
+
+    Returns:
+        Column: "post" or "delta".
+    """
+    return coalesce(col("record_type"), lit("post"))
+
+
+def explode_records(records_df: DataFrame) -> DataFrame:
+    """
+    Flattens the records into one row per record and one per comment.
+
+    Record rows have a null `comment` and the record type as `kind`, comment
+    rows have "comment" as `kind` and the fields of their post.
+
+    Args:
+        records_df (DataFrame): The records, as read from the source.
+
+    Returns:
+        DataFrame: The rows.
+    """
+    return (
+        records_df.select(
+            "*",
+            explode(
+                concat(
+                    array(lit(None).cast(COMMENT_TYPE)),
+                    coalesce(col("comments"), array().cast(ArrayType(COMMENT_TYPE))),
+                )
+            ).alias("comment"),
+        )
+        .drop("comments")
+        .withColumn(
+            "kind",
+            when(col("comment").isNull(), record_type()).otherwise(lit("comment")),
+        )
+    )
+
+
+def deduplicate(rows_df: DataFrame, watermark_delay: str) -> DataFrame:
+    """
+    Drops the rows already seen by the query.
+
+    A re-extracted post comes back with all its comments: a comment is only
+    kept the first time its id is seen with a given body, so only new and
+    edited comments are scored and written. Posts and post updates are only
+    dropped when identical to one already written.
+
+    Rows are timed by the time they are processed, not by the date of the
+    comment, so the watermark never marks a row as late: a new comment on an
+    old thread, a backfill or a replay is always written. Each key is
+    remembered for `watermark_delay` after it was first seen, which bounds
+    the state kept; a comment seen again after that is written again.
+
+    Args:
+        rows_df (DataFrame): The rows, see `explode_records`.
+        watermark_delay (str): The delay, e.g. "7 days".
+
+    Returns:
+        DataFrame: The rows left.
+    """
+    kind = col("kind")
+    dedup_key = (
+        when(
+            kind == "comment",
+            concat_ws(
+                ":",
+                lit("comment"),
+                col("comment.id"),
+                sha2(coalesce(col("comment.body"), lit("")), 256),
+            ),
+        )
+        .when(
+            kind == "post",
+            concat_ws(
+                ":",
+                lit("post"),
+                col("id"),
+                sha2(to_json(struct(*POST_COLUMNS)), 256),
+            ),
+        )
+        .otherwise(
+            concat_ws(
+                ":",
+                kind,
+                col("id"),
+                col("score").cast("string"),
+                col("num_comments").cast("string"),
+            )
+        )
+    )
+    return (
+        rows_df.withColumn("dedup_key", dedup_key)
+        .withColumn("event_time", current_timestamp())
+        .withWatermark("event_time", watermark_delay)
+        .dropDuplicatesWithinWatermark(["dedup_key"])
+    )
+
+
+def select_posts(rows_df: DataFrame) -> DataFrame:
+    """
+    Selects the rows of the posts table.
+
+    Args:
+        rows_df (DataFrame): The rows left after deduplication.
+
+    Returns:
+        DataFrame: One row per new or changed post.
+    """
+    return rows_df.filter(col("kind") == "post").select(
+        "id",
+        "title",
+        "url",
+        "score",
+        "author",
+        "num_comments",
+        "selftext",
+        "subreddit",
+        from_unixtime("created_utc").alias("post_date"),
         current_timestamp().alias("processing_time"),
     )
-    .withColumn("sentiment", analyze_sentiment(col("comment_body")))
-)
 
-project_id = "reddit-feelings-pipeline"
-dataset = "dataset"
-
-posts_query = (
-    posts_df.writeStream.format("bigquery")
-    .option("table", f"{project_id}.{dataset}.posts")
-    .option("checkpointLocation", "reddit-feelings-pipeline-process-bucket/posts")
-    .option("failOnDataLoss", "false")
-    .option("maxRetries", 3)
-    .outputMode("append")
-    .trigger(processingTime="1 minute")
-    .start()
-)
 
-comments_query = (
-    comments_df.writeStream.format("bigquery")
-    .option("table", f"{project_id}.{dataset}.comments")
-    .option("checkpointLocation", "reddit-feelings-pipeline-process-bucket/comments")
-    .option("failOnDataLoss", "false")
-    .option("maxRetries", 3)
-    .outputMode("append")
-    .trigger(processingTime="1 minute")
-    .start()
-)
+def select_comments(
+    rows_df: DataFrame, analyze_sentiment: Callable[[Column], Column]
+) -> DataFrame:
+    """
+    Selects and scores the rows of the comments table.
+
+    Args:
+        rows_df (DataFrame): The rows left after deduplication.
+        analyze_sentiment (Callable[[Column], Column]): The sentiment UDF.
+
+    Returns:
+        DataFrame: One row per new or edited comment, with the `subreddit`
+        of its post, which the comments table does not keep.
+    """
+    return (
+        rows_df.filter(col("kind") == "comment")
+        .select(
+            "subreddit",
+            col("id").alias("post_id"),
+            col("comment.id").alias("comment_id"),
+            col("comment.author").alias("comment_author"),
+            col("comment.body").alias("comment_body"),
+            col("comment.score").alias("comment_score"),
+            from_unixtime("comment.created_utc").alias("comment_date"),
+            current_timestamp().alias("processing_time"),
+        )
+        .withColumn("prediction", analyze_sentiment(col("comment_body")))
+        .withColumn("sentiment", col("prediction.label"))
+        .withColumn("sentiment_score", col("prediction.score"))
+        .drop("prediction")
+    )
+
+
+def select_post_updates(rows_df: DataFrame) -> DataFrame:
+    """
+    Selects the rows of the post_updates table.
+
+    Args:
+        rows_df (DataFrame): The rows left after deduplication.
+
+    Returns:
+        DataFrame: One row per new score and comment count of a post.
+    """
+    return rows_df.filter(col("kind") == "delta").select(
+        "id",
+        "subreddit",
+        "score",
+        "num_comments",
+        current_timestamp().alias("processing_time"),
+    )
+
+
+def make_batch_writer(
+    sink,
+    analyze_sentiment: Callable[[Column], Column],
+    metrics: JobMetrics,
+    staging_location: Optional[str] = None,
+) -> Callable[[DataFrame, int], None]:
+    """
+    Builds the `foreachBatch` function writing the tables.
+
+    The files of a batch are listed, read and parsed once: the rows left
+    after deduplication are cached and the posts, comments and post updates
+    tables derived from them, see `make_table_writer`. The scored comments
+    are cached too, and appended to `staging_location` as Parquet files for
+    the sentiment aggregates, see `start_sentiment_query`. The batch is only
+    marked done in the checkpoint once every table is written, so a failed
+    batch is replayed as a whole; its comments may then be staged twice.
+
+    Args:
+        sink (BigQuerySink | ParquetSink | MemorySink): Where the tables go.
+        analyze_sentiment (Callable[[Column], Column]): The sentiment UDF.
+        metrics (JobMetrics): Where the time of each stage is recorded.
+        staging_location (Optional[str]): Where the scored comments are
+            staged, None to skip it.
+
+    Returns:
+        Callable[[DataFrame, int], None]: The function.
+    """
+    write_tables = make_table_writer(sink, metrics)
+
+    def write_batch(batch_df: DataFrame, batch_id: int) -> None:
+        batch_df.persist()
+        try:
+            rows = metrics.run_stage("parse", batch_df.count)
+            if not rows:
+                write_tables(batch_df, batch_id, [])
+                return
+            # Scored once, for the comments table and their aggregates
+            comments_df = select_comments(batch_df, analyze_sentiment).persist()
+            try:
+                write_tables(
+                    batch_df,
+                    batch_id,
+                    [
+                        ("posts", select_posts(batch_df)),
+                        ("comments", comments_df.drop("subreddit")),
+                        ("post_updates", select_post_updates(batch_df)),
+                    ],
+                )
+                if staging_location:
+                    staged_df = comments_df.select(
+                        *(
+                            col(field.name).cast(field.dataType)
+                            for field in SCORED_COMMENT_SCHEMA.fields
+                        )
+                    )
+                    metrics.run_stage(
+                        "stage_comments",
+                        staged_df.write.mode("append").parquet,
+                        staging_location,
+                    )
+            finally:
+                comments_df.unpersist()
+            print(f"Batch {batch_id} written ({rows} rows)")
+        finally:
+            batch_df.unpersist()
+
+    return write_batch
+
+
+def start_query(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    spark: SparkSession,
+    source: FileSource,
+    write_batch: Callable[[DataFrame, int], None],
+    checkpoint_location: str,
+    max_files_per_trigger: int,
+    dedup_watermark: str = DEDUP_WATERMARK,
+    **trigger,
+) -> StreamingQuery:
+    """
+    Starts the streaming query.
+
+    Args:
+        spark (SparkSession): The session.
+        source (FileSource): The source.
+        write_batch (Callable[[DataFrame, int], None]): See `make_batch_writer`.
+        checkpoint_location (str): Where the query keeps its progress.
+        max_files_per_trigger (int): Maximum number of files per micro-batch.
+        dedup_watermark (str): How long comments are remembered, see
+            `deduplicate`.
+        **trigger: The trigger, e.g. `processingTime="1 minute"` or
+            `availableNow=True`.
+
+    Returns:
+        StreamingQuery: The running query.
+    """
+    rows_df = deduplicate(
+        explode_records(read_source(spark, source, max_files_per_trigger)),
+        dedup_watermark,
+    )
+    return (
+        rows_df.writeStream.foreachBatch(write_batch)
+        .option("checkpointLocation", checkpoint_location)
+        .trigger(**trigger)
+        .start()
+    )
+
+
+def run_available(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    spark: SparkSession,
+    source: FileSource,
+    write_batch: Callable[[DataFrame, int], None],
+    checkpoint_location: str,
+    max_files_per_trigger: int,
+    dedup_watermark: str = DEDUP_WATERMARK,
+) -> StreamingQuery:
+    """
+    Processes the files waiting in the source with an `availableNow` trigger.
+
+    Args:
+        spark (SparkSession): The session.
+        source (FileSource): The source.
+        write_batch (Callable[[DataFrame, int], None]): See `make_batch_writer`.
+        checkpoint_location (str): Where the query keeps its progress.
+        max_files_per_trigger (int): Maximum number of files per micro-batch.
+        dedup_watermark (str): How long comments are remembered, see
+            `deduplicate`.
+
+    Returns:
+        StreamingQuery: The query, once it stopped.
+    """
+    query = start_query(
+        spark,
+        source,
+        write_batch,
+        checkpoint_location,
+        max_files_per_trigger,
+        dedup_watermark,
+        availableNow=True,
+    )
+    query.awaitTermination()
+    return query
+
+
+def run_adaptive(  # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+    spark: SparkSession,
+    source: FileSource,
+    write_batch: Callable[[DataFrame, int], None],
+    checkpoint_location: str,
+    controller: AdmissionController,
+    metrics: JobMetrics,
+    idle_seconds: float = 60.0,
+    dedup_watermark: str = DEDUP_WATERMARK,
+    beside: Sequence[StreamingQuery] = (),
+) -> None:
+    """
+    Drains the source in rounds of micro-batches sized to the backlog.
+
+    Each round lists the waiting files, sets `maxFilesPerTrigger` from the
+    admission controller, and runs the query with an `availableNow` trigger
+    until those files are processed. The records of the round, as counted by
+    the `BatchListener` of `metrics`, and the size of the files admitted then
+    update the measured throughput the next round is sized with. The job
+    waits `idle_seconds` when no file is waiting or a round reads no record.
+
+    Every file listed when a round starts is processed by its end, but the
+    files of its last batch are only archived during the next round: they
+    are not counted as waiting again.
+
+    The queries running beside the rounds, e.g. the sentiment aggregates, are
+    checked before each round: the job stops if one of them stopped.
+
+    Args:
+        spark (SparkSession): The session.
+        source (FileSource): The source.
+        write_batch (Callable[[DataFrame, int], None]): See `make_batch_writer`.
+        checkpoint_location (str): Where the query keeps its progress.
+        controller (AdmissionController): Sizes the batches.
+        metrics (JobMetrics): Counts the records of each round, reported
+            after it.
+        idle_seconds (float): How long to wait when there is nothing to do.
+        dedup_watermark (str): How long comments are remembered, see
+            `deduplicate`.
+        beside (Sequence[StreamingQuery]): The queries running beside.
+
+    Raises:
+        RuntimeError: If a query running beside stopped.
+    """
+    processed = set()
+    while True:
+        for other in beside:
+            if not other.isActive:
+                raise RuntimeError(f"Query '{other.name}' stopped: {other.exception()}")
+        files = list_source_status(spark, source)
+        file_sizes = [size for path, size in files.items() if path not in processed]
+        if not file_sizes:
+            metrics.report()
+            time.sleep(idle_seconds)
+            continue
+        max_files = controller.files_per_trigger(file_sizes)
+        print(
+            f"Backlog: {len(file_sizes)} files ({sum(file_sizes) / 1e6:.1f} MB), "
+            f"admitting {max_files} files per batch"
+        )
+        start = time.perf_counter()
+        query = run_available(
+            spark, source, write_batch, checkpoint_location, max_files, dedup_watermark
+        )
+        elapsed = time.perf_counter() - start
+        processed = set(files)
+        rows = metrics.take_run_rows(str(query.runId))
+        metrics.report()
+        if not rows:
+            # Files already processed before a restart, or empty ones
+            time.sleep(idle_seconds)
+            continue
+        controller.finish_round(sum(file_sizes), rows, elapsed)
+
+
+def get_admission_controller() -> Optional[AdmissionController]:
+    """
+    Reads the admission mode from the environment.
+
+    "fixed" processes MAX_FILES_PER_TRIGGER files every minute. "adaptive"
+    sizes the batches from the measured throughput and the backlog.
+
+    Returns:
+        Optional[AdmissionController]: The controller, None in fixed mode.
+
+    Raises:
+        ValueError: If the mode is unknown.
+    """
+    admission_mode = os.getenv("ADMISSION_MODE", "fixed")
+    if admission_mode == "adaptive":
+        return AdmissionController(
+            max_batch_bytes=int(os.getenv("MAX_BATCH_BYTES", str(256 * 1024 * 1024))),
+            max_batch_rows=int(os.getenv("MAX_BATCH_ROWS", "100000")),
+            target_batch_seconds=float(os.getenv("TARGET_BATCH_SECONDS", "60")),
+        )
+    if admission_mode == "fixed":
+        return None
+    raise ValueError(f"Unknown ADMISSION_MODE '{admission_mode}'")
+
+
+def main() -> None:
+    """
+    Runs the job on the cluster, from the extraction bucket to BigQuery.
+
+    The sentiment aggregates are computed by a second query, from the
+    comments the first one stages, see `start_sentiment_query`. The rows,
+    rates, inference time, cache hit rate and backlog of each micro-batch
+    are appended to `METRICS_PATH` (default `batch_metrics.jsonl`, empty to
+    disable).
+    """
+    source = get_bucket_source(os.getenv("SOURCE_FORMAT", "ndjson"))
+    admission = get_admission_controller()
+    dedup_watermark = os.getenv("COMMENT_DEDUP_WATERMARK", DEDUP_WATERMARK)
+    windows = parse_windows(os.getenv("SENTIMENT_WINDOWS", SENTIMENT_WINDOWS))
+    spark = create_spark_session(
+        arrow_batch_size=int(os.getenv("ARROW_BATCH_SIZE", "2048"))
+    )
+    metrics = JobMetrics(spark.sparkContext)
+    spark.streams.addListener(
+        BatchListener(
+            metrics,
+            partial(list_source_files, spark, source),
+            os.getenv("METRICS_PATH", "batch_metrics.jsonl") or None,
+        )
+    )
+    sink = BigQuerySink("reddit-feelings-pipeline", "dataset")
+    write_batch = make_batch_writer(
+        sink,
+        make_sentiment_udf(InferenceSettings.from_env(), metrics),
+        metrics,
+        SENTIMENT_STAGING_LOCATION if windows else None,
+    )
+
+    try:
+        beside = []
+        if windows:
+            beside.append(
+                start_sentiment_query(
+                    spark,
+                    SENTIMENT_STAGING_LOCATION,
+                    make_window_writer(sink, metrics),
+                    SENTIMENT_CHECKPOINT_LOCATION,
+                    windows,
+                    os.getenv("SENTIMENT_WATERMARK", SENTIMENT_WATERMARK),
+                    processingTime="1 minute",
+                )
+            )
+        if admission is not None:
+            run_adaptive(
+                spark,
+                source,
+                write_batch,
+                CHECKPOINT_LOCATION,
+                admission,
+                metrics,
+                float(os.getenv("IDLE_POLL_SECONDS", "60")),
+                dedup_watermark,
+                beside,
+            )
+        else:
+            start_query(
+                spark,
+                source,
+                write_batch,
+                CHECKPOINT_LOCATION,
+                int(os.getenv("MAX_FILES_PER_TRIGGER", "1")),
+                dedup_watermark,
+                processingTime="1 minute",
+            )
+            while not spark.streams.awaitAnyTermination(60):
+                metrics.report()
+    finally:
+        for query in spark.streams.active:
+            query.stop()
+        spark.stop()
+
 
-try:
-    spark.streams.awaitAnyTermination()
-finally:
-    posts_query.stop()
-    comments_query.stop()
-    spark.stop()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""
+Metrics file
+
+Stage timings of the processing job, measured on the driver, and counters of
+the sentiment UDF (cache, cascade tiers, inference time), summed from the
+executors with Spark accumulators. A streaming query listener records them
+for each micro-batch, with the progress Spark reports and the source backlog,
+to a JSON-lines file.
+"""
+
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set
+
+from pyspark import SparkContext
+from pyspark.sql.streaming import StreamingQueryListener
+
+CASCADE_COUNTS = ("empty", "lexicon", "model", "sampled", "agreed")
+
+
+class StageTiming(NamedTuple):
+    """
+    The calls of a stage of the micro-batches.
+    """
+
+    calls: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+
+
+class JobMetrics:  # pylint: disable=too-many-instance-attributes
+    """
+    A registry of stage timings and sentiment counters.
+
+    Stages are the steps a micro-batch goes through on the driver (parsing,
+    then writing each table). For each of them the number of calls, the total
+    and the longest duration are kept, see `StageTiming`. The accumulators are updated by the
+    sentiment UDF and only hold the tasks that completed.
+    """
+
+    def __init__(self, spark_context: SparkContext):
+        """
+        Initializes empty timings and the accumulators.
+
+        Args:
+            spark_context (SparkContext): The context the accumulators belong to.
+        """
+        self.cache_hits = spark_context.accumulator(0)
+        self.cache_misses = spark_context.accumulator(0)
+        self.inference_rows = spark_context.accumulator(0)
+        self.inference_seconds = spark_context.accumulator(0.0)
+        # Rows answered empty, by the lexicon and by the model, then the
+        # lexicon answers checked against the model and those it agreed with
+        self.cascade_rows = tuple(spark_context.accumulator(0) for _ in CASCADE_COUNTS)
+        self._stages: Dict[str, StageTiming] = {}
+        self._batches = 0
+        self._input_rows = 0
+        # Records read by each run of a query, and the runs that ended
+        self._run_rows: Dict[str, int] = {}
+        self._ended_runs: Set[str] = set()
+        self._lock = threading.Condition()
+
+    def run_stage(self, stage: str, func: Callable[..., Any], *args) -> Any:
+        """
+        Runs a stage of a micro-batch and records the time it took.
+
+        Args:
+            stage (str): The stage name.
+            func (Callable[..., Any]): The stage.
+            *args: The arguments of `func`.
+
+        Returns:
+            Any: What `func` returned.
+        """
+        start = time.perf_counter()
+        result = func(*args)
+        seconds = time.perf_counter() - start
+        with self._lock:
+            timing = self._stages.get(stage, StageTiming())
+            self._stages[stage] = StageTiming(
+                timing.calls + 1,
+                timing.seconds + seconds,
+                max(timing.max_seconds, seconds),
+            )
+        return result
+
+    def summary(self) -> dict:
+        """
+        Builds a snapshot of every metric.
+
+        Returns:
+            dict: Micro-batches and records counted by `BatchListener`, stage
+            timings, inference time and cache counters.
+        """
+        with self._lock:
+            batches, input_rows = self._batches, self._input_rows
+            stages = {
+                stage: {
+                    "calls": timing.calls,
+                    "total_seconds": round(timing.seconds, 3),
+                    "max_seconds": round(timing.max_seconds, 3),
+                }
+                for stage, timing in sorted(self._stages.items())
+            }
+        rows, seconds = self.inference_rows.value, self.inference_seconds.value
+        hits, misses = self.cache_hits.value, self.cache_misses.value
+        return {
+            "batches": batches,
+            "input_rows": input_rows,
+            "stages": stages,
+            "inference": {
+                "rows": rows,
+                "seconds": round(seconds, 3),
+                "seconds_per_row": round(seconds / rows, 6) if rows else None,
+            },
+            "cache": {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+            },
+            "cascade": self.cascade_summary(),
+        }
+
+    def counters(self) -> Dict[str, float]:
+        """
+        Reads the current value of the accumulators.
+
+        Returns:
+            Dict[str, float]: The cache, inference and cascade counters.
+        """
+        return {
+            "cache_hits": self.cache_hits.value,
+            "cache_misses": self.cache_misses.value,
+            "inference_rows": self.inference_rows.value,
+            "inference_seconds": self.inference_seconds.value,
+            **{
+                f"cascade_{name}": rows.value
+                for name, rows in zip(CASCADE_COUNTS, self.cascade_rows)
+            },
+        }
+
+    def record_batch(self, record: dict) -> None:
+        """
+        Counts a micro-batch and the records it read.
+
+        Args:
+            record (dict): The record, see `BatchListener`.
+        """
+        with self._lock:
+            self._batches += 1
+            self._input_rows += record["input_rows"]
+            run_id = record["run_id"]
+            self._run_rows[run_id] = (
+                self._run_rows.get(run_id, 0) + record["input_rows"]
+            )
+
+    def end_run(self, run_id: str) -> None:
+        """
+        Marks a run of a query as ended, once its last batch was counted.
+
+        Args:
+            run_id (str): The id of the run.
+        """
+        with self._lock:
+            self._ended_runs.add(run_id)
+            self._lock.notify_all()
+
+    def take_run_rows(self, run_id: str, timeout: float = 60.0) -> int:
+        """
+        Waits for a run of a query to be reported as ended, then forgets it.
+
+        The listener gets the events of a query after the query itself, in
+        order: once its end is reported, every batch of the run was counted.
+
+        Args:
+            run_id (str): The id of the run.
+            timeout (float): Seconds to wait for the end of the run.
+
+        Returns:
+            int: The records read by the run.
+        """
+        with self._lock:
+            self._lock.wait_for(lambda: run_id in self._ended_runs, timeout)
+            self._ended_runs.discard(run_id)
+            return self._run_rows.pop(run_id, 0)
+
+    def cascade_summary(self) -> dict:
+        """
+        Builds a snapshot of the sentiment cascade counters.
+
+        Returns:
+            dict: Rows answered by each tier and their share, and the
+            agreement of the lexicon with the model on the sampled rows.
+        """
+        counts = dict(zip(CASCADE_COUNTS, (rows.value for rows in self.cascade_rows)))
+        tiers = {tier: counts[tier] for tier in ("empty", "lexicon", "model")}
+        total = sum(tiers.values())
+        return {
+            "rows": tiers,
+            "fractions": {
+                tier: round(rows / total, 4) if total else None
+                for tier, rows in tiers.items()
+            },
+            "sampled": counts["sampled"],
+            "agreement": (
+                round(counts["agreed"] / counts["sampled"], 4)
+                if counts["sampled"]
+                else None
+            ),
+        }
+
+    def report_cache(self) -> None:
+        """
+        Prints the sentiment cache counters, once there are some.
+        """
+        hits, misses = self.cache_hits.value, self.cache_misses.value
+        if hits + misses:
+            print(
+                f"Sentiment cache: {hits} hits, {misses} misses "
+                f"({100 * hits / (hits + misses):.1f}% hit rate)"
+            )
+
+    def report_cascade(self) -> None:
+        """
+        Prints the share of rows answered by each tier of the cascade, once
+        there are some.
+        """
+        cascade = self.cascade_summary()
+        if any(cascade["rows"].values()):
+            fractions = ", ".join(
+                f"{tier} {100 * fraction:.1f}%"
+                for tier, fraction in cascade["fractions"].items()
+            )
+            agreement = cascade["agreement"]
+            print(
+                f"Sentiment cascade: {fractions}; lexicon/model agreement "
+                + (
+                    f"{100 * agreement:.1f}% on {cascade['sampled']} rows"
+                    if agreement is not None
+                    else "not sampled yet"
+                )
+            )
+
+    def report(self) -> None:
+        """
+        Prints the sentiment cache and cascade counters.
+        """
+        self.report_cache()
+        self.report_cascade()
+
+
+class BatchListener(StreamingQueryListener):
+    """
+    Records each micro-batch of the streaming queries.
+
+    For every progress event Spark sends to the driver, a record is built
+    with the rows read, the processing rate and the duration Spark reports,
+    the inference time per comment and the cache hit rate of the batch (the
+    accumulators' growth since the previous one), the files waiting in the
+    source and the rows of the deduplication state. It is kept by the
+    `JobMetrics` and appended to a JSON-lines file if given.
+    """
+
+    def __init__(
+        self,
+        metrics: JobMetrics,
+        backlog: Optional[Callable[[], List[int]]] = None,
+        path: Optional[str] = None,
+    ):
+        """
+        Initializes the listener.
+
+        Args:
+            metrics (JobMetrics): The metrics the records are read from and
+                kept in.
+            backlog (Optional[Callable[[], List[int]]]): Lists the size of
+                the files waiting in the source, see `spark.list_source_files`.
+            path (Optional[str]): The JSON-lines file records are appended to.
+        """
+        self.metrics = metrics
+        self.backlog = backlog
+        self.path = path
+        self._counters = metrics.counters()
+
+    def onQueryStarted(self, event) -> None:  # pylint: disable=invalid-name
+        """
+        Nothing to record when a query starts.
+        """
+
+    def onQueryIdle(self, event) -> None:  # pylint: disable=invalid-name
+        """
+        Nothing to record when a query has no new data.
+        """
+
+    def onQueryTerminated(self, event) -> None:  # pylint: disable=invalid-name
+        """
+        Marks the run of the query as ended.
+
+        Args:
+            event (QueryTerminatedEvent): The event.
+        """
+        self.metrics.end_run(str(event.runId))
+
+    def onQueryProgress(self, event) -> None:  # pylint: disable=invalid-name
+        """
+        Records the micro-batch the event reports.
+
+        Args:
+            event (QueryProgressEvent): The event.
+        """
+        try:
+            record = self.build_record(event.progress)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # An exception here would only reach the listener bus logs
+            print(f"Error while recording batch metrics: {str(e)}")
+            return
+        self.metrics.record_batch(record)
+        if self.path:
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(record) + "\n")
+
+    def build_record(self, progress) -> dict:
+        """
+        Builds the record of a micro-batch.
+
+        Args:
+            progress (StreamingQueryProgress): The progress Spark reports.
+
+        Returns:
+            dict: The record.
+        """
+        counters = self.metrics.counters()
+        delta = {name: counters[name] - self._counters[name] for name in counters}
+        self._counters = counters
+        rows = delta["inference_rows"]
+        lookups = delta["cache_hits"] + delta["cache_misses"]
+        file_sizes = self.backlog() if self.backlog is not None else None
+        return {
+            "timestamp": progress.timestamp,
+            "query_id": str(progress.id),
+            "run_id": str(progress.runId),
+            "batch_id": progress.batchId,
+            "input_rows": progress.numInputRows,
+            "input_rows_per_second": progress.inputRowsPerSecond,
+            "processed_rows_per_second": progress.processedRowsPerSecond,
+            "duration_seconds": progress.batchDuration / 1000,
+            "durations_ms": dict(progress.durationMs),
+            "inference_rows": rows,
+            "inference_seconds": round(delta["inference_seconds"], 3),
+            "inference_seconds_per_row": (
+                round(delta["inference_seconds"] / rows, 6) if rows else None
+            ),
+            "cache_hit_rate": (
+                round(delta["cache_hits"] / lookups, 4) if lookups else None
+            ),
+            "cascade_rows": {
+                tier: delta[f"cascade_{tier}"] for tier in ("empty", "lexicon", "model")
+            },
+            "backlog_files": len(file_sizes) if file_sizes is not None else None,
+            "backlog_bytes": sum(file_sizes) if file_sizes is not None else None,
+            "state_rows": sum(
+                operator.numRowsTotal for operator in progress.stateOperators
+            ),
+        }
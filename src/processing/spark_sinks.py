@@ -0,0 +1,234 @@
+"""
+Table sinks file
+
+Where the processing job writes each micro-batch of its tables: BigQuery in
+production, Parquet files or driver memory when it runs locally. The rows of
+a micro-batch are written once, even when it is replayed, see
+`make_table_writer`.
+"""
+
+import os
+import threading
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from pyspark.sql import DataFrame, Row, SparkSession
+from pyspark.sql.functions import col, lit
+from spark_metrics import JobMetrics
+
+# Set by Spark on the thread running a micro-batch; the id is kept in the
+# checkpoint, so it names the query across restarts
+QUERY_ID_PROPERTY = "sql.streaming.queryId"
+
+
+class BigQuerySink:
+    """
+    A sink appending to BigQuery tables with the Storage Write API.
+
+    Each write commits its rows at once, so a table never holds part of a batch.
+    """
+
+    def __init__(self, project_id: str, dataset: str):
+        """
+        Initializes the sink.
+
+        Args:
+            project_id (str): The Google Cloud project.
+            dataset (str): The BigQuery dataset holding the tables.
+        """
+        self.project_id = project_id
+        self.dataset = dataset
+
+    def write(self, table: str, table_df: DataFrame) -> None:
+        """
+        Appends a DataFrame to a table.
+
+        Args:
+            table (str): The table name.
+            table_df (DataFrame): The rows to append.
+        """
+        (
+            table_df.write.format("bigquery")
+            .option("table", f"{self.project_id}.{self.dataset}.{table}")
+            .option("writeMethod", "direct")
+            .mode("append")
+            .save()
+        )
+
+    def has_batch(self, table: str, query_id: str, batch_id: int) -> bool:
+        """
+        Checks whether a table already holds the rows of a micro-batch.
+
+        Args:
+            table (str): The table name.
+            query_id (str): The id of the streaming query.
+            batch_id (int): The micro-batch.
+
+        Returns:
+            bool: Whether rows of the batch were written.
+        """
+        spark = SparkSession.getActiveSession()
+        written = (
+            spark.read.format("bigquery")
+            .option("table", f"{self.project_id}.{self.dataset}.{table}")
+            .option("filter", f"query_id = '{query_id}' AND batch_id = {int(batch_id)}")
+            .load()
+            .select("batch_id")
+            .limit(1)
+            .count()
+        )
+        return written > 0
+
+
+class ParquetSink:
+    """
+    A sink appending to one Parquet directory per table.
+    """
+
+    def __init__(self, directory: str):
+        """
+        Initializes the sink.
+
+        Args:
+            directory (str): The directory holding the tables.
+        """
+        self.directory = directory
+
+    def write(self, table: str, table_df: DataFrame) -> None:
+        """
+        Appends a DataFrame to a table.
+
+        Args:
+            table (str): The table name.
+            table_df (DataFrame): The rows to append.
+        """
+        table_df.write.mode("append").parquet(os.path.join(self.directory, table))
+
+    def has_batch(self, table: str, query_id: str, batch_id: int) -> bool:
+        """
+        Checks whether a table already holds the rows of a micro-batch.
+
+        Args:
+            table (str): The table name.
+            query_id (str): The id of the streaming query.
+            batch_id (int): The micro-batch.
+
+        Returns:
+            bool: Whether rows of the batch were written.
+        """
+        path = os.path.join(self.directory, table)
+        if not os.path.isdir(path):
+            return False
+        spark = SparkSession.getActiveSession()
+        written = (
+            spark.read.parquet(path)
+            .filter((col("query_id") == query_id) & (col("batch_id") == batch_id))
+            .limit(1)
+            .count()
+        )
+        return written > 0
+
+
+class MemorySink:
+    """
+    A sink collecting the rows of every table on the driver.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty sink.
+        """
+        self.tables: Dict[str, List[Row]] = {}
+        self._lock = threading.Lock()
+
+    def write(self, table: str, table_df: DataFrame) -> None:
+        """
+        Collects a DataFrame into a table.
+
+        Args:
+            table (str): The table name.
+            table_df (DataFrame): The rows to collect.
+        """
+        rows = table_df.collect()
+        with self._lock:
+            self.tables.setdefault(table, []).extend(rows)
+
+    def has_batch(self, table: str, query_id: str, batch_id: int) -> bool:
+        """
+        Checks whether a table already holds the rows of a micro-batch.
+
+        Args:
+            table (str): The table name.
+            query_id (str): The id of the streaming query.
+            batch_id (int): The micro-batch.
+
+        Returns:
+            bool: Whether rows of the batch were collected.
+        """
+        with self._lock:
+            return any(
+                row["query_id"] == query_id and row["batch_id"] == batch_id
+                for row in self.tables.get(table, [])
+            )
+
+
+def tag_batch(table_df: DataFrame, query_id: str, batch_id: int) -> DataFrame:
+    """
+    Adds the micro-batch the rows come from to the rows of a table.
+
+    Args:
+        table_df (DataFrame): The rows.
+        query_id (str): The id of the streaming query.
+        batch_id (int): The micro-batch.
+
+    Returns:
+        DataFrame: The rows, with `query_id` and `batch_id` columns.
+    """
+    return table_df.withColumn("query_id", lit(query_id)).withColumn(
+        "batch_id", lit(batch_id)
+    )
+
+
+def make_table_writer(
+    sink, metrics: JobMetrics
+) -> Callable[[DataFrame, int, Sequence[Tuple[str, DataFrame]]], None]:
+    """
+    Builds the function writing the tables of a micro-batch.
+
+    Each row carries the `query_id` and `batch_id` it was written by, and
+    each table is written at once by the sink. When a batch may be a replay,
+    i.e. it is not the one following the last batch this function wrote,
+    the tables already holding its rows are skipped, so a replay does not
+    write them twice.
+
+    Args:
+        sink (BigQuerySink | ParquetSink | MemorySink): Where the tables go.
+        metrics (JobMetrics): Where the time of each write is recorded.
+
+    Returns:
+        Callable[[DataFrame, int, Sequence[Tuple[str, DataFrame]]], None]:
+        The function, taking the batch, its id and the name and rows of each
+        table.
+    """
+    # Last batch written by each query
+    last_batches = {}
+
+    def write_tables(
+        batch_df: DataFrame, batch_id: int, tables: Sequence[Tuple[str, DataFrame]]
+    ) -> None:
+        query_id = (
+            batch_df.sparkSession.sparkContext.getLocalProperty(QUERY_ID_PROPERTY) or ""
+        )
+        replay = last_batches.get(query_id) != batch_id - 1
+        for table, table_df in tables:
+            if replay and sink.has_batch(table, query_id, batch_id):
+                print(f"Batch {batch_id} already in {table}, skipped")
+                continue
+            metrics.run_stage(
+                f"write_{table}",
+                sink.write,
+                table,
+                tag_batch(table_df, query_id, batch_id),
+            )
+        last_batches[query_id] = batch_id
+
+    return write_tables
@@ -0,0 +1,192 @@
+"""
+Sentiment windows file
+
+The sentiment aggregates of the processing job. The batches of the main
+query stage their scored comments as Parquet files; a second streaming query
+reads them, drops the comments it has already counted and keeps the counts
+of each window in its state, then writes each window once it is complete.
+"""
+
+from functools import reduce
+from typing import Callable, List, Sequence, Tuple
+
+from pyspark.sql import DataFrame, SparkSession
+from pyspark.sql.functions import col, count, current_timestamp, lit, window
+from pyspark.sql.functions import sum as sum_
+from pyspark.sql.streaming import StreamingQuery
+from pyspark.sql.types import (
+    FloatType,
+    StringType,
+    StructField,
+    StructType,
+    TimestampType,
+)
+from spark_metrics import JobMetrics
+from spark_sinks import make_table_writer
+
+# Windows of the sentiment aggregates: "duration" for tumbling windows,
+# "duration/slide" for sliding ones
+SENTIMENT_WINDOWS = "1 hour,1 day/1 hour"
+# How late a comment may come, by its date, to be counted in its windows
+SENTIMENT_WATERMARK = "6 hours"
+# The scored comments staged for the sentiment aggregates
+SCORED_COMMENT_SCHEMA = StructType(
+    [
+        StructField("subreddit", StringType(), True),
+        StructField("post_id", StringType(), True),
+        StructField("comment_id", StringType(), True),
+        StructField("comment_date", TimestampType(), True),
+        StructField("sentiment", StringType(), True),
+        StructField("sentiment_score", FloatType(), True),
+    ]
+)
+
+
+def parse_windows(spec: str) -> List[Tuple[str, str]]:
+    """
+    Parses the windows of the sentiment aggregates.
+
+    Args:
+        spec (str): Comma-separated windows, each a duration for a tumbling
+            window or "duration/slide" for a sliding one, e.g.
+            "1 hour,1 day/1 hour".
+
+    Returns:
+        List[Tuple[str, str]]: The duration and slide of each window.
+    """
+    windows = []
+    for item in spec.split(","):
+        if item.strip():
+            duration, _, slide = item.partition("/")
+            windows.append((duration.strip(), slide.strip() or duration.strip()))
+    return windows
+
+
+def aggregate_sentiment(
+    comments_df: DataFrame, windows: Sequence[Tuple[str, str]], watermark_delay: str
+) -> DataFrame:
+    """
+    Aggregates the sentiment of the staged comments per window.
+
+    The comments are timed by their date, and the watermark trails the
+    newest date seen by `watermark_delay`. A comment is counted once, with
+    the label it had when its id was first seen: an edited comment staged
+    again is dropped as a duplicate while the watermark keeps its id, and as
+    late afterwards, like every comment older than the watermark.
+
+    For each window of `windows`, the comments are grouped by the windows
+    their date falls in, then per subreddit and per post (`post_id` is null
+    for the subreddit rows), and per label. In append mode the row of a
+    window is emitted once, when the watermark passes its end, with its
+    final counts: its mean confidence is `confidence_sum / scored_count`.
+
+    Args:
+        comments_df (DataFrame): The streaming scored comments, see
+            `SCORED_COMMENT_SCHEMA`.
+        windows (Sequence[Tuple[str, str]]): See `parse_windows`.
+        watermark_delay (str): How late a comment may come, e.g. "6 hours".
+
+    Returns:
+        DataFrame: The rows of the `comment_sentiment_windows` table.
+    """
+    comments_df = (
+        comments_df.filter(col("comment_date").isNotNull())
+        .withWatermark("comment_date", watermark_delay)
+        .dropDuplicatesWithinWatermark(["comment_id"])
+    )
+    aggregates = []
+    for duration, slide in windows:
+        by_window = window(col("comment_date"), duration, slide)
+        for keys in (("subreddit",), ("subreddit", "post_id")):
+            aggregates.append(
+                comments_df.groupBy(by_window.alias("window"), *keys, "sentiment")
+                .agg(
+                    count(lit(1)).alias("comment_count"),
+                    count("sentiment_score").alias("scored_count"),
+                    sum_("sentiment_score").alias("confidence_sum"),
+                )
+                .select(
+                    col("window.start").alias("window_start"),
+                    col("window.end").alias("window_end"),
+                    lit(duration).alias("window_duration"),
+                    lit(slide).alias("window_slide"),
+                    "subreddit",
+                    (col("post_id") if "post_id" in keys else lit(None))
+                    .cast(StringType())
+                    .alias("post_id"),
+                    "sentiment",
+                    "comment_count",
+                    "scored_count",
+                    "confidence_sum",
+                    current_timestamp().alias("processing_time"),
+                )
+            )
+    return reduce(DataFrame.unionByName, aggregates)
+
+
+def make_window_writer(sink, metrics: JobMetrics) -> Callable[[DataFrame, int], None]:
+    """
+    Builds the `foreachBatch` function writing the sentiment aggregates.
+
+    Args:
+        sink (BigQuerySink | ParquetSink | MemorySink): Where the table goes.
+        metrics (JobMetrics): Where the time of each write is recorded.
+
+    Returns:
+        Callable[[DataFrame, int], None]: The function, writing the windows
+        the batch closed to the `comment_sentiment_windows` table, see
+        `make_table_writer`.
+    """
+    write_tables = make_table_writer(sink, metrics)
+
+    def write_windows(windows_df: DataFrame, batch_id: int) -> None:
+        write_tables(windows_df, batch_id, [("comment_sentiment_windows", windows_df)])
+
+    return write_windows
+
+
+def start_sentiment_query(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    spark: SparkSession,
+    staging_location: str,
+    write_windows: Callable[[DataFrame, int], None],
+    checkpoint_location: str,
+    windows: Sequence[Tuple[str, str]],
+    watermark_delay: str = SENTIMENT_WATERMARK,
+    **trigger,
+) -> StreamingQuery:
+    """
+    Starts the streaming query aggregating the staged comments.
+
+    Its state holds the comment ids and the counts of the windows the
+    watermark has not passed yet, see `aggregate_sentiment`. Staged files
+    are deleted once processed.
+
+    Args:
+        spark (SparkSession): The session.
+        staging_location (str): Where the scored comments are staged, see
+            `make_batch_writer`.
+        write_windows (Callable[[DataFrame, int], None]): See
+            `make_window_writer`.
+        checkpoint_location (str): Where the query keeps its progress and state.
+        windows (Sequence[Tuple[str, str]]): See `parse_windows`.
+        watermark_delay (str): How late a comment may come.
+        **trigger: The trigger, e.g. `processingTime="1 minute"` or
+            `availableNow=True`.
+
+    Returns:
+        StreamingQuery: The running query.
+    """
+    comments_df = (
+        spark.readStream.schema(SCORED_COMMENT_SCHEMA).option("cleanSource", "delete")
+        # A pattern, so the directory does not have to exist yet
+        .parquet(f"{staging_location}/*.parquet")
+    )
+    return (
+        aggregate_sentiment(comments_df, windows, watermark_delay)
+        .writeStream.queryName("comment_sentiment_windows")
+        .foreachBatch(write_windows)
+        .outputMode("append")
+        .option("checkpointLocation", checkpoint_location)
+        .trigger(**trigger)
+        .start()
+    )
@@ -46,25 +46,20 @@ def calculate_activity_score(subreddit: praw.models.Subreddit) -> float:
     - Average frequency of posts between submissions
     """
     try:
-        # Analyze last 10 posts
-        recent_posts = list(subreddit.new(limit=10))
-        if not recent_posts:
+        # Analyze last 10 posts, newest first
+        timestamps = [post.created_utc for post in subreddit.new(limit=10)]
+        if not timestamps:
             return 0.0
 
         # Calculate latest post age in days
-        latest_post_age = (
-            datetime.now().timestamp() - recent_posts[0].created_utc
-        ) / 86400
-
-        # Calculate average post frequency
-        if len(recent_posts) > 1:
-            timestamps = [post.created_utc for post in recent_posts]
-            time_diffs = [
-                timestamps[i] - timestamps[i + 1] for i in range(len(timestamps) - 1)
-            ]
-            avg_time_between_posts = sum(time_diffs) / len(time_diffs) / 86400
-        else:
-            avg_time_between_posts = latest_post_age
+        latest_post_age = (datetime.now().timestamp() - timestamps[0]) / 86400
+
+        # The gaps between consecutive posts add up to the span of the posts
+        avg_time_between_posts = (
+            (timestamps[0] - timestamps[-1]) / (len(timestamps) - 1) / 86400
+            if len(timestamps) > 1
+            else latest_post_age
+        )
 
         # Calculate scores based on recency and frequency
         recency_score = 1.0 / (1 + latest_post_age)